@@ -0,0 +1,74 @@
+"""
+Flood messages from one guild while quiet guilds post now and then, with each
+message's work sharing a limited pool of outbound capacity, once running every
+message as it arrives as on_message used to, and once through the
+DispatchQueue, timing how long the quiet guilds' messages take to finish.
+
+Run from the repository root with `python -m benchmarks.bench_dispatch`.
+"""
+import asyncio
+import time
+
+from runtime.dispatchqueue import DispatchQueue
+
+# Work for one message, and how many can be in flight before the rest wait their turn
+WORK = 0.02
+CAPACITY = 8
+NOISY_MESSAGES = 2000
+QUIET_GUILDS = 20
+QUIET_INTERVAL = 0.1
+DURATION = 2.0
+
+async def run(label, submit, capacity):
+    quiet = []
+    noisy_done = 0
+
+    async def handle(guild_id, posted):
+        nonlocal noisy_done
+        async with capacity:
+            await asyncio.sleep(WORK)
+        if guild_id == 0:
+            noisy_done += 1
+        else:
+            quiet.append(time.perf_counter() - posted)
+
+    for _ in range(NOISY_MESSAGES):
+        submit(0, handle, time.perf_counter())
+    start = time.perf_counter()
+    while time.perf_counter() - start < DURATION:
+        for guild_id in range(1, QUIET_GUILDS + 1):
+            submit(guild_id, handle, time.perf_counter())
+        await asyncio.sleep(QUIET_INTERVAL)
+    await asyncio.sleep(WORK * 4)
+    quiet.sort()
+    if quiet:
+        print(f"{label}: quiet guilds p50 {quiet[len(quiet) // 2] * 1000:.0f} ms, "
+              f"p99 {quiet[len(quiet) * 99 // 100] * 1000:.0f} ms, {len(quiet)} finished; "
+              f"{noisy_done} of the noisy guild's {NOISY_MESSAGES} finished")
+    else:
+        print(f"{label}: no quiet guild messages finished within {DURATION:.0f} s; "
+              f"{noisy_done} of the noisy guild's {NOISY_MESSAGES} finished")
+
+async def main():
+    tasks = []
+
+    def inline(guild_id, handle, posted):
+        tasks.append(asyncio.create_task(handle(guild_id, posted)))
+
+    await run("task per message", inline, asyncio.Semaphore(CAPACITY))
+    for task in tasks:
+        task.cancel()
+
+    dispatch = DispatchQueue(workers=CAPACITY)
+    dispatch.start()
+
+    def queued(guild_id, handle, posted):
+        dispatch.submit(guild_id, None, handle, guild_id, posted)
+
+    await run("dispatch queue", queued, asyncio.Semaphore(CAPACITY))
+    print(f"dispatch queue: {dispatch.dropped} dropped, max depth {dispatch.max_depth}, "
+          f"wait max {dispatch.wait_max * 1000:.0f} ms")
+    dispatch.stop()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,47 @@
+"""
+Record simulated traffic into a UsageHistory over a stretch of days, timing
+each record and tracking how many buckets and server/user entries it holds as
+it rolls minutes into hours and hours into days.
+
+Run from the repository root with `python -m benchmarks.bench_history`.
+"""
+import random
+import time
+
+from linklogging.usagehistory import UsageHistory
+
+DAYS = 120
+FIXES_PER_MINUTE = 60
+SERVERS = 20000
+USERS = 500000
+PLATFORMS = ["twitter", "instagram", "tiktok", "pinterest"]
+
+def size(history):
+    buckets = sum(len(tier) for tier in history.tiers)
+    entries = sum(len(bucket["servers"]) + len(bucket["users"]) for tier in history.tiers for bucket in tier)
+    return buckets, entries
+
+def main():
+    random.seed(0)
+    history = UsageHistory()
+    start = 1700000000
+    recorded = 0
+    elapsed = 0.0
+    for day in range(DAYS):
+        fixes = [(start + day * 86400 + i * 86400 / (FIXES_PER_MINUTE * 1440), random.randrange(SERVERS),
+                  random.randrange(USERS), random.choice(PLATFORMS)) for i in range(FIXES_PER_MINUTE * 1440)]
+        began = time.perf_counter()
+        for now, serverID, userID, linkName in fixes:
+            history.record(serverID, userID, 1, linkName, now)
+        elapsed += time.perf_counter() - began
+        recorded += len(fixes)
+        if day in (0, 6, 29, 89, DAYS - 1):
+            buckets, entries = size(history)
+            print(f"day {day + 1}: {buckets} buckets, {entries} server/user entries")
+    now = start + DAYS * 86400
+    print(f"record: {elapsed / recorded * 1e9:.0f} ns per fix including rollups")
+    print(f"last hour: {history.window(3600, now=now)['total']} fixes, expected {FIXES_PER_MINUTE * 60}")
+    print(f"last 7 days: {history.window(7 * 86400, now=now)['total']} fixes, expected about {FIXES_PER_MINUTE * 1440 * 7}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Resolve bursts of short links against a local server, once with a new
+aiohttp session per link as PinterestLink used to, and once through the
+shared HttpClient, counting the connections the server sees for each.
+
+Run from the repository root with `python -m benchmarks.bench_httpclient`.
+"""
+import asyncio
+import time
+
+import aiohttp
+from aiohttp import web
+
+from linkhandlers.httpclient import HttpClient
+from linkhandlers.pinterestlink import PinterestLink
+
+BURST = 50
+ROUNDS = 5
+
+async def redirect(request):
+    """Stand in for pin.it, sending every short code on to a pin."""
+    code = request.match_info["code"]
+    raise web.HTTPFound(f"/pin/{sum(map(ord, code))}/")
+
+async def pin(request):
+    return web.Response(text="pin")
+
+async def legacy_expand(url):
+    """How PinterestLink.expand made its request before HttpClient."""
+    timeout = aiohttp.ClientTimeout(total=PinterestLink.REQUEST_TIMEOUT)
+    headers = {"User-Agent": PinterestLink.USER_AGENT}
+    async with aiohttp.ClientSession(timeout=timeout, headers=headers) as session:
+        async with session.head(url, allow_redirects=True) as response:
+            return str(response.url)
+
+async def burst(resolve, base, round_number):
+    urls = [f"{base}/{round_number}x{i}" for i in range(BURST)]
+    start = time.perf_counter()
+    results = await asyncio.gather(*(resolve(url) for url in urls))
+    assert all(result is not None for result in results)
+    return time.perf_counter() - start
+
+async def main():
+    peers = set()
+
+    @web.middleware
+    async def count_connections(request, handler):
+        peers.add(request.transport.get_extra_info("peername"))
+        return await handler(request)
+
+    app = web.Application(middlewares=[count_connections])
+    app.router.add_get("/pin/{id}/", pin)
+    app.router.add_get("/{code}", redirect)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    base = f"http://127.0.0.1:{port}"
+
+    handler = PinterestLink()
+    client = HttpClient()
+    try:
+        for label, resolve in (("session per link", legacy_expand),
+                               ("shared HttpClient", lambda url: handler.expand(url, client))):
+            peers.clear()
+            timings = [await burst(resolve, base, n) for n in range(ROUNDS)]
+            print(f"{label}: best {min(timings) * 1000:.1f} ms, worst {max(timings) * 1000:.1f} ms "
+                  f"per burst of {BURST}, {len(peers)} connections over {ROUNDS * BURST} links")
+    finally:
+        await client.close()
+        await runner.cleanup()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,79 @@
+"""
+Get the top 5 servers and users from a log with a million users, once by adding
+up and sorting every total as JsonBackend used to, and once from the totals and
+leaderboards it now keeps, and time the updates that keep them.
+
+Run from the repository root with `python -m benchmarks.bench_leaderboard`.
+"""
+import json
+import os
+import random
+import tempfile
+import time
+
+from linklogging.jsonbackend import JsonBackend
+
+USERS = 1000000
+SERVERS = 50000
+PLATFORMS = ["twitter", "instagram", "tiktok", "pinterest"]
+UPDATES = 200000
+ROUNDS = 5
+
+def legacy_totals(data, kind):
+    """How JsonBackend answered top_servers and top_users before it kept totals."""
+    totals = {}
+    for linkName, section in data.items():
+        if linkName == "ignored":
+            continue
+        for key, count in section[kind].items():
+            totals[key] = totals.get(key, 0) + count
+    return sorted(((int(key), count) for key, count in totals.items()), key=lambda x: x[1], reverse=True)
+
+def best(function):
+    timings = []
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        result = function()
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+def main():
+    random.seed(0)
+    users = [str(random.getrandbits(60)) for _ in range(USERS)]
+    servers = [str(random.getrandbits(60)) for _ in range(SERVERS)]
+    with tempfile.TemporaryDirectory() as directory:
+        data = {linkName: {"users": {}, "servers": {}, "links_fixed": 0} for linkName in PLATFORMS}
+        for userID in users:
+            section = data[random.choice(PLATFORMS)]
+            count = random.randint(1, 50)
+            section["users"][userID] = count
+            server = random.choice(servers)
+            section["servers"][server] = section["servers"].get(server, 0) + count
+            section["links_fixed"] += count
+        backend = JsonBackend(PLATFORMS, os.path.join(directory, "log.json"), os.path.join(directory, "log.journal"))
+        with open(backend.filepath, "w") as f:
+            json.dump(data, f)
+        backend.load()
+        start = time.perf_counter()
+        backend.count_totals()
+        print(f"counting totals on load: {(time.perf_counter() - start) * 1000:.0f} ms")
+
+        legacy, legacy_top = best(lambda: (legacy_totals(data, "servers")[:5], legacy_totals(data, "users")[:5]))
+        current, current_top = best(lambda: (backend.top_servers(5), backend.top_users(5)))
+        assert [count for _, count in legacy_top[1]] == [count for _, count in current_top[1]]
+        print(f"re-aggregate and sort: {legacy * 1000:.1f} ms per /all")
+        print(f"leaderboards: {current * 1e6:.1f} us per /all ({legacy / current:.0f}x)")
+
+        fixes = [(random.choice(servers), random.choice(users), random.choice(PLATFORMS)) for _ in range(UPDATES)]
+        start = time.perf_counter()
+        for serverID, userID, linkName in fixes:
+            backend.add_fixed(serverID, userID, 1, linkName)
+        elapsed = time.perf_counter() - start
+        print(f"add_fixed keeping totals: {elapsed / UPDATES * 1e6:.2f} us per update")
+        for serverID, userID, linkName in fixes:
+            data[linkName]["users"][userID] = data[linkName]["users"].get(userID, 0) + 1
+        assert [count for _, count in legacy_totals(data, "users")[:5]] == [count for _, count in backend.top_users(5)]
+        backend.journal.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Compare the single pass LinkMatcher against the link search LinkFix ran before
+it, with and without the can_match prefilter in front of it.
+
+The baseline is the matching half of on_message as it was: find_fixable_links,
+then re.findall and rebuilding each URL for every handler it returned,
+duplicates included, without the network, logging or prints.
+
+Run from the repository root with `python -m benchmarks.bench_linkmatcher`.
+"""
+import random
+import re
+import time
+
+from linkhandlers.instagramlink import InstagramLink
+from linkhandlers.linkmatcher import LinkMatcher
+from linkhandlers.pinterestlink import PinterestLink
+from linkhandlers.tiktoklink import TiktokLink
+from linkhandlers.twitterlink import TwitterLink
+
+MESSAGES = 20000
+ROUNDS = 15
+
+PLAIN = [
+    "lol yeah",
+    "anyone up for a game tonight?",
+    "that's what I said last week, nobody listened",
+    "check the pins for the schedule",
+    "brb getting food",
+]
+LINKS = [
+    "https://x.com/someone/status/1234567890123456789",
+    "https://twitter.com/someone/status/1234567890123456789/photo/1",
+    "https://www.instagram.com/reel/C1a2b3c4d5/",
+    "https://www.tiktok.com/@someone/video/7234567890123456789/",
+    "https://uk.pinterest.com/pin/123456789012345678/",
+    "https://pin.it/1AbCdEf",
+    "https://fxtwitter.com/someone/status/1234567890123456789",
+    "https://example.com/some/page",
+]
+
+def build_corpus(count, link_ratio=0.1, seed=1):
+    rng = random.Random(seed)
+    corpus = []
+    for _ in range(count):
+        text = rng.choice(PLAIN)
+        if rng.random() < link_ratio:
+            kind = rng.random()
+            if kind < 0.2:
+                # Several links at once, often from the same site
+                text = f"{text} {' '.join(rng.choice(LINKS) for _ in range(rng.randint(2, 4)))}"
+            elif kind < 0.3:
+                text = f"{text} ||{rng.choice(LINKS)}||"
+            elif kind < 0.33:
+                # A link in another's query string, or two pasted without a space, which overlap
+                text = f"{text} {rng.choice(LINKS)}{rng.choice(('?s=', ''))}{rng.choice(LINKS)}"
+            else:
+                text = f"{text} {rng.choice(LINKS)}"
+        corpus.append(text)
+    return corpus
+
+def baseline_find(handlers, content):
+    """The search LinkFix ran before LinkMatcher, as of the baseline commit."""
+    # find_fixable_links
+    found = []
+    for handler in handlers:
+        for link in handler.replace:
+            if link in content:
+                if not any(x in content for x in handler.ignore):
+                    found.append(handler)
+    # The start of fix_message, once per handler found
+    matches = []
+    for handler in found:
+        urls = re.findall(handler.pattern, content)
+        rebuilt = []
+        for url in urls:
+            original_url = ""
+            for i in url:
+                original_url += i
+            rebuilt.append(original_url)
+        matches.append((handler, rebuilt))
+    return matches
+
+def same_links(baseline, found):
+    """Check the baseline and LinkMatcher found the same links, leaving aside the baseline fixing some twice."""
+    return {handler: urls for handler, urls in baseline if urls} == found
+
+def timed(fns, corpus):
+    """Time each function over the corpus, taking turns each round so a noisy machine slows them all alike."""
+    best = [None] * len(fns)
+    for _ in range(ROUNDS):
+        for i, fn in enumerate(fns):
+            start = time.perf_counter()
+            for content in corpus:
+                fn(content)
+            elapsed = time.perf_counter() - start
+            best[i] = elapsed if best[i] is None else min(best[i], elapsed)
+    return [len(corpus) / elapsed for elapsed in best]
+
+def gated_find(matcher, content):
+    """The search LinkFix runs, prefilter first."""
+    if not matcher.can_match(content):
+        return {}
+    return matcher.find(content)
+
+def main():
+    handlers = [TwitterLink(), InstagramLink(), TiktokLink(), PinterestLink()]
+    matcher = LinkMatcher(handlers)
+
+    # A channel with a fair few links, then the plain chat most guilds see
+    for label, link_ratio in (("10% links", 0.1), ("1% links", 0.01)):
+        corpus = build_corpus(MESSAGES, link_ratio)
+        for content in corpus:
+            assert same_links(baseline_find(handlers, content), gated_find(matcher, content)), content
+
+        legacy, single, gated = timed([lambda content: baseline_find(handlers, content), matcher.find,
+                                       lambda content: gated_find(matcher, content)], corpus)
+        print(f"{label}")
+        print(f"  baseline search:         {legacy:,.0f} messages/s")
+        print(f"  LinkMatcher:             {single:,.0f} messages/s ({single / legacy:.2f}x)")
+        print(f"  can_match + LinkMatcher: {gated:,.0f} messages/s ({gated / legacy:.2f}x)")
+    print(f"prefilter rejected {matcher.rejected:,} of {matcher.checked:,} messages")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Load the same log.json as the nested dicts of string IDs LinkLogger used to
+keep, and into JsonBackend's ID tables and count arrays, reporting the memory
+each takes per tracked user and server.
+
+Run from the repository root with `python -m benchmarks.bench_memory`.
+"""
+import gc
+import json
+import os
+import random
+import tempfile
+import tracemalloc
+
+from linklogging.jsonbackend import JsonBackend
+
+USERS = 500000
+SERVERS = 50000
+PLATFORMS = ["twitter", "instagram", "tiktok", "pinterest"]
+# Platforms each user or server has links fixed on, at random up to this many
+MAX_PLATFORMS = 3
+
+def write_log(filepath):
+    random.seed(0)
+    log = {linkName: {"users": {}, "servers": {}, "links_fixed": 0} for linkName in PLATFORMS}
+    for kind, count in (("users", USERS), ("servers", SERVERS)):
+        for _ in range(count):
+            # Snowflakes are 64 bit, with a timestamp in the top 42 bits
+            snowflake = str(random.randrange(1 << 56, 1 << 60))
+            for linkName in random.sample(PLATFORMS, random.randint(1, MAX_PLATFORMS)):
+                log[linkName][kind][snowflake] = random.randint(1, 500)
+    log["ignored"] = {}
+    with open(filepath, "w") as f:
+        json.dump(log, f)
+
+def measure(load):
+    gc.collect()
+    tracemalloc.start()
+    result = load()
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return size, result
+
+def legacy_load(filepath):
+    """How LinkLogger held the log before the ID tables."""
+    with open(filepath, "r") as f:
+        return json.load(f)
+
+def compact_load(filepath, journalpath):
+    backend = JsonBackend(PLATFORMS, filepath, journalpath)
+    backend.load()
+    backend.journal.close()
+    return backend
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        filepath = os.path.join(directory, "log.json")
+        journalpath = os.path.join(directory, "log.journal")
+        write_log(filepath)
+        tracked = USERS + SERVERS
+
+        legacy, data = measure(lambda: legacy_load(filepath))
+        entries = sum(len(data[linkName][kind]) for linkName in PLATFORMS for kind in ("users", "servers"))
+        del data
+        compact, backend = measure(lambda: compact_load(filepath, journalpath))
+        assert len(backend.ids["users"]) == USERS
+
+        print(f"{USERS} users and {SERVERS} servers with {entries} platform entries between them")
+        print(f"dicts of string IDs: {legacy / 2**20:.1f} MiB, {legacy / tracked:.0f} bytes per user/server")
+        print(f"ID tables and count arrays, with totals and leaderboards: {compact / 2**20:.1f} MiB, "
+              f"{compact / tracked:.0f} bytes per user/server ({legacy / compact:.1f}x smaller)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Compact a large JSON stats backend while a ticker measures how late the event
+loop wakes it, once writing the snapshot inline on the loop as the bot used
+to, and once through the BackgroundWriter.
+
+Run from the repository root with `python -m benchmarks.bench_persistence`.
+"""
+import asyncio
+import json
+import os
+import random
+import tempfile
+import time
+
+from linklogging.backgroundwriter import BackgroundWriter, write_json_atomic
+from linklogging.jsonbackend import JsonBackend, to_log
+
+USERS = 200000
+SERVERS = 20000
+PLATFORMS = ["twitter", "instagram", "tiktok", "pinterest"]
+TICK = 0.001
+ROUNDS = 3
+
+def write_log(filepath):
+    """Write a log.json with USERS users and SERVERS servers spread over the platforms."""
+    random.seed(0)
+    log = {"ignored": {}}
+    for linkName in PLATFORMS:
+        users = {str(random.getrandbits(60)): random.randint(1, 50) for _ in range(USERS // len(PLATFORMS))}
+        servers = {str(random.getrandbits(60)): random.randint(1, 500) for _ in range(SERVERS // len(PLATFORMS))}
+        log[linkName] = {"users": users, "servers": servers, "links_fixed": sum(servers.values())}
+    with open(filepath, "w") as f:
+        json.dump(log, f)
+
+async def ticker(lags, done):
+    """Sleep for a tick at a time, recording how much later than asked each wake up was."""
+    while not done.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(TICK)
+        lags.append(time.perf_counter() - start - TICK)
+
+async def measure(compact):
+    lags = []
+    done = asyncio.Event()
+    task = asyncio.create_task(ticker(lags, done))
+    await asyncio.sleep(0.05)
+    start = time.perf_counter()
+    await compact()
+    elapsed = time.perf_counter() - start
+    done.set()
+    await task
+    return elapsed, max(lags)
+
+async def main():
+    with tempfile.TemporaryDirectory() as directory:
+        backend = JsonBackend(PLATFORMS, os.path.join(directory, "log.json"), os.path.join(directory, "log.journal"))
+        write_log(backend.filepath)
+        backend.load()
+        writer = BackgroundWriter()
+
+        async def inline():
+            write_json_atomic(backend.filepath, to_log(backend.copy_data()))
+
+        async def background():
+            backend.journaled = backend.COMPACT_RECORDS
+            with writer.on_loop("stats flush"):
+                job = backend.prepare_flush()
+            await writer.run("stats flush", job)
+
+        try:
+            for label, compact in (("inline on the loop", inline), ("background writer", background)):
+                results = [await measure(compact) for _ in range(ROUNDS)]
+                print(f"{label}: compaction {min(r[0] for r in results) * 1000:.1f} ms, "
+                      f"worst loop stall {max(r[1] for r in results) * 1000:.1f} ms "
+                      f"({USERS} users, {SERVERS} servers)")
+            timing = writer.timing("stats flush")
+            print(f"background writer: {timing['loop_max'] * 1000:.1f} ms on the loop taking the snapshot, "
+                  f"{timing['thread_max'] * 1000:.1f} ms on the writer thread")
+        finally:
+            writer.close()
+            backend.journal.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
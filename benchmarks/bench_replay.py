@@ -0,0 +1,159 @@
+"""
+Replay a synthetic corpus through the real LinkFix cog using fake Discord
+objects. Reports throughput, p50/p99 latency for each stage, and memory
+allocated per message, so hot path regressions show up before a deploy.
+
+The stages are:
+- on_message: the prefilter and queueing.
+- queue wait.
+- find, resolve and fix: fix is timed per handler.
+- log.
+- handle: the whole of handle_message.
+- end to end: from a message arriving until the bot replies.
+
+The action scheduler's rate limits are switched off and short links come
+from the handler's cache, so only the bot's own work is timed. A second,
+smaller replay runs under tracemalloc to count allocations.
+
+Run from the repository root with `python -m benchmarks.bench_replay`.
+"""
+import asyncio
+import gc
+import os
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks.corpus import generate
+from benchmarks.fakediscord import FakeBot, FakeMessage, FakeReference
+from cogs.linkfix import LinkFix
+
+MESSAGES = 20000
+ALLOCATION_MESSAGES = 5000
+# Messages fed before waiting for the queues to empty, which keeps them under their limits
+CHUNK = 200
+STAGES = ["on_message", "queue wait", "find", "resolve", "fix", "log", "handle", "end to end"]
+
+def timed(samples, name, function):
+    async def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await function(*args, **kwargs)
+        finally:
+            samples[name].append(time.perf_counter() - start)
+    return wrapper
+
+def timed_sync(samples, name, function):
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            samples[name].append(time.perf_counter() - start)
+    return wrapper
+
+async def drain(cog):
+    dispatch = cog.dispatch
+    while (dispatch.processed + dispatch.dropped + dispatch.merged < dispatch.submitted
+           or not cog.actions.queue.empty()):
+        await asyncio.sleep(0)
+
+async def replay(corpus, expansions):
+    """
+    Replay a corpus through a new LinkFix cog.
+
+    Returns
+    -------
+    Tuple[dict, float, int]
+        Stage -> latencies in seconds, how long the replay took, and how many messages were fixed.
+    """
+    samples = {stage: [] for stage in STAGES}
+    bot = FakeBot(asyncio.get_running_loop())
+    cog = LinkFix(bot)
+    # Let the log load that LinkFix starts on creation finish
+    await asyncio.gather(*(task for task in asyncio.all_tasks() if task is not asyncio.current_task()))
+    await cog.cog_load()
+    cog.actions.take_token = lambda route, bucket: 0
+    for handler in cog.linkHandlers:
+        if handler.cache is not None:
+            for url, expanded in expansions.items():
+                handler.cache.put(url, expanded)
+
+    pipeline = cog.pipeline
+    pipeline.matcher.find = timed_sync(samples, "find", pipeline.matcher.find)
+    pipeline.resolve_links = timed(samples, "resolve", pipeline.resolve_links)
+    pipeline.fix_links = timed(samples, "fix", pipeline.fix_links)
+    cog.log.update = timed(samples, "log", cog.log.update)
+    handle = timed(samples, "handle", cog.handle_message)
+
+    async def handle_message(message, has_links):
+        samples["queue wait"].append(time.perf_counter() - message.arrived)
+        await handle(message, has_links)
+    cog.handle_message = handle_message
+    on_message = timed(samples, "on_message", cog.on_message)
+
+    messages = {}
+    start = time.perf_counter()
+    for i, spec in enumerate(corpus):
+        reference = None
+        target = messages.get(spec.reply_to)
+        if target is not None and target.fix is not None:
+            reference = FakeReference(target.fix)
+        message = FakeMessage(spec.id, spec.content, bot.user_of(spec.author_id), bot.guild_of(spec.guild_id),
+                              bot.channel_of(spec.channel_id), reference)
+        messages[spec.id] = message
+        message.arrived = time.perf_counter()
+        await on_message(message)
+        if (i + 1) % CHUNK == 0:
+            await drain(cog)
+    await drain(cog)
+    elapsed = time.perf_counter() - start
+
+    fixed = 0
+    for message in messages.values():
+        if message.replied is not None:
+            fixed += 1
+            samples["end to end"].append(message.replied - message.arrived)
+    await cog.cog_unload()
+    bot.writer.close()
+    await bot.http_client.close()
+    return samples, elapsed, fixed
+
+def percentile(values, fraction):
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+async def main():
+    corpus, expansions = generate(MESSAGES)
+    # Stats and caches are written relative to the working directory, keep them out of the repository
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        try:
+            os.mkdir("linklogging")
+            samples, elapsed, fixed = await replay(corpus, expansions)
+            print(f"{MESSAGES} messages in {elapsed:.2f} s, {MESSAGES / elapsed:.0f} messages/s, {fixed} fixed")
+            print(f"{'stage':<12} {'count':>7} {'p50 us':>9} {'p99 us':>9}")
+            for stage in STAGES:
+                values = sorted(samples[stage])
+                if values:
+                    print(f"{stage:<12} {len(values):>7} {percentile(values, 0.5) * 1e6:>9.1f} "
+                          f"{percentile(values, 0.99) * 1e6:>9.1f}")
+
+            corpus, expansions = generate(ALLOCATION_MESSAGES, seed=2)
+            gc.collect()
+            collections = sum(stats["collections"] for stats in gc.get_stats())
+            tracemalloc.start()
+            await replay(corpus, expansions)
+            gc.collect()
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            collections = sum(stats["collections"] for stats in gc.get_stats()) - collections
+            print(f"allocations: peak {peak / ALLOCATION_MESSAGES:.0f} bytes/message, "
+                  f"{current / ALLOCATION_MESSAGES:.0f} bytes/message retained, "
+                  f"{collections} garbage collections over {ALLOCATION_MESSAGES} messages")
+        finally:
+            # Otherwise a failed replay leaves the process in the deleted directory
+            os.chdir(cwd)
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,87 @@
+"""
+Flood LinkLogger with updates from many concurrent messages while the status
+timer reads the total and flushes, once taking the lock for every update as
+LinkLogger used to, and once through the accumulator, counting lock
+acquisitions and timing each update.
+
+Run from the repository root with `python -m benchmarks.bench_update`.
+"""
+import asyncio
+import os
+import random
+import tempfile
+import time
+
+from linklogging.backgroundwriter import BackgroundWriter
+from linklogging.linklogger import LinkLogger
+
+MESSAGES = 2000
+LINKS_PER_MESSAGE = 3
+FLUSH_EVERY = 0.05
+PLATFORMS = ["twitter", "instagram", "tiktok", "pinterest"]
+
+class CountingLock(asyncio.Lock):
+    def __init__(self):
+        super().__init__()
+        self.acquisitions = 0
+
+    async def acquire(self):
+        self.acquisitions += 1
+        return await super().acquire()
+
+async def legacy_update(log, serverID, userID, entryNum, linkName):
+    """How LinkLogger.update recorded a fix before the accumulator."""
+    async with log.lock:
+        log.backend.add_fixed(serverID, userID, entryNum, linkName)
+
+async def flood(log, update):
+    latencies = []
+    done = asyncio.Event()
+
+    async def message(serverID, userID):
+        for linkName in random.sample(PLATFORMS, LINKS_PER_MESSAGE):
+            start = time.perf_counter()
+            await update(log, serverID, userID, 1, linkName)
+            latencies.append(time.perf_counter() - start)
+            await asyncio.sleep(0)
+
+    async def timer():
+        while not done.is_set():
+            await asyncio.sleep(FLUSH_EVERY)
+            await log.get_total_fixed()
+            await log.dump()
+
+    timer_task = asyncio.create_task(timer())
+    start = time.perf_counter()
+    await asyncio.gather(*(message(random.randrange(500), random.randrange(20000)) for _ in range(MESSAGES)))
+    elapsed = time.perf_counter() - start
+    done.set()
+    await timer_task
+    total = await log.get_total_fixed()
+    assert total == MESSAGES * LINKS_PER_MESSAGE
+    latencies.sort()
+    return elapsed, latencies
+
+async def main():
+    writer = BackgroundWriter()
+    try:
+        for label, update in (("lock per update", legacy_update),
+                              ("accumulator", lambda log, *args: log.update(*args))):
+            random.seed(0)
+            with tempfile.TemporaryDirectory() as directory:
+                os.chdir(directory)
+                os.mkdir("linklogging")
+                log = LinkLogger(writer)
+                log.lock = CountingLock()
+                await log.load()
+                elapsed, latencies = await flood(log, update)
+                await log.close()
+                updates = len(latencies)
+                print(f"{label}: {log.lock.acquisitions} lock acquisitions for {updates} updates, "
+                      f"p50 {latencies[updates // 2] * 1e6:.1f} us, p99 {latencies[updates * 99 // 100] * 1e6:.1f} us, "
+                      f"flood took {elapsed * 1000:.0f} ms")
+    finally:
+        writer.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,124 @@
+"""
+Generate a synthetic corpus of chat messages for replaying through LinkFix,
+with a configurable mix of plain chat, each platform's links, spoilers,
+replies to earlier fixes and messages with several links.
+
+Run from the repository root with
+`python -m benchmarks.corpus recording.jsonl [--messages N]` to write a
+recording that `python -m runtime.fakegateway` can replay.
+"""
+import argparse
+import json
+import random
+from typing import NamedTuple, Optional
+
+PLAIN = [
+    "lol yeah",
+    "anyone up for a game tonight?",
+    "that's what I said last week, nobody listened",
+    "check the pins for the schedule",
+    "brb getting food",
+    "https://example.com/some/page has the patch notes",
+]
+# Platform -> link templates, {n} filled with a random number
+LINKS = {
+    "twitter": ["https://x.com/someone/status/{n}", "https://twitter.com/someone/status/{n}/photo/1"],
+    "instagram": ["https://www.instagram.com/reel/C{n}/", "https://www.instagram.com/p/B{n}/"],
+    "tiktok": ["https://www.tiktok.com/@someone/video/{n}/", "https://vt.tiktok.com/ZS{n}/"],
+    "pinterest": ["https://uk.pinterest.com/pin/{n}/"],
+    # Resolved over the network, so replays seed the handler's cache with these
+    "pinterest_short": ["https://pin.it/{n}"],
+}
+# Relative weight of each kind of message, and chances of the modifiers applied on top
+MIX = {
+    "plain": 85,
+    "twitter": 6,
+    "instagram": 4,
+    "tiktok": 2,
+    "pinterest": 2,
+    "pinterest_short": 1,
+}
+SPOILER = 0.1
+MULTI_LINK = 0.15
+REPLY = 0.05
+
+class Message(NamedTuple):
+    id: int
+    channel_id: int
+    guild_id: int
+    author_id: int
+    content: str
+    # ID of an earlier fix this message replies to, if any
+    reply_to: Optional[int]
+
+def generate(count, mix=MIX, spoiler=SPOILER, multi_link=MULTI_LINK, reply=REPLY, guilds=50, channels=4, users=500, seed=1):
+    """
+    Generate a corpus of messages.
+
+    Parameters
+    ----------
+    count : int
+        How many messages to generate.
+
+    mix : dict
+        Kind of message -> relative weight, kinds being "plain" or a key of LINKS.
+
+    spoiler, multi_link, reply : float
+        Chances of a link being spoilered, of a message with a link having a
+        second one, and of a message replying to an earlier fix.
+
+    guilds, channels, users : int
+        Guilds, channels per guild and users the messages are spread over.
+
+    seed : int
+        Seed for the random choices, so runs can be compared.
+
+    Returns
+    -------
+    Tuple[List[Message], Dict[str, str]]
+        The messages, and short link -> the link it expands to for every short link in them.
+    """
+    rng = random.Random(seed)
+    kinds = list(mix)
+    weights = [mix[kind] for kind in kinds]
+    expansions = {}
+    fixes = []
+    messages = []
+
+    def link(kind):
+        url = rng.choice(LINKS[kind]).format(n=rng.randrange(10 ** 9, 10 ** 10))
+        if kind == "pinterest_short":
+            expansions[url] = f"https://www.pinterestez.com/pin/{rng.randrange(10 ** 15, 10 ** 16)}/"
+        return f"||{url}||" if rng.random() < spoiler else url
+
+    for i in range(count):
+        guild_id = rng.randrange(guilds) + 1
+        channel_id = guild_id * 1000 + rng.randrange(channels)
+        author_id = rng.randrange(users) + 1
+        kind = rng.choices(kinds, weights)[0]
+        content = rng.choice(PLAIN)
+        reply_to = None
+        if kind != "plain":
+            content = f"{content} {link(kind)}"
+            if rng.random() < multi_link:
+                content = f"{content} {link(rng.choice(list(LINKS)))}"
+            fixes.append(i + 1)
+        if fixes and rng.random() < reply:
+            reply_to = rng.choice(fixes)
+        messages.append(Message(i + 1, channel_id, guild_id, author_id, content, reply_to))
+    return messages, expansions
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a synthetic recording of messages.")
+    parser.add_argument("recording", help="JSON lines file to write")
+    parser.add_argument("--messages", type=int, default=10000)
+    args = parser.parse_args()
+    messages, _ = generate(args.messages)
+    with open(args.recording, "w") as f:
+        for message in messages:
+            f.write(json.dumps({"id": message.id, "channel_id": message.channel_id, "guild_id": message.guild_id,
+                                "author_id": message.author_id, "content": message.content}) + "\n")
+    print(f"Wrote {len(messages)} messages to {args.recording}.")
+
+if __name__ == "__main__":
+    main()
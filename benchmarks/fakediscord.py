@@ -0,0 +1,136 @@
+"""
+Just enough of discord.py's messages, channels, guilds, users and bot to
+drive LinkFix without a connection. Replies, edits, reactions and DMs
+complete at once and are only counted, so replays measure the bot's own work.
+"""
+import itertools
+import os
+import time
+
+from linkhandlers.httpclient import HttpClient
+from linklogging.backgroundwriter import BackgroundWriter
+from runtime.metrics import Metrics
+
+# Bot reply IDs start well clear of the corpus's message IDs
+reply_ids = itertools.count(10 ** 12)
+
+class FakePermissions:
+    manage_messages = True
+
+class FakeUser:
+    def __init__(self, user_id, bot=False):
+        self.id = user_id
+        self.bot = bot
+        self.name = f"user{user_id}"
+        self.display_name = self.name
+        self.dms = 0
+
+    async def send(self, content):
+        self.dms += 1
+
+class FakeGuild:
+    def __init__(self, guild_id, me):
+        self.id = guild_id
+        self.name = f"guild{guild_id}"
+        self.me = me
+        self.shard_id = 0
+
+class FakeChannel:
+    def __init__(self, channel_id):
+        self.id = channel_id
+
+    def permissions_for(self, member):
+        return FakePermissions
+
+class FakeReference:
+    def __init__(self, message):
+        self.message_id = message.id
+        self.resolved = message
+        self.cached_message = message
+
+class FakeMessage:
+    """
+    A message, which records when it arrived and when the bot replied to it.
+    """
+
+    def __init__(self, message_id, content, author, guild, channel, reference=None):
+        self.id = message_id
+        self.content = content
+        self.author = author
+        self.guild = guild
+        self.channel = channel
+        self.reference = reference
+        # Present from the start, so suppression doesn't wait for an edit event
+        self.embeds = [None]
+        self.arrived = None
+        self.replied = None
+        self.fix = None
+
+    async def reply(self, content, **kwargs):
+        self.replied = time.perf_counter()
+        self.fix = FakeMessage(next(reply_ids), content, self.guild.me, self.guild, self.channel, FakeReference(self))
+        return self.fix
+
+    async def edit(self, **kwargs):
+        pass
+
+    async def add_reaction(self, emoji):
+        pass
+
+    async def delete(self):
+        pass
+
+class FakeBot:
+    """
+    The attributes and lookups of Core that LinkFix uses, with nothing persisted.
+    """
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.log_timer = 60
+        self.status_count = False
+        self.persist_cache = False
+        self.log_backend = "json"
+        self.state_dir = "linklogging"
+        self.log_database = "linklogging/log.db"
+        self.dispatch_workers = 8
+        self.dispatch_guild_limit = 20
+        self.dispatch_policy = "drop_oldest"
+        self.worker_processes = 0
+        self.shard_ids = None
+        self.log_levels = {"": "WARNING"}
+        self.log_sampling = {}
+        self.http_client = HttpClient()
+        self.writer = BackgroundWriter()
+        self.metrics = Metrics()
+        self.user = FakeUser(1, bot=True)
+        self.users = {}
+        self.guilds = {}
+        self.channels = {}
+
+    def state_path(self, path):
+        return os.path.join(self.state_dir, path)
+
+    def get_user(self, user_id):
+        return self.users.get(user_id)
+
+    async def fetch_user(self, user_id):
+        return self.user_of(user_id)
+
+    def get_guild(self, guild_id):
+        return self.guilds.get(guild_id)
+
+    def user_of(self, user_id):
+        if user_id not in self.users:
+            self.users[user_id] = FakeUser(user_id)
+        return self.users[user_id]
+
+    def guild_of(self, guild_id):
+        if guild_id not in self.guilds:
+            self.guilds[guild_id] = FakeGuild(guild_id, self.user)
+        return self.guilds[guild_id]
+
+    def channel_of(self, channel_id):
+        if channel_id not in self.channels:
+            self.channels[channel_id] = FakeChannel(channel_id)
+        return self.channels[channel_id]
@@ -1,9 +1,18 @@
 from discord.ext import commands
 import os
+import time
+
+from runtime.metrics import Histogram, format_labels
+from runtime.profiler import MAX_SECONDS, LoopProfiler, write_collapsed
 
 class Admin(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
+        # Idle until the profile command, so costs nothing otherwise
+        self.profiler = LoopProfiler()
+
+    async def cog_unload(self):
+        self.profiler.stop()
 
     @commands.is_owner()
     @commands.command(name="load", description="Load a cog.")
@@ -121,5 +130,125 @@ class Admin(commands.Cog):
         await self.bot.set_status_count(self.bot.status_count)
         await ctx.send(f"{'Enabled' if self.bot.status_count else 'Disabled'}.", ephemeral=True)
 
+    @commands.is_owner()
+    @commands.command(name="persistence", description="Show time spent persisting stats, caches and config.")
+    async def persistence(self, ctx):
+        """
+        Show how long each kind of write blocked the event loop, and how long it spent on the writer thread.
+        Before the writer thread, the loop was blocked for both.
+        """
+        timings = self.bot.writer.timings
+        if not timings:
+            await ctx.send("Nothing written yet.")
+            return
+        lines = []
+        for name, timing in sorted(timings.items()):
+            jobs = max(timing["jobs"], 1)
+            lines.append(f"**{name}**: {timing['jobs']} jobs, "
+                         f"loop avg {timing['loop'] / jobs * 1000:.2f}ms max {timing['loop_max'] * 1000:.2f}ms, "
+                         f"writer avg {timing['thread'] / jobs * 1000:.2f}ms max {timing['thread_max'] * 1000:.2f}ms")
+        await ctx.send("\n".join(lines))
+
+    @commands.is_owner()
+    @commands.command(name="metrics", description="Show the bot's metrics, optionally only those matching a filter.")
+    async def metrics(self, ctx, name_filter: str = ""):
+        """
+        Show every metric, summarising histograms as a count, average and bucketed p50/p99.
+
+        Parameters
+        ----------
+        name_filter: str
+            Only show metrics whose name contains this, eg. `rest` or `cache`.
+        """
+        lines = []
+        for name, metric in self.bot.metrics.metrics.items():
+            if name_filter not in name:
+                continue
+            if isinstance(metric, Histogram):
+                for label_values, (counts, total) in metric.series.items():
+                    count = sum(counts)
+                    lines.append(f"{name}{format_labels(metric.labels, label_values)}: {count} observed, "
+                                 f"avg {total[0] / count * 1000:.2f}ms, "
+                                 f"p50 <= {metric.quantile(label_values, 0.5) * 1000:g}ms, "
+                                 f"p99 <= {metric.quantile(label_values, 0.99) * 1000:g}ms")
+            else:
+                lines += [f"{sample}{labels}: {value}" for sample, labels, value in metric.samples()]
+        if not lines:
+            await ctx.send("No metrics match.")
+            return
+        # Discord caps messages at 2000 characters
+        message = ""
+        for line in lines:
+            if len(message) + len(line) > 1900:
+                await ctx.send(message)
+                message = ""
+            message += line + "\n"
+        await ctx.send(message)
+
+    @commands.Cog.listener()
+    async def on_message(self, message):
+        # Messages are most of the events the bot handles, so stand in for each shard's event rate
+        self.bot.shard_metrics.event(message.guild.shard_id if message.guild else 0)
+
+    @commands.is_owner()
+    @commands.command(name="shards", description="Show latency and event rates for this process's shards.")
+    async def shards(self, ctx):
+        """
+        Show the latency, recent message rate, servers and reconnects of each shard run by this process.
+        """
+        metrics = self.bot.shard_metrics
+        guilds = {}
+        for guild in self.bot.guilds:
+            guilds[guild.shard_id] = guilds.get(guild.shard_id, 0) + 1
+        lines = [f"Running {len(self.bot.shards)} of {self.bot.shard_count} shards"]
+        for shard_id, latency in sorted(self.bot.latencies):
+            lines.append(f"**{shard_id}**: {latency * 1000:.0f}ms latency, {metrics.rate(shard_id) * 60:.0f} messages/min, "
+                         f"{metrics.totals.get(shard_id, 0)} messages, {guilds.get(shard_id, 0)} servers, "
+                         f"{metrics.connects.get(shard_id, 0)} connects, {metrics.disconnects.get(shard_id, 0)} disconnects, "
+                         f"{metrics.resumes.get(shard_id, 0)} resumes")
+        await ctx.send("\n".join(lines))
+
+    @commands.is_owner()
+    @commands.command(name="profile", description="Profile the event loop for a while and summarise where it went.")
+    async def profile(self, ctx, seconds: int = 30):
+        """
+        Sample the event loop's stack and watch for stalls, then write a collapsed stack file and summarise it.
+
+        Parameters
+        ----------
+        seconds: int
+            How long to profile for, up to 300 seconds. `stopprofile` ends it early.
+        """
+        if self.profiler.running:
+            await ctx.send("A profile is already running, use stopprofile to end it.")
+            return
+        seconds = min(max(seconds, 1), MAX_SECONDS)
+        self.profiler.start(seconds)
+        await ctx.send(f"Profiling for {seconds}s.")
+        profile = await self.profiler.wait()
+        filepath = self.bot.state_path(f"profiles/profile-{time.strftime('%Y%m%d-%H%M%S', time.gmtime(profile.started))}.txt")
+        await self.bot.writer.run("profile", write_collapsed, filepath, profile)
+
+        lines = [f"Profiled {profile.seconds:.1f}s, {profile.samples} samples, loop busy {profile.busy:.1%}. "
+                 f"Collapsed stacks written to `{filepath}`.",
+                 "**Slowest coroutines**"]
+        lines += [f"{spent * 1000:.0f}ms {label}" for label, spent in profile.slowest_coroutines()] or ["None seen."]
+        lines.append("**Longest stalls**")
+        lines += [f"{stall * 1000:.0f}ms in {label}" for stall, label in profile.stalls[:5]] or ["None."]
+        # Discord caps messages at 2000 characters
+        await ctx.send("\n".join(lines)[:2000])
+
+    @commands.is_owner()
+    @commands.command(name="stopprofile", description="End a running profile early.")
+    async def stopprofile(self, ctx):
+        """
+        End the running profile, which then writes and summarises what it saw so far.
+        """
+        if not self.profiler.running:
+            await ctx.send("No profile is running.")
+            return
+        self.profiler.stop()
+        await ctx.send("Stopping the profile.")
+
 async def setup(bot):
     await bot.add_cog(Admin(bot))
\ No newline at end of file
@@ -1,91 +1,313 @@
 import asyncio
+import re
+import time
 
 import discord
 from discord.ext import commands
-import re
-from linkhandlers.linkinterface import LinkInterface
+from linkhandlers.linkpipeline import LinkPipeline
+from linkhandlers.resolutioncache import restore_caches, snapshot_caches
 from linkhandlers.tiktoklink import TiktokLink
 from linkhandlers.twitterlink import TwitterLink
 from linkhandlers.instagramlink import InstagramLink
 from linkhandlers.pinterestlink import PinterestLink
+from linklogging.backgroundwriter import read_json, write_json_atomic
 from linklogging.linklogger import LinkLogger
+from linklogging.userdirectory import UserDirectory
+from runtime.actionscheduler import ROUTES, ActionScheduler
+from runtime.dispatchqueue import DispatchQueue
+from runtime.embedsuppressor import EmbedSuppressor
+from runtime.replyindex import ReplyIndex
+from runtime.workerpool import WorkerPool, record_of
 
 # Small-text invite line appended beneath the fixed links in every reply
 INVITE_FOOTER = "-# [Invite Antedium to your server](https://antedium.glky.net)"
+# Where link handlers' resolution caches are kept between restarts, if enabled in config
+RESOLUTION_CACHE_FILE = "cache.json"
+# Where names of users shown in stats are kept between restarts, if enabled in config
+USER_CACHE_FILE = "users.json"
+# Where the original posters of fixed messages are kept between restarts, if enabled in config
+REPLY_INDEX_FILE = "replies.json"
+# Metrics read from the cog when exported, unregistered when it unloads
+COLLECTED_METRICS = ["dispatch_depth", "dispatch_messages_total", "action_queue_depth", "rest_events_total",
+                     "cache_lookups_total", "cache_entries", "suppressions_total", "worker_waiting"]
+# Window lengths for the usage command, eg. 30m, 6h, 7d
+WINDOW_PATTERN = re.compile(r"(\d+)([mhd])")
+WINDOW_UNITS = {"m": 60, "h": 3600, "d": 86400}
 
 class LinkFix(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
         self.status = True
-        self.log = LinkLogger()
-        self.user_cache = {}  # New user cache dictionary
+        self.log = LinkLogger(self.bot.writer, self.bot.log_backend, self.bot.log_database,
+                              self.bot.state_path("history.json"), self.bot.state_dir, self.bot.shard_ids is not None)
+        self.users = UserDirectory(self.bot)
+        self.timer = None
         self.bot.loop.create_task(self.init_log())
         self.linkHandlers = [TwitterLink(), InstagramLink(), TiktokLink(), PinterestLink()]
+        metrics = self.bot.metrics
+        self.prefilter_seconds = metrics.histogram("prefilter_seconds", "Time taken turning away messages without links.")
+        self.messages = metrics.counter("messages_total", "Messages seen, by whether they were queued.", ("outcome",))
+        self.stats_seconds = metrics.histogram("stats_update_seconds", "Time taken adding a message's fixes to the stats.")
+        self.pipeline = LinkPipeline(self.linkHandlers, self.bot.http_client, metrics)
+        self.matcher = self.pipeline.matcher
+        # Links are fixed in worker processes if configured, otherwise on this loop
+        self.workers = (WorkerPool(self.bot.worker_processes, self.bot.log_levels, self.bot.log_sampling, metrics)
+                        if self.bot.worker_processes else None)
+        self.dispatch = DispatchQueue(self.bot.dispatch_workers, self.bot.dispatch_guild_limit, self.bot.dispatch_policy,
+                                      on_drop=self.dropped)
+        # A call for every dispatch worker awaiting its reply, and some to spare for the suppressions and reactions
+        # made in the background, so replies never wait on a free worker while their rate limits allow them
+        self.actions = ActionScheduler(self.bot.dispatch_workers + 4, metrics)
+        self.suppressor = EmbedSuppressor(self.actions)
+        self.replies = ReplyIndex(self.actions)
+
+    async def cog_load(self):
+        self.actions.start()
+        self.dispatch.start()
+        if self.workers is not None:
+            self.workers.start()
+        self.collect_metrics()
+
+    async def cog_unload(self):
+        # Stop the timer dumping this instance's log, then leave a complete snapshot behind
+        if self.timer is not None:
+            self.timer.cancel()
+        for name in COLLECTED_METRICS:
+            self.bot.metrics.remove(name)
+        self.dispatch.stop()
+        self.suppressor.stop()
+        self.actions.stop()
+        if self.workers is not None:
+            await self.workers.stop()
+        await self.log.close()
+        await self.dump_caches()
 
     async def init_log(self):
         await self.log.load()
-        await self.cache_users()
+        if self.bot.persist_cache:
+            contents = await self.bot.writer.run("cache load", read_json, self.bot.state_path(RESOLUTION_CACHE_FILE),
+                                               "cache_unreadable")
+            if contents is not None:
+                restore_caches(contents, self.linkHandlers)
+            users = await self.bot.writer.run("cache load", read_json, self.bot.state_path(USER_CACHE_FILE),
+                                            "cache_unreadable")
+            if users is not None:
+                self.users.cache.from_json(users)
+            replies = await self.bot.writer.run("cache load", read_json, self.bot.state_path(REPLY_INDEX_FILE),
+                                              "cache_unreadable")
+            if replies is not None:
+                self.replies.cache.from_json(replies)
+
+    async def dump_caches(self):
+        """Write the link handlers' resolution caches, the user directory and the reply index out, if enabled and any have changed."""
+        if not self.bot.persist_cache:
+            return
+        with self.bot.writer.on_loop("cache dump"):
+            snapshot = snapshot_caches(self.linkHandlers)
+            users = self.users.cache.to_json() if self.users.cache.dirty else None
+            self.users.cache.dirty = False
+            replies = self.replies.cache.to_json() if self.replies.cache.dirty else None
+            self.replies.cache.dirty = False
+        if snapshot is not None:
+            await self.bot.writer.run("cache dump", write_json_atomic, self.bot.state_path(RESOLUTION_CACHE_FILE), snapshot)
+        if users is not None:
+            await self.bot.writer.run("cache dump", write_json_atomic, self.bot.state_path(USER_CACHE_FILE), users)
+        if replies is not None:
+            await self.bot.writer.run("cache dump", write_json_atomic, self.bot.state_path(REPLY_INDEX_FILE), replies)
+
+    def collect_metrics(self):
+        """Register the metrics read from the cog's queues, caches and scheduler when they are exported."""
+        metrics = self.bot.metrics
+        dispatch = self.dispatch
+        metrics.collect("dispatch_depth", "Messages waiting in the dispatch queues.", "gauge", (),
+                        lambda: [((), dispatch.depth)])
+        metrics.collect("dispatch_messages_total", "Messages through the dispatch queues, by outcome.", "counter",
+                        ("outcome",), lambda: [(("processed",), dispatch.processed), (("dropped",), dispatch.dropped),
+                                               (("merged",), dispatch.merged), (("failed",), dispatch.failed)])
+        metrics.collect("action_queue_depth", "REST calls waiting in the action scheduler.", "gauge", (),
+                        lambda: [((), self.actions.queue.qsize())])
+        metrics.collect("rest_events_total", "REST calls held back locally, collapsed, rate limited or failed.",
+                        "counter", ("route", "event"), self.rest_events)
+        metrics.collect("cache_lookups_total", "Cache lookups, by cache and whether they hit.", "counter",
+                        ("cache", "result"), self.cache_lookups)
+        metrics.collect("cache_entries", "Entries in each cache.", "gauge", ("cache",),
+                        lambda: (((name,), len(cache)) for name, cache in self.caches()))
+        metrics.collect("suppressions_total", "Embed suppressions, by what set them off.", "counter", ("trigger",),
+                        lambda: [(("immediate",), self.suppressor.immediate), (("event",), self.suppressor.on_event),
+                                 (("timeout",), self.suppressor.timed_out), (("failed",), self.suppressor.failed)])
+        if self.workers is not None:
+            metrics.collect("worker_waiting", "Messages sent to worker processes and not yet answered.", "gauge", (),
+                            lambda: [((), len(self.workers.waiting))])
+
+    def rest_events(self):
+        for route, stats in self.actions.stats.items():
+            yield (route, "throttled"), stats.throttled
+            yield (route, "collapsed"), stats.collapsed
+            yield (route, "rate_limited"), stats.rate_limited
+            yield (route, "failed"), stats.failed
+
+    def cache_lookups(self):
+        for name, cache in self.caches():
+            yield (name, "hit"), cache.hits
+            yield (name, "miss"), cache.misses
+
+    def caches(self):
+        for handler in self.linkHandlers:
+            if handler.cache is not None:
+                yield handler.name, handler.cache
+        yield "users", self.users.cache
+        yield "replies", self.replies.cache
 
     @commands.Cog.listener()
     async def on_message(self, message):
-        """Handle messages to check for fixable links."""
+        """Queue messages that may have fixable links or be intuitive replies."""
         # Ignore if function turned off or message author is a bot
         if message.author.bot or not self.status:
             return
 
-        # Intuitive replies
-        intuitive_reply = await self.is_intuitive_reply(message)
-        if not intuitive_reply:
-            pass
-        else:
-            await intuitive_reply.send(
-                f"{message.author.display_name} replied to your link in {message.guild.name}: "
-                f"https://discord.com/channels/{message.guild.id}/{message.channel.id}/{message.id}\n")
+        # Most messages have no links at all, turn them away before any handler work.
+        # Intuitive replies may be plain chat, so replies are queued either way
+        start = time.perf_counter()
+        has_links = self.matcher.can_match(message.content)
+        self.prefilter_seconds.observe(time.perf_counter() - start)
+        if not has_links and message.reference is None:
+            self.messages.inc("rejected")
+            return
+        self.messages.inc("queued")
+
+        guild_id = message.guild.id if message.guild else 0
+        # The same links posted again in a channel before the first were fixed can be merged
+        key = (message.channel.id, message.content) if has_links else None
+        if has_links:
+            # Embeds often arrive while the message waits its turn, when it may have left the message cache
+            self.suppressor.expect(message)
+        self.dispatch.submit(guild_id, key, self.handle_message, message, has_links)
+
+    def dropped(self, message, has_links):
+        """Stop watching for the embeds of a message the dispatch queue dropped."""
+        if has_links:
+            self.suppressor.forget(message.id)
+
+    async def handle_message(self, message, has_links):
+        """Handle a queued message, sending intuitive reply notifications and fixing links."""
+        suppressing = False
+        try:
+            # Intuitive replies, which may be plain chat so are checked before the link prefilter
+            if message.reference is not None:
+                intuitive_reply = await self.is_intuitive_reply(message)
+                if intuitive_reply:
+                    await self.actions.run(
+                        "dm", intuitive_reply.id, intuitive_reply.send,
+                        f"{message.author.display_name} replied to your link in {message.guild.name}: "
+                        f"https://discord.com/channels/{message.guild.id}/{message.channel.id}/{message.id}\n")
+            if has_links:
+                suppressing = await self.fix_links(message)
+        finally:
+            # Watched for since it arrived, but nothing is going to suppress its embeds
+            if has_links and not suppressing:
+                self.suppressor.forget(message.id)
+
+    async def fix_links(self, message):
+        """
+        Fix the links in a queued message, replying with the fixes.
+
+        Parameters
+        ----------
+        message : discord.Message
+            The message, which the prefilter let through.
 
+        Returns
+        -------
+        bool
+            True if its embeds are being suppressed.
+        """
         # Check for potential fixable links
-        handlers = await self.find_fixable_links(message)
-        if len(handlers) != 0:
-            fixed = ""
-            fixed_links = []
-            for handler in handlers:
-                current_fixed = await self.fix_message(message, handler)
-                if not current_fixed:
-                    continue
-                fixed_links.append(current_fixed)
-            # Every handler may have failed to resolve a usable link
-            if len(fixed_links) == 0:
-                return
-            # We read links top down so default message is reversed
-            fixed_links.reverse()
-            for link in fixed_links:
-                link.strip()
-                fixed += link + "\n"
-            # Links already end in a newline, so trim before adding the footer
-            fixed = fixed.rstrip() + "\n" + INVITE_FOOTER
-            try:
-                await asyncio.sleep(0.4)
-                await message.edit(suppress=True)
-            except discord.Forbidden:
+        if self.workers is not None:
+            result = await self.workers.fix(record_of(message))
+        else:
+            result = await self.pipeline.fix(message.content)
+        if result is not None:
+            fixed, counts = result
+            with self.stats_seconds.time():
+                for linkName, count in counts.items():
+                    await self.log.update(message.guild.id, message.author.id, count, linkName)
+            fixed += "\n" + INVITE_FOOTER
+            # Checked up front from cached permissions, as the reply no longer waits on the edit
+            can_suppress = message.guild is None or message.channel.permissions_for(message.guild.me).manage_messages
+            if not can_suppress:
                 fixed = ":prohibited: I don't have permission to supress embeds in the message I am replying to, please give me the `Manage Messages` permission to avoid clutter.\n"
             try:
-                new_msg = await message.reply(fixed, mention_author=False)
-                await new_msg.add_reaction("❌")
+                new_msg = await self.actions.run("reply", message.channel.id, message.reply, fixed, mention_author=False)
             except discord.Forbidden:
-                return
-            
+                return False
+            self.replies.add(new_msg.id, message.author.id)
+            if can_suppress:
+                self.suppressor.suppress(message)
+            # Nothing waits on the reaction, a failure is only counted
+            self.actions.submit("react", message.channel.id, new_msg.add_reaction, "❌", key=("react", new_msg.id))
+            return can_suppress
+        return False
+
     @commands.Cog.listener()
-    async def on_reaction_add(self, reaction, user):
+    async def on_raw_message_edit(self, payload):
+        """Suppress the embeds of fixed messages as soon as Discord adds them."""
+        self.suppressor.edited(payload)
+
+    @commands.Cog.listener()
+    async def on_raw_reaction_add(self, payload):
         """Handle reaction to delete fixed links."""
-        if user.bot:
+        if payload.user_id == self.bot.user.id or str(payload.emoji) != "❌":
+            return
+        # Only the person whose link was fixed may delete it
+        if await self.fix_poster(payload) != payload.user_id:
             return
-        # If replied to message is by the reaction user, and if the reaction emoji is for deleting
+        fix = self.bot.get_partial_messageable(payload.channel_id).get_partial_message(payload.message_id)
         try:
-            target = reaction.message.reference.resolved.author.id
-        except AttributeError:
+            await self.actions.run("delete", payload.channel_id, fix.delete, key=("delete", payload.message_id))
+        except discord.HTTPException:
             return
-        if target == user.id and reaction.emoji == "❌":
-            await reaction.message.delete()
-            await user.send(f"You deleted a link I fixed in {reaction.message.guild.name}.")
+        self.replies.forget(payload.message_id)
+        user = payload.member or self.bot.get_user(payload.user_id)
+        if user is None:
+            user = await self.actions.run("fetch_user", 0, self.bot.fetch_user, payload.user_id,
+                                          key=("fetch_user", payload.user_id))
+        guild = self.bot.get_guild(payload.guild_id) if payload.guild_id else None
+        where = f" in {guild.name}" if guild else ""
+        await self.actions.run("dm", user.id, user.send, f"You deleted a link I fixed{where}.")
+
+    async def fix_poster(self, payload):
+        """
+        Get who a reacted to message was fixing, if it is one of the bot's fixes.
+
+        Fixes posted before the reply index existed, or since forgotten by it,
+        are looked up in the message cache and fetched as a last resort.
+
+        Parameters
+        ----------
+        payload : discord.RawReactionActionEvent
+            The reaction.
+
+        Returns
+        -------
+        int or None
+            The ID of the user whose message it fixed, or None if it isn't a fix or their message is gone.
+        """
+        author_id = self.replies.poster(payload.message_id)
+        if author_id is not None:
+            return author_id
+        fix = discord.utils.get(self.bot.cached_messages, id=payload.message_id)
+        try:
+            if fix is None:
+                channel = self.bot.get_partial_messageable(payload.channel_id)
+                fix = await self.actions.run("fetch_message", payload.channel_id, channel.fetch_message,
+                                             payload.message_id, key=("fetch_message", payload.message_id))
+            if fix.author.id != self.bot.user.id or not fix.reference:
+                return None
+            if not any(handler.link in fix.content for handler in self.linkHandlers):
+                return None
+            return await self.replies.original_author(fix)
+        except discord.HTTPException:
+            return None
 
     @commands.is_owner()
     @commands.command(name="toggle", description="Toggle link fixer.")
@@ -101,6 +323,83 @@ class LinkFix(commands.Cog):
             self.status = True
             await ctx.send("Link fixer enabled globally.")
 
+    @commands.is_owner()
+    @commands.command(name="prefilter", description="Get stats for messages turned away before link matching.")
+    async def prefilter(self, ctx):
+        """Get stats for messages the link prefilter turned away."""
+        checked = self.matcher.checked
+        rejected = self.matcher.rejected
+        percent = rejected / checked * 100 if checked else 0
+        await ctx.send(f"{rejected} of {checked} messages ({percent:.1f}%) rejected before link matching.")
+
+    @commands.is_owner()
+    @commands.command(name="cache", description="Get stats for link handler resolution caches.")
+    async def cache(self, ctx):
+        """Get stats for the resolution cache and request coalescing of each link handler that resolves links."""
+        lines = []
+        for handler in self.linkHandlers:
+            cache = handler.cache
+            if cache is None and handler.coalesced == 0:
+                continue
+            line = f"{handler.name}: {handler.coalesced} requests saved by coalescing"
+            if cache is not None:
+                lookups = cache.hits + cache.misses
+                hit_rate = cache.hits / lookups * 100 if lookups else 0
+                line += (f", {len(cache)}/{cache.limit} entries, {cache.hits} hits, "
+                         f"{cache.misses} misses ({hit_rate:.1f}% hit rate), {cache.evictions} evictions")
+            lines.append(line)
+        users = self.users
+        lookups = users.cache.hits + users.cache.misses
+        hit_rate = users.cache.hits / lookups * 100 if lookups else 0
+        lines.append(f"users: {len(users.cache)}/{users.cache.limit} names, {users.cache.hits} hits, "
+                     f"{users.cache.misses} misses ({hit_rate:.1f}% hit rate), {users.fetched} fetched, "
+                     f"{users.failed} failed fetches, {users.cache.evictions} evictions")
+        replies = self.replies
+        lines.append(f"replies: {len(replies.cache)}/{replies.cache.limit} fixes indexed, {replies.indexed} from the index, "
+                     f"{replies.cached} from the message cache, {replies.fetched} fetched, {replies.cache.evictions} evictions")
+        await ctx.send("\n".join(lines))
+
+    @commands.is_owner()
+    @commands.command(name="queues", description="Get stats for the message dispatch queues.")
+    async def queues(self, ctx):
+        """Get the depth of the message dispatch queues, what was dropped or merged, and how long messages waited."""
+        dispatch = self.dispatch
+        wait = dispatch.wait_total / dispatch.started * 1000 if dispatch.started else 0
+        lines = [f"{dispatch.workers} workers, {dispatch.guild_limit} per guild, policy {dispatch.policy}",
+                 f"{dispatch.depth} waiting (max {dispatch.max_depth}) in {len(dispatch.queues)} guilds, "
+                 f"{sum(dispatch.running.values())} running",
+                 f"{dispatch.submitted} submitted, {dispatch.processed} processed, {dispatch.dropped} dropped, "
+                 f"{dispatch.merged} merged, {dispatch.failed} failed",
+                 f"wait avg {wait:.1f}ms, max {dispatch.wait_max * 1000:.1f}ms"]
+        if self.workers is not None:
+            workers = self.workers
+            lines.append(f"{workers.alive()}/{workers.count} worker processes, {len(workers.waiting)} messages with them, "
+                         f"{workers.completed} fixed, {workers.timed_out} timed out")
+        lines += [f"{depth} : guild {guild_id}" for guild_id, depth in dispatch.deepest(5)]
+        await ctx.send("\n".join(lines))
+
+    @commands.is_owner()
+    @commands.command(name="actions", description="Get stats for REST calls made by the action scheduler.")
+    async def actions_stats(self, ctx):
+        """Get requests, latency, throttling, 429s and bucket headroom for each kind of REST call."""
+        lines = [f"{self.actions.queue.qsize()} calls waiting"]
+        for route in ROUTES:
+            stats = self.actions.stats[route]
+            average = stats.latency / stats.requests * 1000 if stats.requests else 0
+            lines.append(f"**{route}**: {stats.requests} requests, avg {average:.0f}ms max {stats.latency_max * 1000:.0f}ms, "
+                         f"{stats.rate_limited} 429s, {stats.throttled} throttled, {stats.collapsed} collapsed, "
+                         f"{stats.failed} failed, {self.actions.headroom(route) * 100:.0f}% headroom")
+        await ctx.send("\n".join(lines))
+
+    @commands.is_owner()
+    @commands.command(name="suppression", description="Get stats for embed suppression of fixed messages.")
+    async def suppression(self, ctx):
+        """Get how embed suppressions were triggered, and how many edits may have been wasted."""
+        suppressor = self.suppressor
+        await ctx.send(f"{suppressor.immediate} embeds already there, {suppressor.on_event} on the edit event, "
+                       f"{suppressor.timed_out} after the {suppressor.TIMEOUT}s timeout with no embed seen "
+                       f"(possibly wasted), {suppressor.failed} failed, {len(suppressor.waiting)} waiting")
+
     @commands.is_owner()
     @commands.command(name="user", description="Get stats for links fixed for a user.")
     async def user(self, ctx, user: discord.Member = None, user_id: str = None):
@@ -138,18 +437,87 @@ class LinkFix(commands.Cog):
         total_count = await self.log.get_all_server_stats(server_id)
         await ctx.send(f"{total_count} links fixed in {server_name}.")
 
+    @commands.is_owner()
+    @commands.command(name="breakdown", description="Get stats per platform for a server, a user, or a user in a server.")
+    async def breakdown(self, ctx, kind: str, target_id: str, server_id: str = None):
+        """
+        Get stats per platform for links fixed in a server, for a user, or for a user in a server.
+        Usage: breakdown server <server id>, breakdown user <user id> [server id]
+        """
+        try:
+            target_id = int(target_id)
+            server_id = int(server_id) if server_id is not None else None
+        except ValueError:
+            return await ctx.send("IDs must be numbers.")
+
+        if kind == "server":
+            server = self.bot.get_guild(target_id)
+            title = f"in {server.name if server else 'Unknown Server'}"
+            counts = await self.log.get_server_breakdown(target_id)
+        elif kind == "user" and server_id is None:
+            title = f"for user ID {target_id}"
+            counts = await self.log.get_user_breakdown(target_id)
+        elif kind == "user":
+            if not self.log.supports_user_server:
+                return await ctx.send("Stats per user per server need the sqlite log backend.")
+            server = self.bot.get_guild(server_id)
+            title = f"for user ID {target_id} in {server.name if server else 'Unknown Server'}"
+            counts = await self.log.get_user_server_breakdown(target_id, server_id)
+        else:
+            return await ctx.send("Breakdown must be for a `server` or a `user`.")
+
+        lines = [f"{count} : {platform}" for platform, count in sorted(counts.items(), key=lambda x: x[1], reverse=True)]
+        await ctx.send(f"Links fixed {title}:\n" + ("\n".join(lines) or "None"))
+
+    @commands.is_owner()
+    @commands.command(name="usage", description="Get links fixed over a recent window, overall or for a server or user.")
+    async def usage(self, ctx, window: str = "1h", kind: str = None, target_id: str = None):
+        """
+        Get the links fixed and the rate over a recent window, overall or for a server or user.
+        Usage: usage [window, eg. 30m, 6h, 7d] [server|user <id>]
+        The history is kept per process, so with shard_ids set only this process's shards are counted.
+        """
+        match = WINDOW_PATTERN.fullmatch(window)
+        if match is None or int(match.group(1)) == 0:
+            return await ctx.send("Window must be a number followed by m, h or d, eg. `30m`, `6h`, `7d`.")
+        seconds = int(match.group(1)) * WINDOW_UNITS[match.group(2)]
+
+        if kind is None:
+            title = "overall"
+            usage = await self.log.get_usage(seconds)
+        elif kind in ("server", "user") and target_id is not None:
+            try:
+                target_id = int(target_id)
+            except ValueError:
+                return await ctx.send("IDs must be numbers.")
+            title = f"for {kind} ID {target_id}"
+            usage = await self.log.get_usage(seconds, kind + "s", target_id)
+        else:
+            return await ctx.send("Usage must be overall, or for a `server <id>` or a `user <id>`.")
+
+        lines = [f"{usage['total']} links fixed {title} in the last {window} "
+                 f"({usage['total'] / (seconds / 60):.2f}/min)"]
+        if self.bot.shard_ids is not None:
+            lines.append(f"Shards {min(self.bot.shard_ids)}-{max(self.bot.shard_ids)} only, "
+                         f"other processes keep their own history")
+        peaks = ", ".join(f"{count}/{name}" for name, count in usage["peaks"].items())
+        if peaks:
+            lines.append(f"Peak: {peaks}")
+        lines += [f"{count} : {platform}" for platform, count in sorted(usage["platforms"].items(), key=lambda x: x[1], reverse=True)]
+        await ctx.send("\n".join(lines))
+
     @commands.is_owner()
     @commands.command(name="all", description="Get stats for all links fixed.")
     async def all(self, ctx):
         """Get global stats for all links fixed."""
         await ctx.defer()
 
-        stats = await self.log.get_global_stats()
+        stats = await self.log.get_global_stats(5)
         embed = discord.Embed(title="Link Stats", color=0x1DA1F2)
         embed.add_field(name="Total Links", value=stats.get('total_links_fixed', 0), inline=False)
 
         # Show top servers
-        top_servers = stats.get('top_servers', [])[:5]
+        top_servers = stats.get('top_servers', [])
         server_list = []
         for sid, count in top_servers:
             try:
@@ -167,33 +535,15 @@ class LinkFix(commands.Cog):
         )
 
         # Show top users using the cache
-        top_users = stats.get('top_users', [])[:5]
+        top_users = stats.get('top_users', [])
+        # Only the users shown are looked up, from the directory's cache where possible
+        names = await self.users.names([uid for uid, _ in top_users])
         user_list = []
         for uid, count in top_users:
-            try:
-                user_id = int(uid) if isinstance(uid, str) else uid
-                
-                # Use the user cache
-                if user_id in self.user_cache:
-                    user_info = self.user_cache[user_id]
-                    user_name = f"{user_info['display_name']} (@{user_info['name']})"
-                else:
-                    # If not in cache, try to fetch directly
-                    try:
-                        user = await self.bot.fetch_user(user_id)
-                        user_name = f"{user.display_name} (@{user.name})"
-                        # Add to cache for future use
-                        self.user_cache[user_id] = {
-                            "display_name": user.display_name,
-                            "name": user.name
-                        }
-                    except discord.HTTPException:
-                        user_name = f"User ID: {user_id}"
-            
-                user_list.append(f"{count} : {user_name}")
-            except (ValueError, TypeError):
-                user_list.append(f"{count} : Invalid User ID ({uid})")
-        
+            name = names.get(uid)
+            user_name = f"{name[0]} (@{name[1]})" if name else f"User ID: {uid}"
+            user_list.append(f"{count} : {user_name}")
+
         embed.add_field(
             name="Top Users",
             value="\n".join(user_list) or "None",
@@ -213,7 +563,7 @@ class LinkFix(commands.Cog):
             await self.log.add_ignored(ctx.author.id)
             await ctx.author.send("You will no longer receive reply notifications.")
         else:
-            await self.log.remove_ignored(ctx.author.id)
+            await self.log.rem_ignored(ctx.author.id)
             await ctx.author.send("You will now receive reply notifications.")
 
     async def is_intuitive_reply(self, message):
@@ -243,168 +593,28 @@ class LinkFix(commands.Cog):
                 return False
             # Check if the bot message has any fixed link formats from any handlers
             is_fixed = any(link in search.content for link in (handler.link for handler in self.linkHandlers))
-            # Handle bot not being able to load resolved reference, force load message that we know exists
-            target = await search.channel.fetch_message(search.reference.message_id)
-            if target and is_fixed != -1:
-                user = await self.bot.fetch_user(int(target.author.id))
-                # Check if the user has disabled reminders, and if the user is not replying to their own fixed tweet
-                if not await self.log.get_ignored(user.id) and user.id != message.author.id:
-                    return user
-        return False
-
-    async def find_fixable_links(self, message: str):
-        """
-        Preliminary check for links that may match link handlers.
-
-        Parameters
-        ----------
-        message : str
-            The message content to check for fixable links.
-        
-        Returns
-        -------
-        [LinkInterface]
-        A list of link handlers that can fix the links in the message.
-        """
-        # Iterate over handlers
-        handlers = []
-        for handler in self.linkHandlers:
-            # Return False if any handler finds a link to ignore (assumed pre-fixed URL)
-            # FIXME: Multiple links in one message may cause issues
-            # Search for valid links
-            for link in handler.replace:
-                if link in message.content:
-                    # Only add if link is not prefixed
-                    if not any(x in message.content for x in handler.ignore):
-                        handlers.append(handler)
-        return handlers
-
-    async def fix_message(self, message: str, handler: LinkInterface):
-        """
-        Fix the message content by replacing links with the handler's link format.
-        
-        Parameters
-        ----------
-        message : str
-            The message content to fix.
-            
-        handler : LinkInterface
-            The link handler to use for fixing the message.
-            
-        Returns
-        -------
-        str or False
-            The fixed message content with replaced links, or False if no links were fixed.
-        """
-        print(message.content)
-        new_content = ""
-        # Use handler regex to identify links
-        urls = re.findall(handler.pattern, message.content)
-        new_urls = []
-        # Count of links fixed for logging (deprecate in future?)
-        log_count = 0
-        for url in urls:
-            # Check if the selected URL has spoiler tags
-            spoiler = await spoiler_check(message.content)
-            # Rebuild the URL from the regex match
-            original_url = ""
-            for i in url:
-                print(i)
-                original_url += i
-
-            # Let the handler expand short-form links, which may need a request
-            new_url = await handler.resolve(original_url)
-            # Skip links the handler could not resolve
-            if new_url is None:
-                continue
-
-            for link in handler.replace:
-                # If the link is in the URL and not in the ignore list, replace
-                if link in original_url and not any([x in url for x in handler.ignore]):
-                    new_url = new_url.replace(link, handler.link)
-                    # Remove www. if present
-                    new_url = new_url.replace("www.", "")
-                    # Add spoiler tags for links originally spoilered
-                    if spoiler:
-                        new_url = "||" + new_url + "||"
-                    # Update log count
-                    if handler.status is not None:
-                        new_url += "\n" + handler.status
-                    log_count += 1
-                    # Append
-                    new_content += f"{new_url}\n"
-                    new_urls.append(new_url)
-
-        # Return if any links were fixed
-        if len(new_urls) > 0:
-            await self.log.update(message.guild.id, message.author.id, log_count, handler.name)
-            return new_content
-        
+            if not is_fixed:
+                return False
+            # Usually known from when the fix was posted, only fetched if not
+            author_id = await self.replies.original_author(search)
+            # Check if the user is replying to their own fixed link, and if they have disabled reminders
+            if author_id is None or author_id == message.author.id or await self.log.get_ignored(author_id):
+                return False
+            user = self.bot.get_user(author_id)
+            if user is None:
+                user = await self.actions.run("fetch_user", 0, self.bot.fetch_user, author_id, key=("fetch_user", author_id))
+            return user
         return False
 
-    async def cache_users(self):
-        """Cache users from the log data."""
-        print("Caching users from log data...")
-        # Get all unique user IDs from the log data
-        user_ids = set()
-        for handler_name in [handler.name for handler in self.linkHandlers]:
-            if handler_name in self.log.data:
-                users = self.log.data[handler_name].get("users", {})
-                user_ids.update(users.keys())
-    
-        # Fetch user information for each ID
-        cached_count = 0
-        for user_id in user_ids:
-            try:
-                user_id = int(user_id)
-                # Try to fetch user (works without members intent)
-                try:
-                    user = await self.bot.fetch_user(user_id)
-                    self.user_cache[user_id] = {
-                        "display_name": user.display_name,
-                        "name": user.name
-                    }
-                    cached_count += 1
-                except discord.NotFound:
-                    # User not found, add a placeholder
-                    self.user_cache[user_id] = {
-                        "display_name": "Unknown User",
-                        "name": f"{user_id}"
-                    }
-            except Exception as e:
-                print(f"Error caching user {user_id}: {e}")
-    
-        print(f"Successfully cached {cached_count} users.")
-
-async def spoiler_check(message):
-    """
-    Check if the message contains spoiler tags.
-    
-    
-    Parameters
-    ----------
-    message : str
-        The message content to check for spoiler tags.
-    
-    Returns
-    -------
-    bool
-        True if the message contains spoiler tags, False otherwise.
-    """
-    split = message.split("||")
-    if len(split) >= 2:
-        return True
-    return False
-
 async def setup(bot):
     linkfix = LinkFix(bot)
     await bot.add_cog(linkfix)
     bg = BackgroundTimer(linkfix)
-    bot.loop.create_task(bg.run())
+    linkfix.timer = bot.loop.create_task(bg.run())
 
 class BackgroundTimer:
     """
-    Background task to periodically dump link logger data and update the bot's status.
+    Background task to periodically dump link logger data and resolution caches, and update the bot's status.
     """
     def __init__(self, linkfix):
         self.linkfix = linkfix
@@ -418,5 +628,6 @@ class BackgroundTimer:
                 await self.bot.change_presence(activity=discord.Game(name=f"{await self.linkfix.log.get_total_fixed()} fixed embeds"))
                 
             await self.linkfix.log.dump()
+            await self.linkfix.dump_caches()
 
 
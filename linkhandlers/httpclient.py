@@ -0,0 +1,49 @@
+from typing import Optional
+
+import aiohttp
+
+class HttpClient:
+    """Bot wide HTTP client for link handlers that resolve links over the network.
+
+    Owned by Core and handed to LinkInterface.resolve, so every handler shares
+    one pooled connector. Connections to a host are kept alive and DNS answers
+    cached between links, rather than every lookup paying for a new session,
+    DNS lookup and TLS handshake.
+    """
+
+    # Total open connections, and open connections to any one host
+    CONNECTION_LIMIT = 100
+    CONNECTION_LIMIT_PER_HOST = 10
+    DNS_CACHE_TTL = 300
+    KEEPALIVE_TIMEOUT = 60
+
+    def __init__(self):
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        """Return the shared session, creating it on first use.
+
+        The session binds to the running event loop, so it cannot be built
+        before the bot starts.
+
+        Returns
+        -------
+        aiohttp.ClientSession
+            The shared client session.
+        """
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.CONNECTION_LIMIT,
+                                             limit_per_host=self.CONNECTION_LIMIT_PER_HOST,
+                                             ttl_dns_cache=self.DNS_CACHE_TTL,
+                                             keepalive_timeout=self.KEEPALIVE_TIMEOUT)
+            self._session = aiohttp.ClientSession(connector=connector)
+        return self._session
+
+    async def close(self):
+        """
+        Close the shared session and every pooled connection.
+        """
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
@@ -1,8 +1,26 @@
+import asyncio
 from abc import ABC, abstractmethod
 from typing import List, Optional
 
+from linkhandlers.httpclient import HttpClient
+from linkhandlers.resolutioncache import MISSING, ResolutionCache
+
 class LinkInterface(ABC):
     """Abstract base class for link handlers."""
+
+    # Handlers that resolve links over the network set a size to cache what they resolve
+    CACHE_LIMIT = 0
+    # Seconds to keep resolved links, and links that failed to resolve
+    CACHE_TTL = 24 * 60 * 60
+    CACHE_NEGATIVE_TTL = 5 * 60
+
+    def __init__(self):
+        self.cache = ResolutionCache(self.CACHE_LIMIT, self.CACHE_TTL, self.CACHE_NEGATIVE_TTL) if self.CACHE_LIMIT else None
+        # URL -> task resolving it, shared by every lookup of the URL while it runs
+        self.inflight = {}
+        # Lookups that joined a resolution already in flight rather than starting their own
+        self.coalesced = 0
+
     @property
     @abstractmethod
     def name(self) -> str:
@@ -67,6 +85,7 @@ class LinkInterface(ABC):
     @abstractmethod
     def pattern(self) -> str:
         """Return the regex pattern for the link.
+        Patterns must match from the start of the URL scheme (http:// or https://).
         
         Returns
         -------
@@ -75,7 +94,35 @@ class LinkInterface(ABC):
         """
         pass
 
-    async def resolve(self, url: str) -> Optional[str]:
+    @property
+    def resolves(self) -> bool:
+        """Return True if the handler overrides resolve, so looking a link up may need a request.
+        
+        Returns
+        -------
+        bool
+            Whether the handler resolves links itself.
+        """
+        return type(self).resolve is not LinkInterface.resolve
+
+    def needs_request(self, url: str) -> bool:
+        """Return True if resolving this URL may need a network request.
+        Handlers that resolve some links locally override this, so only the
+        links needing a request are cached and shared between lookups.
+
+        Parameters
+        ----------
+        url : str
+            The URL matched by the handler's pattern.
+
+        Returns
+        -------
+        bool
+            Whether resolving the URL may need a request.
+        """
+        return self.resolves
+
+    async def resolve(self, url: str, client: HttpClient) -> Optional[str]:
         """Expand a matched URL before it is rewritten.
 
         Handlers for platforms that hand out short links may override this to
@@ -87,6 +134,9 @@ class LinkInterface(ABC):
         url : str
             The URL matched by the handler's pattern.
 
+        client : HttpClient
+            The bot's shared HTTP client, for any requests the handler makes.
+
         Returns
         -------
         str or None
@@ -94,3 +144,52 @@ class LinkInterface(ABC):
             should be skipped.
         """
         return url
+
+    async def lookup(self, url: str, client: HttpClient) -> Optional[str]:
+        """Resolve a matched URL, answering from the handler's cache where possible.
+
+        Lookups of a URL made while it is already being resolved wait on that
+        resolution instead of starting another, so a link posted in several
+        places at once costs one request.
+
+        Parameters
+        ----------
+        url : str
+            The URL matched by the handler's pattern.
+
+        client : HttpClient
+            The bot's shared HTTP client, for any requests the handler makes.
+
+        Returns
+        -------
+        str or None
+            The URL to rewrite, or None if the link could not be resolved and
+            should be skipped.
+        """
+        # Nothing worth caching or sharing when the link is resolved without a request
+        if not self.needs_request(url):
+            return await self.resolve(url, client)
+
+        if self.cache is not None:
+            resolved = self.cache.get(url)
+            if resolved is not MISSING:
+                return resolved
+
+        task = self.inflight.get(url)
+        if task is None:
+            task = asyncio.create_task(self.resolve_once(url, client))
+            self.inflight[url] = task
+        else:
+            self.coalesced += 1
+        # One lookup giving up must not cancel the resolution for the others waiting on it
+        return await asyncio.shield(task)
+
+    async def resolve_once(self, url: str, client: HttpClient) -> Optional[str]:
+        """Resolve a URL on behalf of every lookup waiting on it, then cache the result."""
+        try:
+            resolved = await self.resolve(url, client)
+            if self.cache is not None:
+                self.cache.put(url, resolved)
+            return resolved
+        finally:
+            self.inflight.pop(url, None)
@@ -0,0 +1,145 @@
+import re
+from typing import Dict, List
+
+from linkhandlers.linkinterface import LinkInterface
+
+class LinkMatcher:
+    """Find fixable links for every handler in a single scan of a message.
+
+    Built once from the registered handlers. Messages are first put through
+    can_match, a cheap check for a URL scheme and then for any of the domains
+    the handlers replace, which turns most chat away without allocating.
+    Messages that get past it are scanned once with every handler's pattern
+    wrapped in a named group, and the group that matched says which handler
+    owns each URL.
+
+    A single scan can't find links that overlap, as the old search with each
+    handler's pattern in turn could, eg. a link in another link's query string
+    or two pasted without a space between them. Every pattern starts at a URL
+    scheme, so that can only happen when a match has "http" in it past its
+    start, and those messages are searched with each handler's pattern instead.
+    """
+
+    def __init__(self, handlers: List[LinkInterface]):
+        self.handlers = handlers
+        # Properties build a fresh list on every access, so read them once
+        self.replace = {handler: tuple(handler.replace) for handler in handlers}
+        self.ignore = {handler: tuple(handler.ignore) for handler in handlers}
+
+        # Longest first so a domain is never shadowed by one it contains
+        domains = sorted({link for links in self.replace.values() for link in links}, key=len, reverse=True)
+        self.prefilter = re.compile("|".join(re.escape(domain) for domain in domains))
+        # Messages put through can_match, and how many of those it turned away
+        self.checked = 0
+        self.rejected = 0
+
+        # Each handler's own pattern, for messages with overlapping links
+        self.patterns = {handler: re.compile(handler.pattern) for handler in handlers}
+        # Group name -> (handler, slice of Match.groups() holding the handler's own groups)
+        self.groups = {}
+        alternatives = []
+        offset = 0
+        for i, handler in enumerate(handlers):
+            name = f"h{i}"
+            own_groups = self.patterns[handler].groups
+            if own_groups == 0:
+                # Nothing to rebuild from, so take the whole match as re.findall would
+                self.groups[name] = (handler, slice(offset, offset + 1))
+            else:
+                self.groups[name] = (handler, slice(offset + 1, offset + 1 + own_groups))
+            alternatives.append(f"(?P<{name}>{handler.pattern})")
+            offset += own_groups + 1
+        # Every pattern matches from the URL scheme, and leading with it lets the
+        # scan skip most positions without trying each handler in turn
+        self.pattern = re.compile(f"(?=https?://)(?:{'|'.join(alternatives)})")
+
+    def can_match(self, content: str) -> bool:
+        """Check if a message could contain a link any handler can fix.
+
+        Parameters
+        ----------
+        content : str
+            The message content to check.
+
+        Returns
+        -------
+        bool
+            False if the message certainly has no fixable links, True if it
+            should be scanned with find.
+        """
+        self.checked += 1
+        # Every pattern starts at the scheme, so most chat fails on the first check
+        if "http" not in content or self.prefilter.search(content) is None:
+            self.rejected += 1
+            return False
+        return True
+
+    def find(self, content: str) -> Dict[LinkInterface, List[str]]:
+        """Find the links in a message and the handlers that can fix them.
+
+        A handler only gets links if the message contains one of the domains it
+        replaces and none of its ignored (already fixed) link formats, as before.
+        Messages should be put through can_match first.
+
+        Parameters
+        ----------
+        content : str
+            The message content to scan.
+
+        Returns
+        -------
+        Dict[LinkInterface, List[str]]
+            The URLs found for each handler, in message order, keyed by
+            handler in registration order. Handlers with no links are left out.
+        """
+        found = {}
+        for match in self.pattern.finditer(content):
+            # Another link may start inside this one, even if the match stops partway through its scheme
+            if match.group().find("http", 1) != -1:
+                found = self.find_each(content)
+                break
+            handler, own_groups = self.groups[match.lastgroup]
+            url = "".join(match.groups("")[own_groups])
+            if handler in found:
+                found[handler].append(url)
+            else:
+                found[handler] = [url]
+
+        matches = {}
+        for handler in self.handlers:
+            if handler not in found:
+                continue
+            if not self.contains(content, self.replace[handler]):
+                continue
+            if self.contains(content, self.ignore[handler]):
+                continue
+            matches[handler] = found[handler]
+        return matches
+
+    def find_each(self, content: str) -> Dict[LinkInterface, List[str]]:
+        """Find the links in a message with each handler's pattern in turn, as the old search did.
+
+        Parameters
+        ----------
+        content : str
+            The message content to scan.
+
+        Returns
+        -------
+        Dict[LinkInterface, List[str]]
+            The URLs found for each handler, before checking its replaced and ignored links.
+        """
+        found = {}
+        for handler, pattern in self.patterns.items():
+            urls = ["".join(url) for url in pattern.findall(content)]
+            if urls:
+                found[handler] = urls
+        return found
+
+    @staticmethod
+    def contains(content: str, links: tuple) -> bool:
+        """Return True if any of the links appear in the content."""
+        for link in links:
+            if link in content:
+                return True
+        return False
@@ -0,0 +1,241 @@
+import asyncio
+import logging
+import time
+from typing import Dict, List, Optional, Tuple
+
+from linkhandlers.httpclient import HttpClient
+from linkhandlers.linkinterface import LinkInterface
+from linkhandlers.linkmatcher import LinkMatcher
+from runtime.structuredlog import log_event
+
+# Longest a message waits on its links to resolve, and how many it resolves at once
+RESOLVE_DEADLINE = 5
+RESOLVE_CONCURRENCY = 4
+
+log = logging.getLogger(__name__)
+
+class LinkPipeline:
+    """Find, resolve and rewrite the links in a message's content.
+
+    Works on the content alone and touches nothing in Discord, so the same
+    pipeline runs in LinkFix on the bot's event loop and in worker processes
+    fed messages by a gateway process. Replying and logging stats are left to
+    the caller, which gets back how many links were fixed on each platform.
+    """
+
+    def __init__(self, handlers: List[LinkInterface], client: HttpClient, metrics=None):
+        """
+        Parameters
+        ----------
+        handlers : [LinkInterface]
+            The link handlers, in the order their links are matched.
+
+        client : HttpClient
+            The HTTP client handlers resolve links with.
+
+        metrics : Metrics or None
+            Where to record how long matching and resolving take, if anywhere.
+        """
+        self.handlers = handlers
+        self.matcher = LinkMatcher(handlers)
+        self.client = client
+        self.match_seconds = None
+        self.resolve_seconds = None
+        if metrics is not None:
+            self.match_seconds = metrics.histogram("match_seconds", "Time taken finding links in a message.")
+            self.resolve_seconds = metrics.histogram("resolve_seconds", "Time taken resolving a link.", ("handler",))
+
+    async def fix(self, content: str) -> Optional[Tuple[str, Dict[str, int]]]:
+        """
+        Fix every link in a message's content.
+
+        Parameters
+        ----------
+        content : str
+            The message content.
+
+        Returns
+        -------
+        Tuple[str, Dict[str, int]] or None
+            The fixed links, one per line, and handler name -> links fixed, or
+            None if no link could be fixed.
+        """
+        start = time.perf_counter()
+        handlers = self.matcher.find(content)
+        if self.match_seconds is not None:
+            self.match_seconds.observe(time.perf_counter() - start)
+        if len(handlers) == 0:
+            return None
+        fixed = ""
+        fixed_links = []
+        counts = {}
+        resolved = await self.resolve_links(handlers)
+        for handler, urls in handlers.items():
+            current_fixed, count = await self.fix_links(content, handler, urls, resolved[handler])
+            if not current_fixed:
+                continue
+            fixed_links.append(current_fixed)
+            counts[handler.name] = count
+        # Every handler may have failed to resolve a usable link
+        if len(fixed_links) == 0:
+            return None
+        # We read links top down so default message is reversed
+        fixed_links.reverse()
+        for link in fixed_links:
+            link.strip()
+            fixed += link + "\n"
+        # Links already end in a newline
+        return fixed.rstrip(), counts
+
+    async def resolve_links(self, handlers: dict):
+        """
+        Resolve every link found in a message at once, across all handlers.
+
+        Parameters
+        ----------
+        handlers : {LinkInterface: [str]}
+            The links found for each link handler, as returned by LinkMatcher.find.
+
+        Returns
+        -------
+        {LinkInterface: [str or None]}
+            The resolved links for each handler, in the same order as found. Links
+            that could not be resolved before the deadline are None.
+        """
+        resolved = {}
+        tasks = []
+        limit = asyncio.Semaphore(RESOLVE_CONCURRENCY)
+
+        async def lookup(handler, url):
+            start = time.perf_counter()
+            try:
+                return await handler.lookup(url, self.client)
+            finally:
+                if self.resolve_seconds is not None:
+                    self.resolve_seconds.observe(time.perf_counter() - start, handler.name)
+
+        async def limited_lookup(handler, url):
+            async with limit:
+                return await lookup(handler, url)
+
+        for handler, urls in handlers.items():
+            if not handler.resolves:
+                # Handled without a request, so no need to schedule anything
+                resolved[handler] = [await lookup(handler, url) for url in urls]
+                continue
+            handler_tasks = [asyncio.create_task(limited_lookup(handler, url)) for url in urls]
+            resolved[handler] = handler_tasks
+            tasks.extend(handler_tasks)
+
+        if len(tasks) == 0:
+            return resolved
+
+        # Links still resolving at the deadline are dropped from this message, though a
+        # shared resolution carries on in the background and fills the handler's cache
+        done, pending = await asyncio.wait(tasks, timeout=RESOLVE_DEADLINE)
+        for task in pending:
+            task.cancel()
+        for handler in resolved:
+            if handler.resolves:
+                resolved[handler] = [resolution_result(task) for task in resolved[handler]]
+        return resolved
+
+    async def fix_links(self, content: str, handler: LinkInterface, urls: list, resolved: list):
+        """
+        Replace a handler's links with its link format.
+
+        Parameters
+        ----------
+        content : str
+            The message content the links were found in.
+
+        handler : LinkInterface
+            The link handler to use for fixing the links.
+
+        urls : [str]
+            The links in the message matched by the handler's pattern.
+
+        resolved : [str or None]
+            The links as resolved by the handler, None where a link could not be resolved.
+
+        Returns
+        -------
+        Tuple[str or False, int]
+            The fixed links, or False if none were fixed, and how many were fixed.
+        """
+        new_content = ""
+        new_urls = []
+        # Count of links fixed for logging (deprecate in future?)
+        log_count = 0
+        for original_url, new_url in zip(urls, resolved):
+            # Check if the selected URL has spoiler tags
+            spoiler = await spoiler_check(content)
+
+            # Skip links the handler could not resolve
+            if new_url is None:
+                continue
+
+            for link in handler.replace:
+                # If the link is in the URL and not in the ignore list, replace
+                if link in original_url and not any([x in original_url for x in handler.ignore]):
+                    new_url = new_url.replace(link, handler.link)
+                    # Remove www. if present
+                    new_url = new_url.replace("www.", "")
+                    # Add spoiler tags for links originally spoilered
+                    if spoiler:
+                        new_url = "||" + new_url + "||"
+                    # Update log count
+                    if handler.status is not None:
+                        new_url += "\n" + handler.status
+                    log_count += 1
+                    # Append
+                    new_content += f"{new_url}\n"
+                    new_urls.append(new_url)
+
+        # Return if any links were fixed
+        if len(new_urls) > 0:
+            log_event(log, logging.DEBUG, "links_fixed", handler=handler.name, links=log_count, spoiler=spoiler)
+            return new_content, log_count
+
+        return False, 0
+
+def resolution_result(task):
+    """
+    Get the result of a link resolution task, treating unfinished or failed tasks as unresolved.
+
+    Parameters
+    ----------
+    task : asyncio.Task
+        The task resolving the link.
+
+    Returns
+    -------
+    str or None
+        The resolved link, or None if the task did not finish or raised.
+    """
+    if task.cancelled() or not task.done():
+        return None
+    if task.exception() is not None:
+        log_event(log, logging.WARNING, "resolve_failed", error=repr(task.exception()))
+        return None
+    return task.result()
+
+async def spoiler_check(message):
+    """
+    Check if the message contains spoiler tags.
+
+
+    Parameters
+    ----------
+    message : str
+        The message content to check for spoiler tags.
+
+    Returns
+    -------
+    bool
+        True if the message contains spoiler tags, False otherwise.
+    """
+    split = message.split("||")
+    if len(split) >= 2:
+        return True
+    return False
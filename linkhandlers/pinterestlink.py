@@ -1,10 +1,15 @@
 import asyncio
+import logging
 import re
 from typing import List, Optional
 
 import aiohttp
 
+from linkhandlers.httpclient import HttpClient
 from linkhandlers.linkinterface import LinkInterface
+from runtime.structuredlog import log_event
+
+log = logging.getLogger(__name__)
 
 class PinterestLink(LinkInterface):
     """Class to handle Pinterest links.
@@ -23,11 +28,8 @@ class PinterestLink(LinkInterface):
     # Pinterest serves a bot friendly page to a normal looking client
     USER_AGENT = "Mozilla/5.0 (compatible; Antedium/1.0; +http://bot.glky.net)"
     REQUEST_TIMEOUT = 3
-    CACHE_LIMIT = 512
-
-    def __init__(self):
-        # Short code -> pin id, so reposts of a link cost no requests
-        self.cache = {}
+    # Matched link -> fixed link, so reposts of a short link cost no requests
+    CACHE_LIMIT = 2048
 
     @property
     def name(self) -> str:
@@ -52,7 +54,11 @@ class PinterestLink(LinkInterface):
         Matches pin.it short links and pin links on any Pinterest geo domain."""
         return r"(https?:\/\/)((?:[a-z]{2,4}\.)?pinterest\.com\/pin\/[-a-zA-Z0-9()@:%_\+.~#?&=\/]*|pin\.it\/[a-zA-Z0-9]+)"
 
-    async def resolve(self, url: str) -> Optional[str]:
+    def needs_request(self, url: str) -> bool:
+        """Return True for pin.it links, long form links are rebuilt without a request."""
+        return self.SHORTENER in url
+
+    async def resolve(self, url: str, client: HttpClient) -> Optional[str]:
         """Rebuild a Pinterest link against the fixed embed domain.
 
         Long form links carry a geo subdomain and, when shared, an invite_code
@@ -64,13 +70,16 @@ class PinterestLink(LinkInterface):
         url : str
             The Pinterest link matched by the handler's pattern.
 
+        client : HttpClient
+            The bot's shared HTTP client, used to expand pin.it links.
+
         Returns
         -------
         str or None
             The fixed pin URL, or None if no pin id could be found.
         """
         if self.SHORTENER in url:
-            pin_id = await self.expand(url)
+            pin_id = await self.expand(url, client)
         else:
             match = self.PIN_ID_PATTERN.search(url)
             pin_id = match.group(1) if match else None
@@ -79,7 +88,7 @@ class PinterestLink(LinkInterface):
             return None
         return f"https://www.{self.link}/pin/{pin_id}/"
 
-    async def expand(self, url: str) -> Optional[str]:
+    async def expand(self, url: str, client: HttpClient) -> Optional[str]:
         """Follow a pin.it short link to find the pin it points at.
 
         Parameters
@@ -87,26 +96,25 @@ class PinterestLink(LinkInterface):
         url : str
             The pin.it short link to expand.
 
+        client : HttpClient
+            The bot's shared HTTP client to make the request with.
+
         Returns
         -------
         str or None
             The pin id, or None if the link could not be resolved.
         """
-        code = url.rstrip("/").rsplit("/", 1)[-1]
-        if code in self.cache:
-            return self.cache[code]
-
         try:
             timeout = aiohttp.ClientTimeout(total=self.REQUEST_TIMEOUT)
             headers = {"User-Agent": self.USER_AGENT}
-            async with aiohttp.ClientSession(timeout=timeout, headers=headers) as session:
-                # HEAD is enough, the pin id is in the final URL and the body is never needed
-                async with session.head(url, allow_redirects=True) as response:
-                    if response.status >= 400:
-                        return None
-                    final_url = str(response.url)
+            # HEAD is enough, the pin id is in the final URL and the body is never needed
+            async with client.session.head(url, allow_redirects=True, timeout=timeout, headers=headers) as response:
+                if response.status >= 400:
+                    return None
+                final_url = str(response.url)
         except (aiohttp.ClientError, asyncio.TimeoutError) as e:
-            print(f"Failed to resolve Pinterest link {url}: {e}")
+            # The link came from a message, so only the error is logged
+            log_event(log, logging.WARNING, "resolve_failed", handler=self.name, error=repr(e))
             return None
 
         # The page body advertises a canonical URL, but it has been seen to name
@@ -114,8 +122,4 @@ class PinterestLink(LinkInterface):
         match = self.PIN_ID_PATTERN.search(final_url)
         if match is None:
             return None
-
-        if len(self.cache) >= self.CACHE_LIMIT:
-            self.cache.clear()
-        self.cache[code] = match.group(1)
         return match.group(1)
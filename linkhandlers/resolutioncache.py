@@ -0,0 +1,156 @@
+import time
+from collections import OrderedDict
+from typing import Optional
+
+# Returned by ResolutionCache.get when nothing usable is cached, as None is a cached failure
+MISSING = object()
+
+class ResolutionCache:
+    """Least recently used cache of resolved links with expiring entries.
+
+    Successful resolutions are kept for ttl seconds. Failures are cached too,
+    as None, for the shorter negative_ttl, so a dead link being reposted does
+    not cost a request every time but a link that failed for a passing reason
+    is retried soon after. Once full, the least recently used entry makes way
+    for a new one.
+    """
+
+    def __init__(self, limit: int, ttl: float, negative_ttl: float):
+        self.limit = limit
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        # Key -> (resolved value or None, expiry as a unix time), oldest use first
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # Whether there are entries not yet written out by dump
+        self.dirty = False
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key: str):
+        """
+        Get a cached resolution.
+
+        Parameters
+        ----------
+        key : str
+            The link that was resolved.
+
+        Returns
+        -------
+        str, None or MISSING
+            The resolved link, None if resolving it failed, or MISSING if it is
+            not cached or the entry has expired.
+        """
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return MISSING
+        value, expires = entry
+        if expires <= time.time():
+            del self.entries[key]
+            self.misses += 1
+            return MISSING
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key: str, value: Optional[str]):
+        """
+        Cache a resolution, evicting the least recently used entry if full.
+
+        Parameters
+        ----------
+        key : str
+            The link that was resolved.
+
+        value : str or None
+            The resolved link, or None if it could not be resolved.
+        """
+        ttl = self.ttl if value is not None else self.negative_ttl
+        self.entries[key] = (value, time.time() + ttl)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.limit:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+        self.dirty = True
+
+    def discard(self, key: str):
+        """
+        Forget an entry, if there is one.
+
+        Parameters
+        ----------
+        key : str
+            The key of the entry.
+        """
+        if self.entries.pop(key, None) is not None:
+            self.dirty = True
+
+    def to_json(self) -> dict:
+        """
+        Get the unexpired entries in a form json can write.
+
+        Returns
+        -------
+        dict
+            Key -> [value, expiry], oldest use first.
+        """
+        now = time.time()
+        return {key: [value, expires] for key, (value, expires) in self.entries.items() if expires > now}
+
+    def from_json(self, entries: dict):
+        """
+        Replace the cache contents with entries written by to_json, dropping any that expired since.
+
+        Parameters
+        ----------
+        entries : dict
+            Key -> [value, expiry], oldest use first.
+        """
+        now = time.time()
+        self.entries = OrderedDict(
+            (key, (value, expires)) for key, (value, expires) in entries.items() if expires > now)
+        while len(self.entries) > self.limit:
+            self.entries.popitem(last=False)
+        self.dirty = False
+
+def restore_caches(contents: dict, handlers: list):
+    """
+    Fill the resolution caches of link handlers from contents read with read_json.
+
+    Parameters
+    ----------
+    contents : dict
+        Handler name -> cache entries.
+
+    handlers : [LinkInterface]
+        The link handlers whose caches to fill, matched up by name.
+    """
+    for handler in handlers:
+        if handler.cache is not None and handler.name in contents:
+            handler.cache.from_json(contents[handler.name])
+
+def snapshot_caches(handlers: list) -> Optional[dict]:
+    """
+    Copy the resolution caches of link handlers for writing out, if any have changed.
+
+    Parameters
+    ----------
+    handlers : [LinkInterface]
+        The link handlers whose caches to copy.
+
+    Returns
+    -------
+    dict or None
+        Handler name -> cache entries, or None if nothing changed since the last snapshot.
+    """
+    caches = {handler.name: handler.cache for handler in handlers if handler.cache is not None}
+    if not any(cache.dirty for cache in caches.values()):
+        return None
+    for cache in caches.values():
+        cache.dirty = False
+    return {name: cache.to_json() for name, cache in caches.items()}
@@ -0,0 +1,166 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any
+
+from runtime.structuredlog import log_event
+
+log = logging.getLogger(__name__)
+
+class BackgroundWriter:
+    """
+    Runs blocking file and database work on one dedicated thread, off the event loop.
+
+    Jobs run one at a time in the order they were submitted, so a write can never
+    overtake an earlier one. Callers take whatever snapshot a job needs on the
+    event loop, under their own lock, and hand the slow part (serialising,
+    writing, syncing) to the writer.
+
+    Time spent is recorded per job name: the on-loop part measured with
+    on_loop, and the part moved to the writer thread. Before the writer
+    existed the whole of both ran on the event loop.
+    """
+
+    def __init__(self):
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="writer")
+        # Job name -> {"jobs", "loop", "loop_max", "thread", "thread_max"}, times in seconds
+        self.timings = {}
+
+    def timing(self, name):
+        """
+        Get the timings recorded for a job name, adding empty ones if there are none.
+
+        Parameters
+        ----------
+        name : str
+            The job name.
+
+        Returns
+        -------
+        dict
+            The job count, and the total and longest time spent on the event loop and on the writer thread.
+        """
+        return self.timings.setdefault(name, {"jobs": 0, "loop": 0.0, "loop_max": 0.0, "thread": 0.0, "thread_max": 0.0})
+
+    @contextmanager
+    def on_loop(self, name):
+        """
+        Time work done on the event loop for a job, such as taking the snapshot it writes.
+
+        Parameters
+        ----------
+        name : str
+            The job name to record the time against.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            timing = self.timing(name)
+            timing["loop"] += elapsed
+            timing["loop_max"] = max(timing["loop_max"], elapsed)
+
+    async def run(self, name, job, *args):
+        """
+        Run a job on the writer thread and wait for it to finish.
+
+        Parameters
+        ----------
+        name : str
+            The job name to record the time against.
+
+        job : callable
+            The blocking function to run.
+
+        *args
+            Arguments for the job.
+
+        Returns
+        -------
+        Any
+            Whatever the job returns.
+        """
+        def timed():
+            start = time.perf_counter()
+            try:
+                return job(*args)
+            finally:
+                elapsed = time.perf_counter() - start
+                timing = self.timing(name)
+                timing["jobs"] += 1
+                timing["thread"] += elapsed
+                timing["thread_max"] = max(timing["thread_max"], elapsed)
+
+        return await asyncio.get_running_loop().run_in_executor(self.executor, timed)
+
+    def close(self):
+        """
+        Wait for submitted jobs to finish and stop the writer thread.
+        """
+        self.executor.shutdown(wait=True)
+
+def read_json(filepath: str, event: str) -> Any:
+    """
+    Read JSON saved with write_json_atomic, such as caches and usage history. Blocking, so run on the writer thread.
+
+    Parameters
+    ----------
+    filepath : str
+        The file to read.
+
+    event : str
+        The event to log if the file can't be parsed, eg. "cache_unreadable".
+
+    Returns
+    -------
+    Any
+        The saved data, or None if there is no readable file.
+    """
+    try:
+        with open(filepath, "r") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except json.JSONDecodeError as e:
+        log_event(log, logging.WARNING, event, file=filepath, error=str(e))
+        return None
+
+def write_json_atomic(filepath, data, **kwargs):
+    """
+    Write JSON to a file so that a crash leaves either the old or the new contents, never a mix.
+
+    The data is written to a temporary file beside the target, synced, then renamed
+    over it. A file that is bind mounted on its own, as config.json and log.json are
+    under Docker, cannot be renamed over, so it is rewritten in place instead.
+
+    Parameters
+    ----------
+    filepath : str
+        The file to write.
+
+    data
+        The JSON serialisable data to write.
+
+    **kwargs
+        Formatting options for json.dump, compact unless an indent is given.
+    """
+    if "indent" not in kwargs:
+        kwargs.setdefault("separators", (",", ":"))
+    temppath = filepath + ".tmp"
+    with open(temppath, "w", encoding="utf-8") as f:
+        json.dump(data, f, **kwargs)
+        f.flush()
+        os.fsync(f.fileno())
+    try:
+        os.replace(temppath, filepath)
+    except OSError:
+        with open(filepath, "w", encoding="utf-8") as f:
+            json.dump(data, f, **kwargs)
+            f.flush()
+            os.fsync(f.fileno())
+        os.remove(temppath)
@@ -0,0 +1,116 @@
+from array import array
+from bisect import bisect_left
+from typing import Optional
+
+class IdTable:
+    """
+    Gives each server or user ID a row number, shared by every column of counts for them.
+
+    Counts are kept in arrays of machine integers indexed by row, rather than in a
+    dict per platform keyed by the ID as a string, so an ID is stored once however
+    many platforms it has links fixed on, and each count costs 4 bytes.
+
+    The IDs known when the table is built are stored sorted in an array, 8 bytes
+    each, and found by binary search. Only IDs seen for the first time since are
+    kept in a dict, until the table is next built on startup.
+    """
+
+    def __init__(self, ids=()):
+        """
+        Parameters
+        ----------
+        ids : Iterable[int]
+            The IDs to start with, given the first rows in ID order.
+        """
+        # Row -> ID, sorted up to row `sorted`, then in the order they were added
+        self.ids = array("Q", sorted(ids))
+        self.sorted = len(self.ids)
+        # ID -> row for IDs added after the table was built
+        self.added = {}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def find(self, snowflake: int) -> Optional[int]:
+        """
+        Get the row for an ID.
+
+        Parameters
+        ----------
+        snowflake : int
+            The ID of the server or user.
+
+        Returns
+        -------
+        int or None
+            Its row, or None if it has none.
+        """
+        row = bisect_left(self.ids, snowflake, 0, self.sorted)
+        if row < self.sorted and self.ids[row] == snowflake:
+            return row
+        return self.added.get(snowflake)
+
+    def row(self, snowflake: int) -> int:
+        """
+        Get the row for an ID, adding one if it has none.
+
+        Parameters
+        ----------
+        snowflake : int
+            The ID of the server or user.
+
+        Returns
+        -------
+        int
+            Its row.
+        """
+        row = self.find(snowflake)
+        if row is None:
+            row = len(self.ids)
+            self.added[snowflake] = row
+            self.ids.append(snowflake)
+        return row
+
+def add_count(column: array, row: int, entryNum: int) -> int:
+    """
+    Add to the count in a row of a column, growing the column to reach it if needed.
+
+    Parameters
+    ----------
+    column : array
+        The counts, indexed by row.
+
+    row : int
+        The row from the IdTable.
+
+    entryNum : int
+        The number to add.
+
+    Returns
+    -------
+    int
+        The new count.
+    """
+    if row >= len(column):
+        column.frombytes(bytes(column.itemsize * (row + 1 - len(column))))
+    column[row] += entryNum
+    return column[row]
+
+def get_count(column: array, row: int) -> int:
+    """
+    Get the count in a row of a column, 0 past its end.
+
+    Parameters
+    ----------
+    column : array
+        The counts, indexed by row.
+
+    row : int
+        The row from the IdTable.
+
+    Returns
+    -------
+    int
+        The count.
+    """
+    return column[row] if row < len(column) else 0
@@ -0,0 +1,447 @@
+import json
+import logging
+import os
+from array import array
+
+from linklogging.backgroundwriter import write_json_atomic
+from linklogging.idtable import IdTable, add_count, get_count
+from linklogging.leaderboard import Leaderboard
+from linklogging.statsbackend import StatsBackend
+from runtime.structuredlog import log_event
+
+log = logging.getLogger(__name__)
+
+class JsonBackend(StatsBackend):
+    """
+    Stats kept in memory and persisted as a JSON snapshot plus a journal.
+
+    Every change is appended to the journal as one compact record, which is cheap
+    however large the stats grow. The journal is periodically compacted into the
+    snapshot in log.json, which is replaced atomically, and on startup the snapshot
+    is loaded and any journal records it does not cover are replayed on top.
+
+    Records are applied to the data straight away and queued as lines, which
+    flush jobs append to the journal on the writer thread. Only the writer
+    thread touches the journal file.
+
+    In memory, each server and user ID has a row in an IdTable, and each
+    platform keeps its counts in arrays indexed by row. log.json keeps the
+    original layout of string IDs in a dict per platform, so older logs load
+    as they are and the file can still be read by older versions. The journal
+    position the snapshot covers is kept under "journal" as a dict, which older
+    versions skip like a platform with nothing fixed.
+
+    Totals across every platform are kept for each server and user as links are
+    fixed, along with a leaderboard of the highest, so the top servers and users
+    are read straight off rather than added up and sorted on every request.
+    """
+
+    # Journal records written before the journal is compacted into the snapshot
+    COMPACT_RECORDS = 50000
+    # Servers and users kept on each leaderboard, asking for more adds up every total instead
+    LEADERBOARD_SIZE = 25
+
+    def __init__(self, platforms, filepath="linklogging/log.json", journalpath="linklogging/log.journal"):
+        self.platforms = platforms
+        self.filepath = filepath
+        self.journalpath = journalpath
+        # "servers"/"users" -> rows for their IDs
+        self.ids = {"servers": IdTable(), "users": IdTable()}
+        # Platform name -> {"servers": counts by row, "users": counts by row, "links_fixed": int}
+        self.sections = {}
+        # IDs of users who turned reply notifications off
+        self.ignored = set()
+        self.journal = None
+        # Journal lines not yet handed to a flush job
+        self.lines = []
+        # Sequence number of the last journal record, and records since the last compaction
+        self.seq = 0
+        self.journaled = 0
+        # "servers"/"users" -> links fixed across all platforms by row, and their leaderboards
+        self.totals = {"servers": array("q"), "users": array("q")}
+        self.leaderboards = {"servers": Leaderboard(self.LEADERBOARD_SIZE), "users": Leaderboard(self.LEADERBOARD_SIZE)}
+
+    def load(self):
+        try:
+            with open(self.filepath, "r") as f:
+                data = json.load(f)
+            log_event(log, logging.INFO, "log_loaded", file=self.filepath)
+        except FileNotFoundError:
+            data = {}
+            # Expected the first time the bot runs, so not a warning
+            log_event(log, logging.INFO, "log_missing", file=self.filepath)
+        # Sequence number of the last journal record already in the snapshot, at the top level in earlier snapshots
+        journal = data.pop("journal", {})
+        self.seq = journal.get("seq", data.pop("journal_seq", 0))
+        self.ignored = {int(userID) for userID in data.pop("ignored", {})}
+        for kind in ("servers", "users"):
+            ids = IdTable({int(key) for value in data.values() for key in value[kind]})
+            self.ids[kind] = ids
+            # Only needed while loading, finding rows by search is slower
+            rows = {snowflake: row for row, snowflake in enumerate(ids.ids)}
+            for linkName, value in data.items():
+                column = self.section(linkName)[kind]
+                column.frombytes(bytes(column.itemsize * len(ids)))
+                for key, count in value[kind].items():
+                    column[rows[int(key)]] = count
+        for linkName, value in data.items():
+            self.section(linkName)["links_fixed"] = value["links_fixed"]
+        # Handlers added since the log was written have no section yet
+        for linkName in self.platforms:
+            self.section(linkName)
+        self.count_totals()
+
+        replayed = self.replay()
+        if replayed:
+            log_event(log, logging.INFO, "journal_replayed", records=replayed)
+        self.journal = open(self.journalpath, "a", encoding="utf-8")
+        self.journaled = replayed
+        if not os.path.exists(self.filepath):
+            self.write_snapshot()
+
+    def section(self, linkName):
+        """
+        Get the stats for a platform, adding an empty section if there is none.
+
+        Parameters
+        ----------
+        linkName : str
+            The name of the platform.
+
+        Returns
+        -------
+        dict
+            The platform's servers and users counts by row, and links_fixed.
+        """
+        section = self.sections.get(linkName)
+        if section is None:
+            section = {"servers": array("I"), "users": array("I"), "links_fixed": 0}
+            self.sections[linkName] = section
+        return section
+
+    def count_totals(self):
+        """
+        Add up the totals and fill the leaderboards from the sections, which replays then keep up to date.
+        """
+        for kind in ("servers", "users"):
+            totals = array("q", bytes(8 * len(self.ids[kind])))
+            for section in self.sections.values():
+                for row, count in enumerate(section[kind]):
+                    if count:
+                        totals[row] += count
+            leaderboard = Leaderboard(self.LEADERBOARD_SIZE)
+            for row, total in enumerate(totals):
+                leaderboard.offer(row, total)
+            self.totals[kind] = totals
+            self.leaderboards[kind] = leaderboard
+
+    def entries(self, linkName, kind):
+        """
+        Get the servers or users with links fixed on a platform.
+
+        Parameters
+        ----------
+        linkName : str
+            The name of the platform.
+
+        kind : str
+            "servers" or "users".
+
+        Returns
+        -------
+        Iterator[Tuple[int, int]]
+            (ID, links fixed) pairs.
+        """
+        ids = self.ids[kind].ids
+        return ((ids[row], count) for row, count in enumerate(self.sections[linkName][kind]) if count)
+
+    def replay(self):
+        """
+        Apply journal records newer than the snapshot to the data, cutting off a torn record at the end.
+
+        Returns
+        -------
+        int
+            The number of records replayed.
+        """
+        replayed = 0
+        # Bytes up to the end of the last whole record
+        intact = 0
+        try:
+            with open(self.journalpath, "rb") as f:
+                for line in f:
+                    try:
+                        # A record cut short by a crash mid-write has no newline, or isn't valid JSON
+                        if not line.endswith(b"\n"):
+                            raise ValueError("Record has no newline.")
+                        record = json.loads(line)
+                    except ValueError:
+                        break
+                    intact += len(line)
+                    seq = record[0]
+                    if seq <= self.seq:
+                        continue
+                    self.apply(record)
+                    self.seq = seq
+                    replayed += 1
+        except FileNotFoundError:
+            return 0
+        # Nothing after a torn record was written, but records appended to it would be lost with it
+        # on the next replay, so it is cut off before the journal is opened for appending
+        if os.path.getsize(self.journalpath) > intact:
+            log_event(log, logging.WARNING, "journal_truncated", file=self.journalpath, size=intact)
+            os.truncate(self.journalpath, intact)
+        return replayed
+
+    def apply(self, record):
+        """
+        Apply a single journal record to the data.
+
+        Parameters
+        ----------
+        record : list
+            The record, as written by write_record.
+        """
+        kind = record[1]
+        if kind == "fix":
+            serverID, userID, entryNum, linkName = record[2:]
+            section = self.section(linkName)
+            section["links_fixed"] += entryNum
+            self.add("servers", section, int(serverID), entryNum)
+            self.add("users", section, int(userID), entryNum)
+        elif kind == "ignore":
+            self.ignored.add(int(record[2]))
+        elif kind == "unignore":
+            self.ignored.discard(int(record[2]))
+
+    def add(self, kind, section, snowflake, entryNum):
+        """
+        Add links fixed for a server or user to a platform's counts and their total across all platforms.
+
+        Parameters
+        ----------
+        kind : str
+            "servers" or "users".
+
+        section : dict
+            The platform's stats.
+
+        snowflake : int
+            The ID of the server or user.
+
+        entryNum : int
+            The number of links fixed.
+        """
+        row = self.ids[kind].row(snowflake)
+        add_count(section[kind], row, entryNum)
+        self.leaderboards[kind].offer(row, add_count(self.totals[kind], row, entryNum))
+
+    def write_record(self, *fields):
+        """
+        Queue a record for the journal and apply it to the data.
+
+        Parameters
+        ----------
+        *fields
+            The record kind followed by its values.
+        """
+        self.seq += 1
+        self.journaled += 1
+        record = [self.seq, *fields]
+        self.lines.append(json.dumps(record, separators=(",", ":")) + "\n")
+        # Applied exactly as a replay of the record would be
+        self.apply(record)
+
+    def copy_data(self):
+        """
+        Copy the data so that a writer thread can serialise it while updates carry on.
+        The arrays are copied whole, which is far quicker than walking every entry.
+
+        Returns
+        -------
+        dict
+            The copied IDs, sections and ignored users, with the journal position they cover as journal_seq.
+        """
+        return {
+            "ids": {kind: array("Q", ids.ids) for kind, ids in self.ids.items()},
+            "sections": {linkName: {"servers": array("I", section["servers"]), "users": array("I", section["users"]),
+                                    "links_fixed": section["links_fixed"]}
+                         for linkName, section in self.sections.items()},
+            "ignored": list(self.ignored),
+            "journal_seq": self.seq,
+        }
+
+    def write_snapshot(self):
+        """
+        Write the data and the journal position it covers to the snapshot. Only called while loading.
+        """
+        write_json_atomic(self.filepath, to_log(self.copy_data()))
+
+    def prepare_flush(self):
+        """
+        Take the queued journal lines, and a snapshot if the journal is due to be compacted.
+
+        Returns
+        -------
+        callable or None
+            The job writing them out, or None if there is nothing to write.
+        """
+        lines, self.lines = self.lines, []
+        snapshot = None
+        if self.journaled >= self.COMPACT_RECORDS:
+            snapshot = self.copy_data()
+            self.journaled = 0
+        if not lines and snapshot is None:
+            return None
+        return lambda: self.write(lines, snapshot)
+
+    def write(self, lines, snapshot):
+        """
+        Append lines to the journal, then compact it if given a snapshot. Runs on the writer thread.
+
+        Parameters
+        ----------
+        lines : [str]
+            Journal lines, in order.
+
+        snapshot : dict or None
+            Data covering every journal record so far, to replace the journal with.
+        """
+        self.journal.write("".join(lines))
+        self.journal.flush()
+        if snapshot is not None:
+            write_json_atomic(self.filepath, to_log(snapshot))
+            # Records up to the snapshot's journal_seq are in it now, and skipped if the truncate never happens
+            self.journal.close()
+            self.journal = open(self.journalpath, "w", encoding="utf-8")
+
+    def prepare_close(self):
+        """
+        Take everything for a final compaction.
+
+        Returns
+        -------
+        callable
+            The job compacting the journal and closing it.
+        """
+        lines, self.lines = self.lines, []
+        snapshot = self.copy_data()
+        self.journaled = 0
+
+        def close():
+            self.write(lines, snapshot)
+            self.journal.close()
+        return close
+
+    def add_fixed(self, serverID, userID, entryNum, linkName):
+        self.write_record("fix", str(serverID), str(userID), entryNum, linkName)
+
+    def set_ignored(self, userID, ignored):
+        if (int(userID) in self.ignored) == ignored:
+            return False
+        self.write_record("ignore" if ignored else "unignore", str(userID))
+        return True
+
+    def is_ignored(self, userID):
+        return int(userID) in self.ignored
+
+    def platform_totals(self):
+        return {linkName: section["links_fixed"] for linkName, section in self.sections.items()}
+
+    def server_breakdown(self, serverID):
+        return self.breakdown("servers", int(serverID))
+
+    def user_breakdown(self, userID):
+        return self.breakdown("users", int(userID))
+
+    def breakdown(self, kind, key):
+        """
+        Get the links fixed for one server or user for each platform.
+
+        Parameters
+        ----------
+        kind : str
+            "servers" or "users".
+
+        key : int
+            The ID of the server or user.
+
+        Returns
+        -------
+        Dict[str, int]
+            Platform name -> links fixed, leaving out platforms with none.
+        """
+        row = self.ids[kind].find(key)
+        if row is None:
+            return {}
+        counts = {}
+        for linkName, section in self.sections.items():
+            count = get_count(section[kind], row)
+            if count:
+                counts[linkName] = count
+        return counts
+
+    def top_servers(self, limit):
+        return self.top("servers", limit)
+
+    def top_users(self, limit):
+        return self.top("users", limit)
+
+    def top(self, kind, limit):
+        """
+        Get the servers or users with the most links fixed across all platforms.
+
+        Parameters
+        ----------
+        kind : str
+            "servers" or "users".
+
+        limit : int or None
+            How many to get, or None for all of them.
+
+        Returns
+        -------
+        List[Tuple[int, int]]
+            (ID, links fixed) pairs, most links first.
+        """
+        if limit is not None and limit <= self.LEADERBOARD_SIZE:
+            top = self.leaderboards[kind].top(limit)
+        else:
+            top = sorted(enumerate(self.totals[kind]), key=lambda x: x[1], reverse=True)[:limit]
+        ids = self.ids[kind].ids
+        return [(ids[row], count) for row, count in top]
+
+    def platform_names(self):
+        """
+        Get the name of every platform with stats, including ones no longer handled.
+
+        Returns
+        -------
+        List[str]
+            The platform names.
+        """
+        return list(self.sections)
+
+def to_log(snapshot):
+    """
+    Lay out data copied by copy_data as log.json has always been, with string IDs in a dict per platform.
+
+    Parameters
+    ----------
+    snapshot : dict
+        The data returned by JsonBackend.copy_data.
+
+    Returns
+    -------
+    dict
+        The contents of log.json.
+    """
+    log = {}
+    for linkName, section in snapshot["sections"].items():
+        log[linkName] = {kind: {str(snapshot["ids"][kind][row]): count for row, count in enumerate(section[kind]) if count}
+                         for kind in ("users", "servers")}
+        log[linkName]["links_fixed"] = section["links_fixed"]
+    log["ignored"] = {str(userID): True for userID in snapshot["ignored"]}
+    # A dict, as older versions read every other top level key but "ignored" as a platform
+    log["journal"] = {"seq": snapshot["journal_seq"]}
+    return log
@@ -0,0 +1,68 @@
+from typing import Dict, List, Tuple
+
+class Leaderboard:
+    """
+    The highest totals seen, kept up to date as totals change.
+
+    Totals only ever grow, so an entry outside the board can only get onto it by
+    passing the lowest total on it, and one on it only leaves when something else
+    passes it. Most updates are a dict lookup and a comparison, and only a change
+    to who is on the board costs a scan of the board itself.
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        # Key -> total for everything on the board, at most size entries
+        self.entries: Dict[int, int] = {}
+        # The entry with the lowest total, first out when the board is full
+        self.lowest_key = None
+        self.lowest = 0
+
+    def offer(self, key: int, total: int):
+        """
+        Record a key's new total, putting it on the board if it is high enough.
+
+        Parameters
+        ----------
+        key : int
+            The row of the server or user.
+
+        total : int
+            Its total, never lower than the last one offered for it.
+        """
+        entries = self.entries
+        if key in entries:
+            entries[key] = total
+            if key == self.lowest_key:
+                self.find_lowest()
+        elif len(entries) < self.size:
+            entries[key] = total
+            if self.lowest_key is None or total < self.lowest:
+                self.lowest_key, self.lowest = key, total
+        elif total > self.lowest:
+            del entries[self.lowest_key]
+            entries[key] = total
+            self.find_lowest()
+
+    def find_lowest(self):
+        """
+        Find the entry with the lowest total on the board again.
+        """
+        self.lowest_key = min(self.entries, key=self.entries.__getitem__)
+        self.lowest = self.entries[self.lowest_key]
+
+    def top(self, limit: int) -> List[Tuple[int, int]]:
+        """
+        Get the highest totals.
+
+        Parameters
+        ----------
+        limit : int
+            How many to get, up to the size of the board.
+
+        Returns
+        -------
+        List[Tuple[int, int]]
+            (key, total) pairs, highest first.
+        """
+        return sorted(self.entries.items(), key=lambda x: x[1], reverse=True)[:limit]
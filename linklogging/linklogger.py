@@ -1,103 +1,164 @@
 import asyncio
-import json
+import os
+import time
 
 from linkhandlers.instagramlink import InstagramLink
 from linkhandlers.tiktoklink import TiktokLink
 from linkhandlers.pinterestlink import PinterestLink
 from linkhandlers.twitterlink import TwitterLink
+from linklogging.backgroundwriter import read_json, write_json_atomic
+from linklogging.jsonbackend import JsonBackend
+from linklogging.sqlitebackend import SqliteBackend
+from linklogging.usagehistory import UsageHistory
+
+# Seconds between saves of the usage history, which is also saved on close
+HISTORY_SAVE_INTERVAL = 3600
 
 class LinkLogger:
-    def __init__(self):
-        self.filepath = "linklogging/log.json"
+    """
+    Usage statistics for fixed links, stored in a pluggable StatsBackend.
+
+    Updates are added up in an accumulator without taking the lock, and merged
+    into the backend as one batch under the lock before every flush and read,
+    so reads always see every update. Loading, flushing and, for blocking
+    backends, queries run on the BackgroundWriter thread.
+
+    Fixes are also counted over time in a UsageHistory, kept in memory and saved
+    to its own file now and then, whatever the backend.
+    """
+
+    def __init__(self, writer, backend="json", database="linklogging/log.db", history="linklogging/history.json",
+                 directory="linklogging", shared=False):
+        """
+        Parameters
+        ----------
+        writer : BackgroundWriter
+            Runs the backend's disk work off the event loop.
+
+        backend : str
+            The storage backend to use, "json" or "sqlite".
+
+        database : str
+            The database file for the sqlite backend.
+
+        history : str
+            The file to save usage history to.
+
+        directory : str
+            The state directory, where the JSON backend keeps log.json and its journal.
+
+        shared : bool
+            Whether processes running other shards use the same sqlite database.
+        """
         self.lock = asyncio.Lock()
-        self.data = {}
+        self.writer = writer
+        # (serverID, userID, linkName) -> links fixed since the last merge
+        self.pending = {}
+        self.history = UsageHistory()
+        self.history_path = history
+        self.history_saved = time.monotonic()
         self.linkHandlers = [TwitterLink(), InstagramLink(), TiktokLink(), PinterestLink()]
+        platforms = [handler.name for handler in self.linkHandlers]
+        jsonpath = os.path.join(directory, "log.json")
+        journalpath = os.path.join(directory, "log.journal")
+        if backend == "json":
+            self.backend = JsonBackend(platforms, jsonpath, journalpath)
+        elif backend == "sqlite":
+            # Stats in log.json are migrated from where the JSON backend would have kept them
+            self.backend = SqliteBackend(platforms, database, jsonpath, journalpath, shared)
+        else:
+            raise ValueError(f"Unknown log backend '{backend}', expected 'json' or 'sqlite'.")
 
     async def load(self):
         """
-        Load the logger data from the JSON file.
+        Load the logger data from the backend.
         """
         async with self.lock:
-            try:
-                with open(self.filepath, "r") as f:
-                    self.data = json.load(f)
-                # Handlers added since the log was written have no section yet
-                for handler in self.linkHandlers:
-                    self.data.setdefault(handler.name, {"users": {}, "servers": {}, "links_fixed": 0})
-                print("Log loaded successfully.")
-            except FileNotFoundError:
-                self.data = {
-                    handler.name: {"users": {}, "servers": {}, "links_fixed": 0} for handler in self.linkHandlers
-                }
-                self.data["ignored"] = {}
-                with open(self.filepath, "w") as f:
-                    json.dump(self.data, f, indent=4)
-                print("Log file was not found, expected 'linklogging/log.json'. A new log file has been created. If this is the first time running, ignore this message.")
+            await self.writer.run("stats load", self.backend.load)
+        contents = await self.writer.run("history load", read_json, self.history_path, "history_unreadable")
+        # Added to the fixes counted while loading rather than replacing them
+        if contents is not None:
+            self.history.from_json(contents)
 
     async def dump(self):
         """
-        Save the current state of the logger to the JSON file.
+        Persist recent changes to the backend's storage.
         """
         async with self.lock:
-            with open(self.filepath, "w") as f:
-                json.dump(self.data, f, indent=4)
-
-    async def add_to_server(self, serverID, entryNum, linkName):
-        """        
-        Add an entry to the server statistics for a specific link type.
-        
-        Parameters
-        ----------
-        serverID : str
-            The ID of the server.
-
-        entryNum : int
-            The number of entries to add for the server.
+            with self.writer.on_loop("stats flush"):
+                self.merge()
+                job = self.backend.prepare_flush()
+        # The writer runs jobs in order, so later flushes and queries still land after this one
+        if job is not None:
+            await self.writer.run("stats flush", job)
+        if time.monotonic() - self.history_saved >= HISTORY_SAVE_INTERVAL:
+            await self.save_history()
 
-        linkName : str
-            The name of the platform associated with the link (e.g., "twitter", "instagram").
+    async def close(self):
+        """
+        Persist everything and close the backend's storage.
         """
-        serverID = str(serverID)
         async with self.lock:
-            if serverID not in self.data[linkName]["servers"]:
-                self.data[linkName]["servers"][serverID] = 0
-            self.data[linkName]["servers"][serverID] += entryNum
-
-    async def add_to_user(self, userID, entryNum, linkName):
-        """        
-        Add an entry to the user statistics for a specific link type.
-        
-        Parameters
-        ----------
-        userID : str
-            The ID of the user.
+            with self.writer.on_loop("stats close"):
+                self.merge()
+                job = self.backend.prepare_close()
+        await self.writer.run("stats close", job)
+        await self.save_history()
 
-        entryNum : int
-            The number of entries to add for the user.
+    async def save_history(self):
+        """
+        Save the usage history.
+        """
+        with self.writer.on_loop("history save"):
+            contents = self.history.to_json()
+        self.history_saved = time.monotonic()
+        await self.writer.run("history save", write_json_atomic, self.history_path, contents)
 
-        linkName : str
-            The name of the platform associated with the link (e.g., "twitter", "instagram").
+    @property
+    def supports_user_server(self):
         """
-        userID = str(userID)
-        async with self.lock:
-            if userID not in self.data[linkName]["users"]:
-                self.data[linkName]["users"][userID] = 0
-            self.data[linkName]["users"][userID] += entryNum
+        Whether the backend records which server each user's links were fixed in.
+        """
+        return self.backend.supports_user_server
+
+    def merge(self):
+        """
+        Add the accumulated updates to the backend. Call with the lock held.
+        """
+        pending, self.pending = self.pending, {}
+        for (serverID, userID, linkName), entryNum in pending.items():
+            self.backend.add_fixed(serverID, userID, entryNum, linkName)
 
-    async def add_total_fixed(self, entryNum, linkName):
+    async def call(self, name, function, *args, flush=True):
         """
-        Add to the total number of fixed links for a specific link type.
-        
+        Call a backend method, on the writer thread if the backend blocks.
+
         Parameters
         ----------
-        entryNum : int
-            The number of entries to add to the total fixed count.
+        name : str
+            The job name to record the writer's time against.
 
-        linkName : str
-            The name of the platform associated with the link (e.g., "twitter", "instagram").
+        function : callable
+            The backend method, or a function calling several.
+
+        *args
+            Arguments for the function.
+
+        flush : bool
+            Whether to flush updates first, so a query reading fixed links sees every one so far.
+
+        Returns
+        -------
+        Any
+            Whatever the function returns.
         """
-        async with self.lock:
-            self.data[linkName]["links_fixed"] += entryNum
+        if not self.backend.blocking:
+            async with self.lock:
+                self.merge()
+                return function(*args)
+        if flush:
+            await self.dump()
+        return await self.writer.run(name, function, *args)
 
     async def add_ignored(self, userID):
         """
@@ -113,17 +174,12 @@ class LinkLogger:
         bool
             True if the user was successfully added, False if they were already in the list.
         """
-        userID = str(userID)
-        async with self.lock:
-            if userID not in self.data["ignored"]:
-                self.data["ignored"][userID] = True
-                return True
-            return False
+        return await self.call("stats ignored", self.backend.set_ignored, userID, True, flush=False)
 
     async def rem_ignored(self, userID):
         """
         Remove a user from the ignored notifications list.
-        
+
         Parameters
         ----------
         userID : str
@@ -134,50 +190,30 @@ class LinkLogger:
         bool
             True if the user was successfully removed, False if they were not in the list.
         """
-        userID = str(userID)
-        async with self.lock:
-            if userID in self.data["ignored"]:
-                self.data["ignored"].pop(userID, None)
-                return True
-            return False
+        return await self.call("stats ignored", self.backend.set_ignored, userID, False, flush=False)
 
-    async def get_global_stats(self):
-        """Get global statistics for all links fixed."""
-        async with self.lock:
-            # Make a copy of the data while holding the lock
-            data_snapshot = self.data.copy()
-        
-        # Calculate statistics using the snapshot (outside the lock)
-        server_totals = {}
-        user_totals = {}
-        total_links_fixed = 0
-        
-        for linkName in data_snapshot:
-            if linkName == "ignored":
-                continue
-            link_data = data_snapshot[linkName]
-            # Add to total links fixed
-            total_links_fixed += link_data.get('links_fixed', 0)
-            # Aggregate server stats
-            for server_id, count in link_data.get("servers", {}).items():
-                server_totals[server_id] = server_totals.get(server_id, 0) + count
-            # Aggregate user stats
-            for user_id, count in link_data.get("users", {}).items():
-                user_totals[user_id] = user_totals.get(user_id, 0) + count
-
-        top_servers = sorted(server_totals.items(), key=lambda x: x[1], reverse=True)
-        top_users = sorted(user_totals.items(), key=lambda x: x[1], reverse=True)
-
-        return {
-            'total_links_fixed': total_links_fixed,
-            'top_servers': top_servers,
-            'top_users': top_users
-        }
+    async def get_global_stats(self, limit=5):
+        """
+        Get global statistics for all links fixed.
+
+        Parameters
+        ----------
+        limit : int
+            How many of the top servers and users to include.
+        """
+        def global_stats():
+            return {
+                'total_links_fixed': sum(self.backend.platform_totals().values()),
+                'top_servers': self.backend.top_servers(limit),
+                'top_users': self.backend.top_users(limit)
+            }
+
+        return await self.call("stats query", global_stats)
 
     async def get_all_server_stats(self, serverID):
         """
         Get the total number of entries for a specific server across all link types.
-        
+
         Parameters
         ----------
         serverID : str
@@ -187,16 +223,7 @@ class LinkLogger:
         int
             The total number of entries for the server across all link types.
         """
-        count = 0
-        for handler in self.linkHandlers:
-            linkName = handler.name
-            serverID = str(serverID)
-            async with self.lock:
-                if serverID not in self.data[linkName]["servers"]:
-                    pass
-                else:
-                    count += self.data[linkName]["servers"][serverID]
-        return count
+        return sum((await self.get_server_breakdown(serverID)).values())
 
     async def get_all_user_stats(self, userID):
         """
@@ -211,17 +238,8 @@ class LinkLogger:
         int
             The total number of entries for the user across all link types.
         """
-        count = 0
-        for handler in self.linkHandlers:
-            linkName = handler.name
-            userID = str(userID)
-            async with self.lock:
-                if userID not in self.data[linkName]["users"]:
-                    pass
-                else:
-                    count += self.data[linkName]["users"][userID]
-        return count
-    
+        return sum((await self.get_user_breakdown(userID)).values())
+
     async def get_total_fixed(self):
         """
         Get the total number of links fixed across all users and servers.
@@ -231,12 +249,70 @@ class LinkLogger:
         int
             The total number of links fixed.
         """
-        total = 0
-        for handler in self.linkHandlers:
-            linkName = handler.name
-            async with self.lock:
-                total += self.data[linkName]['links_fixed']
-        return total
+        return sum((await self.get_platform_totals()).values())
+
+    async def get_platform_totals(self):
+        """
+        Get the number of links fixed for each platform.
+
+        Returns
+        -------
+        dict
+            Platform name -> links fixed.
+        """
+        return await self.call("stats query", self.backend.platform_totals)
+
+    async def get_server_breakdown(self, serverID):
+        """
+        Get the number of links fixed in a server for each platform.
+
+        Parameters
+        ----------
+        serverID : str
+            The ID of the server.
+
+        Returns
+        -------
+        dict
+            Platform name -> links fixed, leaving out platforms with none.
+        """
+        return await self.call("stats query", self.backend.server_breakdown, serverID)
+
+    async def get_user_breakdown(self, userID):
+        """
+        Get the number of links fixed for a user for each platform.
+
+        Parameters
+        ----------
+        userID : str
+            The ID of the user.
+
+        Returns
+        -------
+        dict
+            Platform name -> links fixed, leaving out platforms with none.
+        """
+        return await self.call("stats query", self.backend.user_breakdown, userID)
+
+    async def get_user_server_breakdown(self, userID, serverID):
+        """
+        Get the number of links fixed for a user in one server for each platform.
+
+        Parameters
+        ----------
+        userID : str
+            The ID of the user.
+
+        serverID : str
+            The ID of the server.
+
+        Returns
+        -------
+        dict
+            Platform name -> links fixed, leaving out platforms with none. Check supports_user_server
+            first, backends that don't record users per server have nothing to give.
+        """
+        return await self.call("stats query", self.backend.user_server_breakdown, userID, serverID)
 
     async def get_ignored(self, userID):
         """
@@ -252,16 +328,39 @@ class LinkLogger:
         bool
             True if the user is in the ignored list, False otherwise.
         """
-        userID = str(userID)
-        async with self.lock:
-            if userID not in self.data["ignored"]:
-                return False
-            return True
+        if self.backend.shared:
+            # Other processes may have changed it, so it's read from the database, though updates needn't be flushed
+            return await self.call("stats ignored", self.backend.is_ignored, userID, flush=False)
+        # Otherwise kept in memory, so checked straight away
+        return self.backend.is_ignored(userID)
+
+    async def get_usage(self, seconds, kind=None, key=None):
+        """
+        Get the links fixed over a recent window.
+
+        Parameters
+        ----------
+        seconds : int
+            How far back to look.
+
+        kind : str
+            "servers" or "users" to count a single server or user, or None for everything.
+
+        key : int
+            The ID of the server or user.
+
+        Returns
+        -------
+        dict
+            "total" links fixed, "platforms" name -> links fixed (only when counting everything),
+            and "peaks" "minute"/"hour"/"day" -> most links fixed in one bucket of that size.
+        """
+        return self.history.window(seconds, kind, key)
 
     async def update(self, serverID, userID, entryNum, linkName):
         """
         Update the logger with a new entry for both server and user statistics.
-        
+
         Parameters
         ----------
         serverID : str
@@ -276,6 +375,7 @@ class LinkLogger:
         linkName : str
             The name of the platform associated with the link (e.g., "twitter", "instagram").
         """
-        await self.add_to_server(serverID, entryNum, linkName)
-        await self.add_to_user(userID, entryNum, linkName)
-        await self.add_total_fixed(entryNum, linkName)
\ No newline at end of file
+        # Nothing awaits between reading and writing the count, so no lock is needed on the event loop
+        key = (serverID, userID, linkName)
+        self.pending[key] = self.pending.get(key, 0) + entryNum
+        self.history.record(int(serverID), int(userID), entryNum, linkName)
@@ -0,0 +1,283 @@
+import logging
+import os
+import sqlite3
+import time
+
+from linklogging.jsonbackend import JsonBackend
+from linklogging.statsbackend import StatsBackend
+from runtime.structuredlog import log_event
+
+# Day given to stats migrated from log.json, which never recorded when links were fixed
+MIGRATED_DAY = "0000-00-00"
+
+log = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS fixes (
+    day TEXT NOT NULL,
+    platform TEXT NOT NULL,
+    server_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (day, platform, server_id, user_id)
+);
+CREATE INDEX IF NOT EXISTS fixes_server ON fixes (server_id, platform);
+CREATE INDEX IF NOT EXISTS fixes_user ON fixes (user_id, platform);
+CREATE INDEX IF NOT EXISTS fixes_platform ON fixes (platform);
+CREATE TABLE IF NOT EXISTS server_totals (
+    server_id INTEGER PRIMARY KEY,
+    total INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS server_totals_total ON server_totals (total);
+CREATE TABLE IF NOT EXISTS user_totals (
+    user_id INTEGER PRIMARY KEY,
+    total INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS user_totals_total ON user_totals (total);
+CREATE TABLE IF NOT EXISTS platform_totals (
+    platform TEXT PRIMARY KEY,
+    total INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS ignored (
+    user_id INTEGER PRIMARY KEY
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+class SqliteBackend(StatsBackend):
+    """
+    Stats kept in an SQLite database, one row per platform, server and user for each day.
+
+    Fixed links are buffered and inserted in a single batch on each flush, and
+    LinkLogger flushes before reads so they always see every update. Queries for
+    a server, user or platform go through an index rather than walking every
+    entry. The connection is opened, used and closed on the writer thread only.
+
+    log.json never paired users with the servers they posted in, so stats
+    migrated from it are stored as server rows with a user_id of 0 and user rows
+    with a server_id of 0. Server and platform totals are counted from rows with
+    a known server so the migrated user rows are not counted twice.
+
+    Totals across every platform are kept for each server and user in their
+    own tables, added to with each batch of fixed links, so the top servers and
+    users are read off an index on the total rather than added up from every
+    day's rows on each request. Each platform's total is kept the same way.
+    """
+
+    blocking = True
+    supports_user_server = True
+
+    def __init__(self, platforms, filepath="linklogging/log.db", jsonpath="linklogging/log.json",
+                 journalpath="linklogging/log.journal", shared=False):
+        self.platforms = platforms
+        # Processes running other shards change the ignored list too, so it's read from the table rather than memory
+        self.shared = shared
+        self.filepath = filepath
+        # Where to find stats to migrate from the JSON backend
+        self.jsonpath = jsonpath
+        self.journalpath = journalpath
+        self.connection = None
+        # (day, platform, server_id, user_id) -> links fixed since the last flush
+        self.pending = {}
+        # IDs of users who turned reply notifications off, kept in memory as they're checked on every reply
+        self.ignored = set()
+
+    def load(self):
+        self.connection = sqlite3.connect(self.filepath)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        # With WAL, NORMAL only risks the last commits on power loss, never corruption
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(SCHEMA)
+        migrated = self.connection.execute("SELECT value FROM meta WHERE key = 'migrated'").fetchone()
+        if migrated is None and os.path.exists(self.jsonpath):
+            self.migrate_json()
+        self.count_totals()
+        if not self.shared:
+            self.ignored = {row[0] for row in self.query("SELECT user_id FROM ignored")}
+        log_event(log, logging.INFO, "log_database_loaded", file=self.filepath)
+
+    def migrate_json(self):
+        """
+        Import the stats from the JSON backend's snapshot and journal. Run once, when the database is first created.
+        """
+        source = JsonBackend(self.platforms, self.jsonpath, self.journalpath)
+        source.load()
+        # Processes running different shards share the database, and may all start on a fresh one
+        self.connection.execute("BEGIN IMMEDIATE")
+        if self.connection.execute("SELECT value FROM meta WHERE key = 'migrated'").fetchone() is not None:
+            self.connection.rollback()
+            source.journal.close()
+            return
+        rows = []
+        for linkName in source.platform_names():
+            rows.extend((MIGRATED_DAY, linkName, serverID, 0, count) for serverID, count in source.entries(linkName, "servers"))
+            rows.extend((MIGRATED_DAY, linkName, 0, userID, count) for userID, count in source.entries(linkName, "users"))
+        with self.connection:
+            self.connection.executemany(
+                "INSERT INTO fixes (day, platform, server_id, user_id, count) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (day, platform, server_id, user_id) DO UPDATE SET count = count + excluded.count", rows)
+            self.connection.executemany("INSERT OR IGNORE INTO ignored (user_id) VALUES (?)",
+                                        ((userID,) for userID in source.ignored))
+            self.connection.execute("INSERT INTO meta (key, value) VALUES ('migrated', ?)", (source.filepath,))
+        # Left in place, untouched, in case of a rollback to the JSON backend
+        source.journal.close()
+        log_event(log, logging.INFO, "stats_migrated", entries=len(rows), file=source.filepath)
+
+    def count_totals(self):
+        """
+        Add up the totals from every fixed link, once, for databases from before totals were kept.
+        """
+        self.backfill("totals", [
+            "DELETE FROM server_totals",
+            "DELETE FROM user_totals",
+            "INSERT INTO server_totals (server_id, total) "
+            "SELECT server_id, SUM(count) FROM fixes WHERE server_id != 0 GROUP BY server_id",
+            "INSERT INTO user_totals (user_id, total) "
+            "SELECT user_id, SUM(count) FROM fixes WHERE user_id != 0 GROUP BY user_id",
+        ])
+        # Platform totals came later, so databases may have the others already
+        self.backfill("platform_totals", [
+            "DELETE FROM platform_totals",
+            "INSERT INTO platform_totals (platform, total) "
+            "SELECT platform, SUM(count) FROM fixes WHERE server_id != 0 GROUP BY platform",
+        ])
+
+    def backfill(self, key, statements):
+        """
+        Run statements filling a totals table unless they've been run before, as recorded under a key in meta.
+
+        Parameters
+        ----------
+        key : str
+            The key in meta.
+
+        statements : [str]
+            The statements, run in one transaction.
+        """
+        # Processes sharing the database may start at once, and one may already be adding to the totals
+        self.connection.execute("BEGIN IMMEDIATE")
+        if self.connection.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone() is not None:
+            self.connection.rollback()
+            return
+        with self.connection:
+            for statement in statements:
+                self.connection.execute(statement)
+            self.connection.execute("INSERT INTO meta (key, value) VALUES (?, '1')", (key,))
+
+    def prepare_flush(self):
+        if not self.pending:
+            return None
+        pending, self.pending = self.pending, {}
+        return lambda: self.insert(pending)
+
+    def insert(self, pending):
+        """
+        Insert buffered fixed links in one transaction. Runs on the writer thread.
+
+        Parameters
+        ----------
+        pending : dict
+            (day, platform, server_id, user_id) -> links fixed.
+        """
+        rows = [(*key, count) for key, count in pending.items()]
+        servers = {}
+        users = {}
+        platforms = {}
+        for (day, linkName, serverID, userID), count in pending.items():
+            servers[serverID] = servers.get(serverID, 0) + count
+            users[userID] = users.get(userID, 0) + count
+            if serverID != 0:
+                platforms[linkName] = platforms.get(linkName, 0) + count
+        with self.connection:
+            self.connection.executemany(
+                "INSERT INTO fixes (day, platform, server_id, user_id, count) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (day, platform, server_id, user_id) DO UPDATE SET count = count + excluded.count", rows)
+            self.connection.executemany(
+                "INSERT INTO server_totals (server_id, total) VALUES (?, ?) "
+                "ON CONFLICT (server_id) DO UPDATE SET total = total + excluded.total", servers.items())
+            self.connection.executemany(
+                "INSERT INTO user_totals (user_id, total) VALUES (?, ?) "
+                "ON CONFLICT (user_id) DO UPDATE SET total = total + excluded.total", users.items())
+            self.connection.executemany(
+                "INSERT INTO platform_totals (platform, total) VALUES (?, ?) "
+                "ON CONFLICT (platform) DO UPDATE SET total = total + excluded.total", platforms.items())
+
+    def prepare_close(self):
+        pending, self.pending = self.pending, {}
+
+        def close():
+            if pending:
+                self.insert(pending)
+            self.connection.close()
+            self.connection = None
+        return close
+
+    def add_fixed(self, serverID, userID, entryNum, linkName):
+        key = (time.strftime("%Y-%m-%d", time.gmtime()), linkName, int(serverID), int(userID))
+        self.pending[key] = self.pending.get(key, 0) + entryNum
+
+    def set_ignored(self, userID, ignored):
+        with self.connection:
+            if ignored:
+                cursor = self.connection.execute("INSERT OR IGNORE INTO ignored (user_id) VALUES (?)", (int(userID),))
+            else:
+                cursor = self.connection.execute("DELETE FROM ignored WHERE user_id = ?", (int(userID),))
+        if ignored:
+            self.ignored.add(int(userID))
+        else:
+            self.ignored.discard(int(userID))
+        return cursor.rowcount > 0
+
+    def is_ignored(self, userID):
+        if self.shared:
+            return self.query("SELECT 1 FROM ignored WHERE user_id = ?", (int(userID),)) != []
+        return int(userID) in self.ignored
+
+    def query(self, sql, parameters=()):
+        """
+        Run a read query.
+
+        Parameters
+        ----------
+        sql : str
+            The query.
+
+        parameters : tuple
+            Values for the query's placeholders.
+
+        Returns
+        -------
+        list
+            The rows returned.
+        """
+        return self.connection.execute(sql, parameters).fetchall()
+
+    def platform_totals(self):
+        rows = self.query("SELECT platform, total FROM platform_totals")
+        totals = {linkName: 0 for linkName in self.platforms}
+        totals.update(rows)
+        return totals
+
+    def server_breakdown(self, serverID):
+        return dict(self.query("SELECT platform, SUM(count) FROM fixes WHERE server_id = ? GROUP BY platform",
+                               (int(serverID),)))
+
+    def user_breakdown(self, userID):
+        return dict(self.query("SELECT platform, SUM(count) FROM fixes WHERE user_id = ? GROUP BY platform",
+                               (int(userID),)))
+
+    def user_server_breakdown(self, userID, serverID):
+        return dict(self.query("SELECT platform, SUM(count) FROM fixes WHERE user_id = ? AND server_id = ? "
+                               "GROUP BY platform", (int(userID), int(serverID))))
+
+    def top_servers(self, limit):
+        # LIMIT -1 is no limit
+        return self.query("SELECT server_id, total FROM server_totals ORDER BY total DESC LIMIT ?",
+                          (-1 if limit is None else limit,))
+
+    def top_users(self, limit):
+        return self.query("SELECT user_id, total FROM user_totals ORDER BY total DESC LIMIT ?",
+                          (-1 if limit is None else limit,))
@@ -0,0 +1,211 @@
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional, Tuple
+
+class StatsBackend(ABC):
+    """Abstract base class for the storage behind LinkLogger.
+
+    Backends are not safe to call concurrently, LinkLogger serialises every call
+    through its lock. User and server IDs may be passed as str or int.
+
+    Anything that touches disk runs on LinkLogger's BackgroundWriter thread:
+    load, the jobs returned by prepare_flush and prepare_close, and, for
+    backends that set blocking, every other method apart from add_fixed and,
+    unless the backend is shared, is_ignored.
+    """
+
+    # True if queries and set_ignored touch disk, so must run on the writer thread
+    blocking = False
+    # True if the backend records which server each user's links were fixed in, for user_server_breakdown
+    supports_user_server = False
+    # True if other processes write to the same storage, so is_ignored must read it and run on the writer thread
+    shared = False
+
+    @abstractmethod
+    def load(self):
+        """
+        Load stored stats, creating empty storage if there is none yet. Runs on the writer thread.
+        """
+        pass
+
+    @abstractmethod
+    def prepare_flush(self):
+        """
+        Take what needs persisting since the last flush. Called on the event loop.
+
+        Returns
+        -------
+        callable or None
+            A job that writes it out, to run on the writer thread, or None if there is nothing to write.
+        """
+        pass
+
+    @abstractmethod
+    def prepare_close(self):
+        """
+        Take everything that needs persisting before the backend is closed. Called on the event loop.
+
+        Returns
+        -------
+        callable
+            A job that writes it out and releases any open files or connections, to run on the writer thread.
+        """
+        pass
+
+    @abstractmethod
+    def add_fixed(self, serverID, userID, entryNum: int, linkName: str):
+        """
+        Record links fixed for a user in a server. Called on the event loop, so must not touch disk.
+
+        Parameters
+        ----------
+        serverID : str or int
+            The ID of the server.
+
+        userID : str or int
+            The ID of the user.
+
+        entryNum : int
+            The number of links fixed.
+
+        linkName : str
+            The name of the platform associated with the links.
+        """
+        pass
+
+    @abstractmethod
+    def set_ignored(self, userID, ignored: bool) -> bool:
+        """
+        Add a user to or remove a user from the ignored notifications list.
+
+        Parameters
+        ----------
+        userID : str or int
+            The ID of the user.
+
+        ignored : bool
+            True to add the user to the list, False to remove them.
+
+        Returns
+        -------
+        bool
+            True if the list changed, False if the user was already in the requested state.
+        """
+        pass
+
+    @abstractmethod
+    def is_ignored(self, userID) -> bool:
+        """
+        Check if a user is in the ignored notifications list. Called on the event loop for every
+        reply to a fix, so must not touch disk, unless the backend is shared.
+
+        Parameters
+        ----------
+        userID : str or int
+            The ID of the user.
+
+        Returns
+        -------
+        bool
+            True if the user is in the ignored list.
+        """
+        pass
+
+    @abstractmethod
+    def platform_totals(self) -> Dict[str, int]:
+        """
+        Get the number of links fixed for each platform.
+
+        Returns
+        -------
+        Dict[str, int]
+            Platform name -> links fixed.
+        """
+        pass
+
+    @abstractmethod
+    def server_breakdown(self, serverID) -> Dict[str, int]:
+        """
+        Get the number of links fixed in a server for each platform.
+
+        Parameters
+        ----------
+        serverID : str or int
+            The ID of the server.
+
+        Returns
+        -------
+        Dict[str, int]
+            Platform name -> links fixed, leaving out platforms with none.
+        """
+        pass
+
+    @abstractmethod
+    def user_breakdown(self, userID) -> Dict[str, int]:
+        """
+        Get the number of links fixed for a user for each platform.
+
+        Parameters
+        ----------
+        userID : str or int
+            The ID of the user.
+
+        Returns
+        -------
+        Dict[str, int]
+            Platform name -> links fixed, leaving out platforms with none.
+        """
+        pass
+
+    def user_server_breakdown(self, userID, serverID) -> Dict[str, int]:
+        """
+        Get the number of links fixed for a user in one server for each platform.
+        Only called on backends that set supports_user_server, others have nothing to give.
+
+        Parameters
+        ----------
+        userID : str or int
+            The ID of the user.
+
+        serverID : str or int
+            The ID of the server.
+
+        Returns
+        -------
+        Dict[str, int]
+            Platform name -> links fixed, leaving out platforms with none.
+        """
+        return {}
+
+    @abstractmethod
+    def top_servers(self, limit: Optional[int]) -> List[Tuple[int, int]]:
+        """
+        Get the servers with the most links fixed in them, across all platforms.
+
+        Parameters
+        ----------
+        limit : int or None
+            How many servers to get, or None for all of them.
+
+        Returns
+        -------
+        List[Tuple[int, int]]
+            (server ID, links fixed) pairs, most links first.
+        """
+        pass
+
+    @abstractmethod
+    def top_users(self, limit: Optional[int]) -> List[Tuple[int, int]]:
+        """
+        Get the users with the most links fixed for them, across all platforms.
+
+        Parameters
+        ----------
+        limit : int or None
+            How many users to get, or None for all of them.
+
+        Returns
+        -------
+        List[Tuple[int, int]]
+            (user ID, links fixed) pairs, most links first.
+        """
+        pass
@@ -0,0 +1,225 @@
+import time
+from collections import deque
+from typing import Optional
+
+# (name, bucket width in seconds, buckets kept) from finest to coarsest
+TIERS = (("minute", 60, 120), ("hour", 3600, 168), ("day", 86400, 90))
+# Servers and users kept in each hourly and daily bucket, the rest only count towards its totals
+BUCKET_KEYS = 100
+
+class UsageHistory:
+    """
+    Links fixed over time, per platform, server and user, in time buckets.
+
+    Fixes are counted in per minute buckets. Once a bucket is older than its tier
+    keeps, it is merged into the bucket of the next tier covering it, minutes into
+    hours and hours into days, and days past the last tier are dropped, so every
+    fix is counted in exactly one bucket and the number of buckets never grows.
+    Hourly and daily buckets are downsampled to their busiest servers and users,
+    while their totals and platform counts stay exact.
+
+    Recording a fix is a few dict updates, plus a rollup once a minute.
+    """
+
+    def __init__(self):
+        # One deque of buckets per tier, oldest first
+        self.tiers = [deque() for _ in TIERS]
+        # The minute bucket fixes are recorded in
+        self.current = None
+
+    def record(self, serverID: int, userID: int, entryNum: int, linkName: str, now: Optional[float] = None):
+        """
+        Count links fixed for a user in a server.
+
+        Parameters
+        ----------
+        serverID : int
+            The ID of the server.
+
+        userID : int
+            The ID of the user.
+
+        entryNum : int
+            The number of links fixed.
+
+        linkName : str
+            The name of the platform associated with the links.
+
+        now : float
+            The time of the fix, defaults to the current time.
+        """
+        if now is None:
+            now = time.time()
+        start = int(now) // 60 * 60
+        bucket = self.current
+        if bucket is None or bucket["start"] != start:
+            bucket = self.open(start)
+        bucket["total"] += entryNum
+        platforms, servers, users = bucket["platforms"], bucket["servers"], bucket["users"]
+        platforms[linkName] = platforms.get(linkName, 0) + entryNum
+        servers[serverID] = servers.get(serverID, 0) + entryNum
+        users[userID] = users.get(userID, 0) + entryNum
+
+    def open(self, start: int) -> dict:
+        """
+        Start a new minute bucket, rolling up any buckets that have aged out of their tier.
+
+        Parameters
+        ----------
+        start : int
+            The unix time the minute starts.
+
+        Returns
+        -------
+        dict
+            The new bucket.
+        """
+        self.roll(start)
+        self.current = new_bucket(start)
+        self.tiers[0].append(self.current)
+        return self.current
+
+    def roll(self, now: float):
+        """
+        Merge buckets older than their tier keeps into the next tier, and drop those past the last.
+
+        Parameters
+        ----------
+        now : float
+            The current unix time.
+        """
+        for index, (_, width, kept) in enumerate(TIERS):
+            tier = self.tiers[index]
+            while tier and tier[0]["start"] <= now - width * kept:
+                bucket = tier.popleft()
+                if index + 1 == len(TIERS):
+                    continue
+                next_tier = self.tiers[index + 1]
+                start = bucket["start"] // TIERS[index + 1][1] * TIERS[index + 1][1]
+                if not next_tier or next_tier[-1]["start"] != start:
+                    next_tier.append(new_bucket(start))
+                merge(next_tier[-1], bucket)
+
+    def window(self, seconds: int, kind: Optional[str] = None, key: Optional[int] = None, now: Optional[float] = None) -> dict:
+        """
+        Add up the links fixed over a recent window.
+
+        Parameters
+        ----------
+        seconds : int
+            How far back to look. Coarser buckets are counted whole if they start inside the window.
+
+        kind : str
+            "servers" or "users" to count a single server or user, or None for everything.
+
+        key : int
+            The ID of the server or user.
+
+        now : float
+            The end of the window, defaults to the current time.
+
+        Returns
+        -------
+        dict
+            "total" links fixed, "platforms" name -> links fixed (only when counting everything),
+            and "peaks" tier name -> most links fixed in one of its buckets.
+        """
+        if now is None:
+            now = time.time()
+        self.roll(now)
+        since = now - seconds
+        result = {"total": 0, "platforms": {}, "peaks": {}}
+        for (name, _, _), tier in zip(TIERS, self.tiers):
+            for bucket in tier:
+                if bucket["start"] < since:
+                    continue
+                count = bucket["total"] if kind is None else bucket[kind].get(key, 0)
+                result["total"] += count
+                result["peaks"][name] = max(result["peaks"].get(name, 0), count)
+                if kind is None:
+                    for linkName, platform_count in bucket["platforms"].items():
+                        result["platforms"][linkName] = result["platforms"].get(linkName, 0) + platform_count
+        return result
+
+    def to_json(self) -> list:
+        """
+        Get the buckets in a form json can write.
+
+        Returns
+        -------
+        list
+            The buckets of each tier, oldest first.
+        """
+        return [[{"start": bucket["start"], "total": bucket["total"], "platforms": dict(bucket["platforms"]),
+                  "servers": {str(k): v for k, v in bucket["servers"].items()},
+                  "users": {str(k): v for k, v in bucket["users"].items()}} for bucket in tier]
+                for tier in self.tiers]
+
+    def from_json(self, tiers: list):
+        """
+        Add buckets written by to_json to those recorded so far, rolling up any that aged out since.
+
+        Parameters
+        ----------
+        tiers : list
+            The buckets of each tier, oldest first.
+        """
+        # Fixes can be recorded while the file is read, and are kept rather than replaced
+        recorded = self.tiers
+        self.tiers = [deque({"start": bucket["start"], "total": bucket["total"], "platforms": bucket["platforms"],
+                             "servers": {int(k): v for k, v in bucket["servers"].items()},
+                             "users": {int(k): v for k, v in bucket["users"].items()}} for bucket in tier)
+                      for tier in tiers]
+        # Tiers added since the file was written start empty
+        self.tiers += [deque() for _ in TIERS[len(self.tiers):]]
+        for index, buckets in enumerate(recorded):
+            if not buckets:
+                continue
+            tier = self.tiers[index]
+            loaded = {bucket["start"]: bucket for bucket in tier}
+            for bucket in buckets:
+                if bucket["start"] in loaded:
+                    merge(loaded[bucket["start"]], bucket)
+                else:
+                    tier.append(bucket)
+            self.tiers[index] = deque(sorted(tier, key=lambda bucket: bucket["start"]))
+        self.current = self.tiers[0][-1] if self.tiers[0] else None
+        self.roll(time.time())
+
+def new_bucket(start: int) -> dict:
+    """
+    Make an empty bucket.
+
+    Parameters
+    ----------
+    start : int
+        The unix time the bucket starts.
+
+    Returns
+    -------
+    dict
+        The bucket.
+    """
+    return {"start": start, "total": 0, "platforms": {}, "servers": {}, "users": {}}
+
+def merge(into: dict, bucket: dict):
+    """
+    Add a bucket's counts to a coarser one, downsampling its servers and users once there are too many.
+
+    Parameters
+    ----------
+    into : dict
+        The coarser bucket.
+
+    bucket : dict
+        The bucket to add.
+    """
+    into["total"] += bucket["total"]
+    for kind in ("platforms", "servers", "users"):
+        counts = into[kind]
+        for key, count in bucket[kind].items():
+            counts[key] = counts.get(key, 0) + count
+    for kind in ("servers", "users"):
+        # Trimmed in batches so it happens once every few merges rather than every one
+        if len(into[kind]) > BUCKET_KEYS * 2:
+            into[kind] = dict(sorted(into[kind].items(), key=lambda x: x[1], reverse=True)[:BUCKET_KEYS])
@@ -0,0 +1,95 @@
+import asyncio
+import logging
+from typing import Dict, Iterable, Optional, Tuple
+
+import discord
+
+from linkhandlers.resolutioncache import MISSING, ResolutionCache
+from runtime.structuredlog import log_event
+
+log = logging.getLogger(__name__)
+
+class UserDirectory:
+    """
+    Names for user IDs, looked up only when they are about to be shown.
+
+    Names come from the client's own user cache when the user is in it, and are
+    otherwise fetched over REST, a few at a time so a page of unknown users does
+    not run into Discord's rate limits. Every name is kept in an LRU cache with a
+    TTL, so names are refreshed now and then, and the cache can be saved between
+    restarts. Users that no longer exist are remembered for a shorter time.
+    """
+
+    # Users whose names are kept
+    LIMIT = 5000
+    # Seconds before a name is fetched again, and before a deleted user is retried
+    TTL = 7 * 86400
+    NEGATIVE_TTL = 86400
+    # REST fetches in flight at once
+    FETCH_CONCURRENCY = 4
+
+    def __init__(self, bot):
+        self.bot = bot
+        # str(user ID) -> [display name, username], or None for a user that does not exist
+        self.cache = ResolutionCache(self.LIMIT, self.TTL, self.NEGATIVE_TTL)
+        self.semaphore = asyncio.Semaphore(self.FETCH_CONCURRENCY)
+        self.fetched = 0
+        self.failed = 0
+
+    async def names(self, user_ids: Iterable[int]) -> Dict[int, Optional[Tuple[str, str]]]:
+        """
+        Get the names of users, fetching any not cached concurrently.
+
+        Parameters
+        ----------
+        user_ids : Iterable[int]
+            The IDs of the users.
+
+        Returns
+        -------
+        Dict[int, Optional[Tuple[str, str]]]
+            User ID -> (display name, username), or None if the user does not exist
+            or could not be fetched.
+        """
+        names = {}
+        missing = []
+        for user_id in user_ids:
+            cached = self.cache.get(str(user_id))
+            if cached is MISSING:
+                missing.append(user_id)
+            else:
+                names[user_id] = tuple(cached) if cached is not None else None
+        fetched = await asyncio.gather(*(self.fetch(user_id) for user_id in missing))
+        names.update(zip(missing, fetched))
+        return names
+
+    async def fetch(self, user_id: int) -> Optional[Tuple[str, str]]:
+        """
+        Look up a user's name from the client's cache, or over REST, and cache it.
+
+        Parameters
+        ----------
+        user_id : int
+            The ID of the user.
+
+        Returns
+        -------
+        Optional[Tuple[str, str]]
+            (display name, username), or None if the user does not exist or could not be fetched.
+        """
+        user = self.bot.get_user(user_id)
+        if user is None:
+            async with self.semaphore:
+                try:
+                    user = await self.bot.fetch_user(user_id)
+                    self.fetched += 1
+                except discord.NotFound:
+                    self.cache.put(str(user_id), None)
+                    return None
+                except discord.HTTPException as e:
+                    # Rate limited beyond what discord.py retries, or a server error, so try again next time
+                    self.failed += 1
+                    log_event(log, logging.WARNING, "user_fetch_failed", user_id=user_id, status=e.status)
+                    return None
+        self.cache.put(str(user_id), [user.display_name, user.name])
+        return user.display_name, user.name
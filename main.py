@@ -2,8 +2,18 @@ import discord
 from discord.ext import commands
 import os
 import json
+import logging
+import signal
 
-class Core(commands.Bot):
+from linkhandlers.httpclient import HttpClient
+from linklogging.backgroundwriter import BackgroundWriter, write_json_atomic
+from runtime.metrics import Metrics
+from runtime.shardmetrics import ShardMetrics
+from runtime.structuredlog import log_event, setup_logging
+
+log = logging.getLogger(__name__)
+
+class Core(commands.AutoShardedBot):
 
     intents = discord.Intents.default()
 
@@ -28,13 +38,44 @@ class Core(commands.Bot):
         self.current_status = ""
         self.status_count = False
         self.log_timer = 10
+        self.persist_cache = True
+        self.log_backend = "json"
+        # Where stats, caches and history are kept, set by the container to a mounted directory
+        self.state_dir = os.environ.get("ANTEDIUM_STATE_DIR", "linklogging")
+        # None keeps the database in the state directory
+        self.log_database = None
+        self.dispatch_workers = 8
+        self.dispatch_guild_limit = 20
+        self.dispatch_policy = "drop_oldest"
+        # Fixes are tracked by the reply index, so few messages need to stay cached
+        self.max_messages = 100
+        # None lets Discord recommend a shard count, and runs every shard in this process
+        self.shard_count = None
+        self.shard_ids = None
+        # Processes fixing links for this one, or 0 to fix them on the event loop
+        self.worker_processes = 0
+        # Port to serve metrics on to this machine only, or 0 to not serve them
+        self.metrics_port = 0
+        # Logger name -> level, "" being every logger not named, and event name -> sampling and rate limit
+        self.log_levels = {"": "INFO"}
+        self.log_sampling = {}
+        # Shared by every link handler that resolves links over the network
+        self.http_client = HttpClient()
+        # Runs stats, cache and config writes off the event loop
+        self.writer = BackgroundWriter()
+        self.shard_metrics = ShardMetrics()
+        self.metrics = Metrics()
         self.load_config()
+        # Set up once the config says how, so the config itself is logged from here
+        self.log_listener = setup_logging(self.log_levels, self.log_sampling)
+        log_event(log, logging.INFO, "config_loaded", state_dir=self.state_dir, log_backend=self.log_backend)
         allowed_mentions = discord.AllowedMentions(everyone=False, roles=False, users=True)
 
         owners = [73389450113069056]
         super().__init__(command_prefix=self.discord_command_prefixes, case_insensitive=True,
                          intents=self.intents, owner_ids=set(owners), allowed_mentions=allowed_mentions, 
-                         member_cache_flags=self.member_cache_flags, max_messages=1000)
+                         member_cache_flags=self.member_cache_flags, max_messages=self.max_messages,
+                         shard_count=self.shard_count, shard_ids=self.shard_ids)
 
     def load_config(self):
         try:
@@ -50,8 +91,23 @@ class Core(commands.Bot):
                 self.current_status = contents['discord']['status']
                 self.status_count = contents['discord']['status_count']
                 self.log_timer = contents['discord']['log_timer']
+                # Settings added after release fall back to defaults for older configs
+                self.persist_cache = contents['discord'].get('persist_cache', True)
+                self.log_backend = contents['discord'].get('log_backend', "json")
+                # The container's mounted directory wins over a config written for running outside it
+                self.state_dir = os.environ.get("ANTEDIUM_STATE_DIR") or contents['discord'].get('state_dir', "linklogging")
+                self.log_database = contents['discord'].get('log_database')
+                self.dispatch_workers = contents['discord'].get('dispatch_workers', 8)
+                self.dispatch_guild_limit = contents['discord'].get('dispatch_guild_limit', 20)
+                self.dispatch_policy = contents['discord'].get('dispatch_policy', "drop_oldest")
+                self.max_messages = contents['discord'].get('max_messages', 100)
+                self.shard_count = contents['discord'].get('shard_count')
+                self.shard_ids = contents['discord'].get('shard_ids')
+                self.worker_processes = contents['discord'].get('worker_processes', 0)
+                self.metrics_port = contents['discord'].get('metrics_port', 0)
+                self.log_levels = contents['discord'].get('log_levels', {"": "INFO"})
+                self.log_sampling = contents['discord'].get('log_sampling', {})
                 file.close()
-                print("config loaded successfully.")
 
         except FileNotFoundError:
             with open("config.json", "w") as file:
@@ -63,59 +119,145 @@ class Core(commands.Bot):
                         "dev": True,
                         "status": "",
                         "status_count": False,
-                        "log_timer": 60
+                        "log_timer": 60,
+                        "persist_cache": True,
+                        "log_backend": "json",
+                        "state_dir": "linklogging",
+                        "log_database": None,
+                        "dispatch_workers": 8,
+                        "dispatch_guild_limit": 20,
+                        "dispatch_policy": "drop_oldest",
+                        "max_messages": 100,
+                        "shard_count": None,
+                        "shard_ids": None,
+                        "worker_processes": 0,
+                        "metrics_port": 0,
+                        "log_levels": {"": "INFO"},
+                        "log_sampling": {}
                     }
                 }
                 json.dump(default_config, file, indent=4)
-            print("config.json not found. A default config file has been created. Please fill in the bot_token field.")
+            # Nothing was configured, so logging is set up with the defaults just to say so
+            listener = setup_logging(self.log_levels, self.log_sampling)
+            log_event(log, logging.ERROR, "config_missing", file="config.json",
+                      detail="A default config file has been created. Please fill in the bot_token field.")
+            listener.stop()
             exit(1)
 
+        if not self.log_database:
+            self.log_database = os.path.join(self.state_dir, "log.db")
+
+        if self.shard_ids is not None:
+            # Every process writes its own stats, so they can only be added up in a shared database
+            if self.shard_count is None:
+                raise ValueError("shard_ids needs shard_count to be set, so processes agree on the shards.")
+            if self.log_backend != "sqlite":
+                raise ValueError("shard_ids needs the sqlite log_backend, as a JSON log can't be shared by processes.")
+
+    def state_path(self, path: str) -> str:
+        """
+        Get where this process keeps a state file in the state directory, so processes running different
+        shards don't share one.
+
+        Parameters
+        ----------
+        path : str
+            The file's path in the state directory with every shard in one process, eg. cache.json.
+
+        Returns
+        -------
+        str
+            The path in the state directory, with this process's shard range added if it runs only some,
+            eg. linklogging/cache.json or linklogging/cache.shards0-3.json.
+        """
+        path = os.path.join(self.state_dir, path)
+        if self.shard_ids is None:
+            return path
+        root, extension = os.path.splitext(path)
+        return f"{root}.shards{min(self.shard_ids)}-{max(self.shard_ids)}{extension}"
+
+    async def setup_hook(self):
+        # Docker stops the container with SIGTERM, close properly so cogs can save their state
+        try:
+            self.loop.add_signal_handler(signal.SIGTERM, lambda: self.loop.create_task(self.close()))
+        except NotImplementedError:
+            # Not supported by the Windows event loop
+            pass
+        self.metrics.collect("gateway_latency_seconds", "Heartbeat latency of each shard.", "gauge", ("shard",),
+                             lambda: (((shard_id,), latency) for shard_id, latency in self.latencies))
+        self.metrics.collect("shard_messages_total", "Messages received by each shard.", "counter", ("shard",),
+                             lambda: (((shard_id,), total) for shard_id, total in self.shard_metrics.totals.items()))
+        if self.metrics_port:
+            await self.metrics.start("127.0.0.1", self.metrics_port)
+
+    async def on_shard_connect(self, shard_id):
+        self.shard_metrics.connected(shard_id)
+
+    async def on_shard_disconnect(self, shard_id):
+        self.shard_metrics.disconnected(shard_id)
+
+    async def on_shard_resumed(self, shard_id):
+        self.shard_metrics.resumed(shard_id)
+
     async def on_ready(self):
-        print("Bot initialised.")
+        log_event(log, logging.INFO, "bot_initialised")
         await self.startup()
 
     async def startup(self):
-        print("Attempting to load cogs...")
+        log_event(log, logging.INFO, "cogs_loading")
         for filename in os.listdir("cogs"):
             if filename.endswith(".py"):
                 # loads filename, removes last 3 characters (because load works with filename itself, not extension)
                 await self.load_extension(f"cogs.{filename[:-3]}")
-                print(f"{filename} successfully loaded.")
+                log_event(log, logging.INFO, "cog_loaded", cog=filename)
 
-        print("All cogs parsed.")
+        log_event(log, logging.INFO, "cogs_loaded")
 
         await self.tree.sync()
         
         if not self.status_count:
             await self.change_presence(activity=discord.Game(name=self.current_status))
-        print("Bot is ready.")
+        log_event(log, logging.INFO, "bot_ready")
 
     async def set_status(self, status: str):
         self.current_status = status
-
-        with open("config.json", "r") as file:
-            contents = json.load(file)
-
-        contents['discord']['status'] = status
-
-        with open("config.json", "w") as file:
-            json.dump(contents, file, indent=4)
-
+        await self.writer.run("config", save_config, 'status', status)
         await self.change_presence(activity=discord.Game(name=self.current_status))
 
     async def set_status_count(self, status_count: bool):
         self.status_count = status_count
+        await self.writer.run("config", save_config, 'status_count', status_count)
 
-        with open("config.json", "r") as file:
-            contents = json.load(file)
+    async def close(self):
+        await super().close()
+        await self.http_client.close()
+        await self.metrics.stop()
+        # Cogs have queued their final writes by now, wait for them to land
+        self.writer.close()
+        # Last, so anything logged while closing is still written
+        self.log_listener.stop()
 
-        contents['discord']['status_count'] = status_count
+    def run(self):
+        # Logging is already set up, discord.py's records go through the same queue as ours
+        super().run(self.discord_bot_token, log_handler=None)
 
-        with open("config.json", "w") as file:
-            json.dump(contents, file, indent=4)
+def save_config(key, value):
+    """
+    Change one discord setting in config.json. Blocking, so run on the writer thread.
 
-    def run(self):
-        super().run(self.discord_bot_token)
+    Parameters
+    ----------
+    key : str
+        The setting to change.
+
+    value
+        Its new value.
+    """
+    with open("config.json", "r") as file:
+        contents = json.load(file)
+
+    contents['discord'][key] = value
+    write_json_atomic("config.json", contents, indent=4)
 
 if __name__ == "__main__":
     core = Core()
@@ -0,0 +1,210 @@
+import asyncio
+import itertools
+import time
+
+import discord
+
+# Route -> (priority, lower runs first; requests per bucket; per seconds). Limits are Discord's
+# published per channel limits, or a cautious guess where it publishes none, and only pace
+# requests so they rarely reach discord.py's own rate limit handling.
+ROUTES = {
+    "reply": (0, 5, 5.0),
+    "delete": (1, 5, 5.0),
+    "fetch_message": (1, 5, 5.0),
+    "fetch_user": (1, 5, 5.0),
+    "dm": (2, 5, 5.0),
+    "suppress": (3, 5, 5.0),
+    "react": (4, 1, 0.25),
+}
+
+class RouteStats:
+    """
+    Requests made on a route, how long they took, and how often they were held back or rate limited.
+    """
+
+    def __init__(self):
+        self.requests = 0
+        self.latency = 0.0
+        self.latency_max = 0.0
+        self.rate_limited = 0
+        self.throttled = 0
+        self.collapsed = 0
+        self.failed = 0
+
+class ActionScheduler:
+    """
+    Runs REST calls for LinkFix in order of priority, paced per route and channel.
+
+    Every call goes through a priority queue, so under load the reply to a fixed
+    message goes out before the suppression edit and the reaction that follow it.
+    Each route and channel pair has a token bucket matching Discord's limit for
+    it, and a call whose bucket is empty is put back until it refills instead of
+    holding up a worker. A call with the same key as one already waiting is not
+    queued again, the caller shares the waiting call's result.
+    """
+
+    def __init__(self, workers=4, metrics=None):
+        """
+        Parameters
+        ----------
+        workers : int
+            Calls made at once.
+
+        metrics : Metrics or None
+            Where to record how long each route's calls take, if anywhere.
+        """
+        self.workers = workers
+        self.latency = metrics.histogram("rest_seconds", "Time taken by REST calls.", ("route",)) if metrics else None
+        self.queue = asyncio.PriorityQueue()
+        self.order = itertools.count()
+        self.tasks = []
+        # (route, bucket) -> (tokens left, last refill as a monotonic time)
+        self.buckets = {}
+        # Collapse key -> future of the waiting call
+        self.pending = {}
+        # Route -> RouteStats
+        self.stats = {route: RouteStats() for route in ROUTES}
+
+    def start(self):
+        """
+        Start the workers.
+        """
+        self.tasks = [asyncio.create_task(self.work()) for _ in range(self.workers)]
+
+    def stop(self):
+        """
+        Stop the workers, cancelling calls in progress and failing those waiting.
+        """
+        for task in self.tasks:
+            task.cancel()
+        self.tasks = []
+        while not self.queue.empty():
+            self.queue.get_nowait()[2][-1].cancel()
+        for future in self.pending.values():
+            future.cancel()
+
+    def submit(self, route, bucket, function, *args, key=None, **kwargs):
+        """
+        Queue a REST call.
+
+        Parameters
+        ----------
+        route : str
+            The kind of call, one of ROUTES.
+
+        bucket : int
+            What Discord rate limits the route by, usually the channel ID.
+
+        function : Callable[..., Awaitable]
+            The discord.py method making the call.
+
+        *args
+            Arguments for the method.
+
+        key : Hashable or None
+            Identifies calls that do the same thing, so only one is made while waiting.
+
+        **kwargs
+            Keyword arguments for the method.
+
+        Returns
+        -------
+        asyncio.Future
+            Resolves to what the method returns, or raises what it raised.
+        """
+        stats = self.stats[route]
+        if key is not None and key in self.pending:
+            stats.collapsed += 1
+            return self.pending[key]
+        future = asyncio.get_running_loop().create_future()
+        # Nobody may wait on it, so retrieve any exception to keep it from being reported as unhandled
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        if key is not None:
+            self.pending[key] = future
+        self.queue.put_nowait((ROUTES[route][0], next(self.order), (route, bucket, function, args, kwargs, key, future)))
+        return future
+
+    async def run(self, route, bucket, function, *args, key=None, **kwargs):
+        """
+        Queue a REST call and wait for its result. Takes the same parameters as submit.
+        """
+        return await self.submit(route, bucket, function, *args, key=key, **kwargs)
+
+    def take_token(self, route, bucket):
+        """
+        Take a token from a route and bucket's rate limit.
+
+        Returns
+        -------
+        float
+            0 if a token was taken, otherwise the seconds until one is available.
+        """
+        _, limit, per = ROUTES[route]
+        now = time.monotonic()
+        tokens, refilled = self.buckets.get((route, bucket), (limit, now))
+        tokens = min(limit, tokens + (now - refilled) * limit / per)
+        if tokens < 1:
+            self.buckets[(route, bucket)] = (tokens, now)
+            return (1 - tokens) * per / limit
+        self.buckets[(route, bucket)] = (tokens - 1, now)
+        # Buckets untouched for a whole window are back at their limit, so are dropped to keep the table small
+        if len(self.buckets) > 10000:
+            self.buckets = {k: v for k, v in self.buckets.items() if now - v[1] < ROUTES[k[0]][2]}
+        return 0
+
+    def headroom(self, route):
+        """
+        Get the least headroom left in any bucket of a route.
+
+        Parameters
+        ----------
+        route : str
+            The kind of call, one of ROUTES.
+
+        Returns
+        -------
+        float
+            The fewest tokens left in one of the route's buckets, as a fraction of its limit.
+        """
+        _, limit, per = ROUTES[route]
+        now = time.monotonic()
+        tokens = [min(limit, left + (now - refilled) * limit / per)
+                  for (bucket_route, _), (left, refilled) in self.buckets.items() if bucket_route == route]
+        return min(tokens, default=limit) / limit
+
+    async def work(self):
+        """
+        Make queued calls, highest priority first.
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            priority, order, action = await self.queue.get()
+            route, bucket, function, args, kwargs, key, future = action
+            stats = self.stats[route]
+            delay = self.take_token(route, bucket)
+            if delay:
+                stats.throttled += 1
+                loop.call_later(delay, self.queue.put_nowait, (priority, order, action))
+                continue
+            if key is not None:
+                self.pending.pop(key, None)
+            if future.done():
+                continue
+            start = time.perf_counter()
+            try:
+                result = await function(*args, **kwargs)
+            except Exception as e:
+                # RateLimited is raised when discord.py would wait longer than it is allowed to
+                if isinstance(e, discord.RateLimited) or (isinstance(e, discord.HTTPException) and e.status == 429):
+                    stats.rate_limited += 1
+                stats.failed += 1
+                future.set_exception(e)
+            else:
+                future.set_result(result)
+            finally:
+                elapsed = time.perf_counter() - start
+                stats.requests += 1
+                stats.latency += elapsed
+                stats.latency_max = max(stats.latency_max, elapsed)
+                if self.latency is not None:
+                    self.latency.observe(elapsed, route)
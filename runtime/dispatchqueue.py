@@ -0,0 +1,209 @@
+import asyncio
+import logging
+import time
+from collections import deque
+
+from runtime.structuredlog import log_event
+
+# What to do with a message arriving for a guild whose queue is full
+POLICIES = ("drop_oldest", "drop_newest", "merge")
+
+log = logging.getLogger(__name__)
+
+class DispatchQueue:
+    """
+    Bounded per guild queues of work, run by a fixed pool of workers.
+
+    Each guild has its own queue, and guilds with work waiting take turns, so a
+    guild flooding messages only ever has guild_concurrency of them running and
+    everyone else's go to the next free worker. Once a guild's queue is full the
+    policy decides what gives: drop_oldest discards the longest waiting message,
+    drop_newest turns the new one away, and merge turns away a message identical
+    to one already waiting before anything else, then drops the oldest. If every
+    queue together passes TOTAL_LIMIT, the deepest queue loses its oldest message.
+    """
+
+    # Messages waiting across every guild before the deepest queue is trimmed
+    TOTAL_LIMIT = 1000
+
+    def __init__(self, workers=8, guild_limit=20, policy="drop_oldest", guild_concurrency=2, on_drop=None):
+        """
+        Parameters
+        ----------
+        workers : int
+            Work run at once across every guild.
+
+        guild_limit : int
+            Messages waiting per guild before the policy applies.
+
+        policy : str
+            "drop_oldest", "drop_newest" or "merge".
+
+        guild_concurrency : int
+            Work run at once for a single guild.
+
+        on_drop : Callable or None
+            Called with the arguments of work that is dropped or turned away, so whatever was set up for it can
+            be let go.
+        """
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown dispatch policy '{policy}', expected one of {', '.join(POLICIES)}.")
+        self.workers = workers
+        self.guild_limit = guild_limit
+        self.policy = policy
+        self.guild_concurrency = guild_concurrency
+        self.on_drop = on_drop
+        # Guild ID -> deque of (enqueue time, merge key, function, args)
+        self.queues = {}
+        # Guild ID -> work running for it
+        self.running = {}
+        # Guilds waiting for a worker, each in it at most once
+        self.ready = asyncio.Queue()
+        self.scheduled = set()
+        self.tasks = []
+        self.depth = 0
+        self.max_depth = 0
+        self.submitted = 0
+        self.started = 0
+        self.processed = 0
+        self.dropped = 0
+        self.merged = 0
+        self.failed = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def start(self):
+        """
+        Start the workers.
+        """
+        self.tasks = [asyncio.create_task(self.work()) for _ in range(self.workers)]
+
+    def stop(self):
+        """
+        Stop the workers, cancelling running work and dropping anything waiting.
+        """
+        for task in self.tasks:
+            task.cancel()
+        self.tasks = []
+        self.queues.clear()
+        self.depth = 0
+
+    def submit(self, guild_id, key, function, *args):
+        """
+        Queue work for a guild.
+
+        Parameters
+        ----------
+        guild_id : int
+            The guild the work is for, which decides whose turn it runs in.
+
+        key : Hashable or None
+            Identifies duplicate work for the merge policy, None to never merge.
+
+        function : Callable[..., Awaitable]
+            The coroutine function to run, only called once a worker is free.
+
+        *args
+            Arguments for the function.
+
+        Returns
+        -------
+        bool
+            True if the work was queued, False if it was turned away.
+        """
+        self.submitted += 1
+        queue = self.queues.setdefault(guild_id, deque())
+        if len(queue) >= self.guild_limit:
+            # Below the limit every message is kept, even one identical to another waiting
+            if self.policy == "merge" and key is not None and any(item[1] == key for item in queue):
+                self.merged += 1
+                self.drop(args)
+                return False
+            if self.policy == "drop_newest":
+                self.dropped += 1
+                self.drop(args)
+                return False
+            self.drop(queue.popleft()[3])
+            self.dropped += 1
+            self.depth -= 1
+        queue.append((time.perf_counter(), key, function, args))
+        self.depth += 1
+        if self.depth > self.TOTAL_LIMIT:
+            deepest = max(self.queues.values(), key=len)
+            self.drop(deepest.popleft()[3])
+            self.dropped += 1
+            self.depth -= 1
+        self.max_depth = max(self.max_depth, self.depth)
+        self.schedule(guild_id)
+        return True
+
+    def drop(self, args):
+        if self.on_drop is not None:
+            self.on_drop(*args)
+
+    def schedule(self, guild_id):
+        """
+        Put a guild in line for a worker if it has work waiting and room to run more.
+
+        Parameters
+        ----------
+        guild_id : int
+            The guild.
+        """
+        if (guild_id not in self.scheduled and self.queues.get(guild_id)
+                and self.running.get(guild_id, 0) < self.guild_concurrency):
+            self.scheduled.add(guild_id)
+            self.ready.put_nowait(guild_id)
+
+    async def work(self):
+        """
+        Run work from guilds in turn, one item per turn.
+        """
+        while True:
+            guild_id = await self.ready.get()
+            self.scheduled.discard(guild_id)
+            queue = self.queues.get(guild_id)
+            # Emptied by the total limit after being scheduled
+            if not queue:
+                if guild_id not in self.running:
+                    self.queues.pop(guild_id, None)
+                continue
+            enqueued, _, function, args = queue.popleft()
+            self.depth -= 1
+            self.started += 1
+            wait = time.perf_counter() - enqueued
+            self.wait_total += wait
+            self.wait_max = max(self.wait_max, wait)
+            self.running[guild_id] = self.running.get(guild_id, 0) + 1
+            # Back in line behind every other waiting guild
+            self.schedule(guild_id)
+            try:
+                await function(*args)
+            except Exception:
+                self.failed += 1
+                log_event(log, logging.ERROR, "dispatch_failed", exc_info=True, guild_id=guild_id)
+            finally:
+                self.processed += 1
+                self.running[guild_id] -= 1
+                if self.running[guild_id] == 0:
+                    del self.running[guild_id]
+                    if not queue:
+                        self.queues.pop(guild_id, None)
+                self.schedule(guild_id)
+
+    def deepest(self, count):
+        """
+        Get the guilds with the most work waiting.
+
+        Parameters
+        ----------
+        count : int
+            How many guilds to get.
+
+        Returns
+        -------
+        List[Tuple[int, int]]
+            (guild ID, messages waiting) pairs, most first.
+        """
+        depths = ((guild_id, len(queue)) for guild_id, queue in self.queues.items() if queue)
+        return sorted(depths, key=lambda x: x[1], reverse=True)[:count]
@@ -0,0 +1,127 @@
+import asyncio
+
+import discord
+
+class EmbedSuppressor:
+    """
+    Hides the embeds of messages that have been fixed, once Discord has added them.
+
+    Suppressing a message before Discord has generated its embeds does not always
+    stick, which is why fixes used to wait a fixed 0.4 seconds before editing.
+    Instead the reply is sent straight away and the suppression waits in the
+    background for the edit event that brings the embeds, editing at once if
+    they are already there, and editing anyway after a timeout in case the
+    event never comes. Messages with links are watched for from when they
+    arrive, as the embeds often come while they wait to be fixed, and the raw
+    event is used rather than the client's message cache, which may no longer
+    hold the message.
+
+    Edits made after the timeout without an embed having been seen are counted
+    as possibly wasted, as the message may never have had one.
+    """
+
+    # Seconds to wait for the embeds before suppressing anyway
+    TIMEOUT = 5
+
+    def __init__(self, actions):
+        """
+        Parameters
+        ----------
+        actions : ActionScheduler
+            Makes the edits, behind replies in priority.
+        """
+        self.actions = actions
+        # Message ID -> future set when an edit brings the message's embeds
+        self.waiting = {}
+        self.tasks = set()
+        # Suppressions by what triggered them, and ones that failed
+        self.immediate = 0
+        self.on_event = 0
+        self.timed_out = 0
+        self.failed = 0
+
+    def expect(self, message: discord.Message):
+        """
+        Start watching for a message's embeds, before anything is awaited that they could arrive during.
+
+        Parameters
+        ----------
+        message : discord.Message
+            The message that will be suppressed.
+        """
+        if message.id not in self.waiting:
+            self.waiting[message.id] = asyncio.get_running_loop().create_future()
+
+    def forget(self, message_id: int):
+        """
+        Stop watching for a message's embeds, when it won't be suppressed after all.
+
+        Parameters
+        ----------
+        message_id : int
+            The ID of the message.
+        """
+        self.waiting.pop(message_id, None)
+
+    def suppress(self, message: discord.Message):
+        """
+        Suppress a message's embeds in the background once they arrive.
+
+        Parameters
+        ----------
+        message : discord.Message
+            The message to suppress the embeds of.
+        """
+        task = asyncio.create_task(self.wait_and_suppress(message))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def wait_and_suppress(self, message: discord.Message):
+        """
+        Wait for a message's embeds, up to TIMEOUT seconds, then suppress them.
+
+        Parameters
+        ----------
+        message : discord.Message
+            The message to suppress the embeds of.
+        """
+        arrived = self.waiting.get(message.id)
+        if arrived is None:
+            arrived = self.waiting[message.id] = asyncio.get_running_loop().create_future()
+        try:
+            if message.embeds:
+                self.immediate += 1
+            else:
+                # Already done if the embeds arrived while the message was being fixed
+                await asyncio.wait_for(arrived, self.TIMEOUT)
+                self.on_event += 1
+        except asyncio.TimeoutError:
+            self.timed_out += 1
+        finally:
+            self.waiting.pop(message.id, None)
+        try:
+            await self.actions.run("suppress", message.channel.id, message.edit, suppress=True,
+                                   key=("suppress", message.id))
+        except discord.HTTPException:
+            # Deleted in the meantime, or permissions changed since they were checked
+            self.failed += 1
+
+    def edited(self, payload: discord.RawMessageUpdateEvent):
+        """
+        Let a waiting suppression know its message's embeds have arrived.
+
+        Parameters
+        ----------
+        payload : discord.RawMessageUpdateEvent
+            The raw edit event.
+        """
+        arrived = self.waiting.get(payload.message_id)
+        if arrived is not None and not arrived.done() and payload.data.get("embeds"):
+            arrived.set_result(None)
+
+    def stop(self):
+        """
+        Cancel every waiting suppression.
+        """
+        for task in self.tasks:
+            task.cancel()
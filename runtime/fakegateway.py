@@ -0,0 +1,78 @@
+"""
+Stand in for the gateway process, feeding recorded messages to a WorkerPool
+and adding up the links fixed per platform as LinkFix would add them to
+LinkLogger, to try worker processes locally without connecting to Discord.
+
+A recording is a JSON lines file with one message per line, with the fields
+of MessageRecord: id, channel_id, guild_id, author_id and content. Without
+one a few built-in messages are replayed. Links whose handlers resolve them
+over the network are looked up for real.
+
+Run from the repository root with
+`python -m runtime.fakegateway [recording.jsonl] [--processes N] [--repeat N]`.
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from runtime.workerpool import MessageRecord, WorkerPool
+
+SAMPLE = [
+    "hi https://x.com/a/status/1",
+    "https://www.instagram.com/p/abc/ and https://twitter.com/b/status/2",
+    "||https://www.instagram.com/reel/def/||",
+    "no links here",
+]
+
+def read_recording(filepath):
+    """
+    Read a recording of messages.
+
+    Parameters
+    ----------
+    filepath : str
+        The JSON lines file to read.
+
+    Returns
+    -------
+    List[MessageRecord]
+        The recorded messages, in order.
+    """
+    with open(filepath, "r") as f:
+        return [MessageRecord(**json.loads(line)) for line in f if line.strip()]
+
+async def replay(records, processes):
+    pool = WorkerPool(processes)
+    pool.start()
+    totals = {}
+    fixed_messages = 0
+    start = time.perf_counter()
+    results = await asyncio.gather(*(pool.fix(record) for record in records))
+    elapsed = time.perf_counter() - start
+    for result in results:
+        if result is None:
+            continue
+        fixed_messages += 1
+        for linkName, count in result[1].items():
+            totals[linkName] = totals.get(linkName, 0) + count
+    await pool.stop()
+    print(f"{len(records)} messages through {processes} workers in {elapsed:.2f} s "
+          f"({len(records) / elapsed:.0f}/s), {fixed_messages} fixed, {pool.timed_out} timed out")
+    for linkName, count in sorted(totals.items()):
+        print(f"{count} : {linkName}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded messages through worker processes.")
+    parser.add_argument("recording", nargs="?", help="JSON lines file of message records")
+    parser.add_argument("--processes", type=int, default=2)
+    parser.add_argument("--repeat", type=int, default=1, help="Times to replay the recording")
+    args = parser.parse_args()
+    if args.recording:
+        records = read_recording(args.recording)
+    else:
+        records = [MessageRecord(i, 1, 1, i, content) for i, content in enumerate(SAMPLE)]
+    asyncio.run(replay(records * args.repeat, args.processes))
+
+if __name__ == "__main__":
+    main()
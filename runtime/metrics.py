@@ -0,0 +1,235 @@
+import logging
+import time
+from array import array
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Iterable, Tuple
+
+from aiohttp import web
+
+from runtime.structuredlog import log_event
+
+# Upper bounds in seconds of the histogram buckets, from the prefilter's microseconds to a slow REST call
+BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+           0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+log = logging.getLogger(__name__)
+
+def format_labels(names, values, extra=""):
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class Counter:
+    """
+    A count that only goes up, kept per combination of label values.
+    """
+
+    kind = "counter"
+
+    def __init__(self, name: str, description: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        # Label values -> count
+        self.values = {}
+
+    def inc(self, *label_values, amount=1):
+        self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def samples(self):
+        for label_values, value in self.values.items():
+            yield self.name, format_labels(self.labels, label_values), value
+
+class Histogram:
+    """
+    How long something took, counted into fixed buckets per combination of label values.
+
+    Observing is a bisect and an increment, so it can sit on the hot path. The
+    buckets are kept separately and only made cumulative when exported.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name: str, description: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        # Label values -> (count per bucket with one past the last for +Inf, [sum of observations])
+        self.series = {}
+
+    def observe(self, seconds: float, *label_values):
+        series = self.series.get(label_values)
+        if series is None:
+            series = self.series[label_values] = (array("Q", bytes(8 * (len(BUCKETS) + 1))), [0.0])
+        counts, total = series
+        counts[bisect_left(BUCKETS, seconds)] += 1
+        total[0] += seconds
+
+    @contextmanager
+    def time(self, *label_values):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *label_values)
+
+    def quantile(self, label_values, fraction: float) -> float:
+        """
+        Estimate a quantile as the upper bound of the bucket it falls in.
+
+        Parameters
+        ----------
+        label_values : tuple
+            The series to estimate for.
+
+        fraction : float
+            The quantile, eg. 0.99.
+
+        Returns
+        -------
+        float
+            The bucket's upper bound in seconds, or infinity past the last bucket.
+        """
+        counts, _ = self.series[label_values]
+        target = sum(counts) * fraction
+        seen = 0
+        for bound, count in zip(BUCKETS + (float("inf"),), counts):
+            seen += count
+            if seen >= target:
+                return bound
+        return float("inf")
+
+    def samples(self):
+        for label_values, (counts, total) in self.series.items():
+            seen = 0
+            for bound, count in zip(BUCKETS, counts):
+                seen += count
+                yield f"{self.name}_bucket", format_labels(self.labels, label_values, f'le="{bound}"'), seen
+            yield f"{self.name}_bucket", format_labels(self.labels, label_values, 'le="+Inf"'), seen + counts[-1]
+            yield f"{self.name}_sum", format_labels(self.labels, label_values), total[0]
+            yield f"{self.name}_count", format_labels(self.labels, label_values), seen + counts[-1]
+
+class Collected:
+    """
+    A gauge or counter read from elsewhere when exported, such as a queue's depth or a cache's hits.
+    """
+
+    def __init__(self, name: str, description: str, kind: str, labels: Tuple[str, ...],
+                 collect: Callable[[], Iterable[Tuple[tuple, float]]]):
+        self.name = name
+        self.description = description
+        self.kind = kind
+        self.labels = labels
+        self.collect = collect
+
+    def samples(self):
+        for label_values, value in self.collect():
+            yield self.name, format_labels(self.labels, label_values), value
+
+class Metrics:
+    """
+    Every metric the bot keeps, exported in the Prometheus text format.
+
+    Metrics are created on first use and handed back on later calls with the
+    same name, so a reloaded cog keeps counting into the same series. Values
+    kept elsewhere are registered as collectors, which are read only when the
+    metrics are exported, and replaced when registered again.
+    """
+
+    PREFIX = "antedium_"
+
+    def __init__(self):
+        # Name -> metric, in the order registered
+        self.metrics = {}
+        self.runner = None
+
+    def counter(self, name: str, description: str, labels: Tuple[str, ...] = ()) -> Counter:
+        return self.get(Counter, name, description, labels)
+
+    def histogram(self, name: str, description: str, labels: Tuple[str, ...] = ()) -> Histogram:
+        return self.get(Histogram, name, description, labels)
+
+    def get(self, kind, name, description, labels):
+        name = self.PREFIX + name
+        metric = self.metrics.get(name)
+        if metric is None:
+            metric = self.metrics[name] = kind(name, description, labels)
+        return metric
+
+    def collect(self, name: str, description: str, kind: str, labels: Tuple[str, ...],
+                collect: Callable[[], Iterable[Tuple[tuple, float]]]):
+        """
+        Register a gauge or counter read when exported, replacing any of the same name.
+
+        Parameters
+        ----------
+        name : str
+            The metric's name, without the prefix.
+
+        description : str
+            What it measures.
+
+        kind : str
+            "gauge" or "counter".
+
+        labels : Tuple[str, ...]
+            The names of its labels.
+
+        collect : Callable[[], Iterable[Tuple[tuple, float]]]
+            Gives (label values, value) pairs.
+        """
+        self.metrics[self.PREFIX + name] = Collected(self.PREFIX + name, description, kind, labels, collect)
+
+    def remove(self, name: str):
+        self.metrics.pop(self.PREFIX + name, None)
+
+    def render(self) -> str:
+        """
+        Export every metric in the Prometheus text format.
+
+        Returns
+        -------
+        str
+            The exposition text.
+        """
+        lines = []
+        for name, metric in self.metrics.items():
+            try:
+                samples = list(metric.samples())
+            except Exception as e:
+                # A collector reading something torn down shouldn't take the whole export with it
+                log_event(log, logging.WARNING, "metric_collect_failed", metric=name, error=repr(e))
+                continue
+            lines.append(f"# HELP {name} {metric.description}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            lines += [f"{sample}{labels} {value}" for sample, labels, value in samples]
+        return "\n".join(lines) + "\n"
+
+    async def start(self, host: str, port: int):
+        """
+        Serve the metrics at /metrics.
+
+        Parameters
+        ----------
+        host : str
+            The address to listen on, usually only the local machine.
+
+        port : int
+            The port to listen on.
+        """
+        async def handle(request):
+            return web.Response(text=self.render(), content_type="text/plain", charset="utf-8")
+
+        app = web.Application()
+        app.router.add_get("/metrics", handle)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, host, port).start()
+        log_event(log, logging.INFO, "metrics_serving", host=host, port=port)
+
+    async def stop(self):
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
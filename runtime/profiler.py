@@ -0,0 +1,261 @@
+import asyncio
+import inspect
+import os
+import sys
+import threading
+import time
+from typing import List, Tuple
+
+# Seconds between stack samples, often enough to catch a 10ms stall a couple of times
+SAMPLE_INTERVAL = 0.005
+# Seconds between the loop's heartbeats, and how late one must be to count as a stall
+TICK_INTERVAL = 0.01
+STALL_THRESHOLD = 0.05
+# Longest a profile may run, so a forgotten one can't keep sampling indefinitely
+MAX_SECONDS = 300
+# Seconds the loop thread may hold the GIL while profiling, well under the default 5ms, or the sampling
+# thread would only get to look when the loop waits on its selector and short callbacks would never be seen
+SWITCH_INTERVAL = 0.0005
+# Stalls kept for the summary, longest first
+STALL_LIMIT = 20
+
+ASYNCIO_DIR = os.path.dirname(asyncio.__file__)
+
+def frame_label(code) -> str:
+    """
+    Name a frame as its function and where it's defined, eg. "fix (linkhandlers/linkpipeline.py:48)".
+
+    Parameters
+    ----------
+    code : types.CodeType
+        The frame's code.
+
+    Returns
+    -------
+    str
+        The label.
+    """
+    path = os.path.relpath(code.co_filename)
+    if path.startswith(".."):
+        # Outside the repository, the package and module are enough, eg. discord/client.py
+        path = "/".join(code.co_filename.replace("\\", "/").split("/")[-2:])
+    # Collapsed stacks are separated by semicolons
+    return f"{code.co_name} ({path}:{code.co_firstlineno})".replace(";", ":")
+
+def is_own(code) -> bool:
+    # The bot's own code, rather than the standard library or an installed package
+    return not os.path.relpath(code.co_filename).startswith("..") and "site-packages" not in code.co_filename
+
+def is_idle(code) -> bool:
+    # The loop waits for events in its selector's select, so samples there aren't time spent working
+    return code.co_name == "select" and code.co_filename.endswith("selectors.py")
+
+class Profile:
+    """
+    What a LoopProfiler saw while it ran.
+    """
+
+    def __init__(self):
+        # Stack from the outermost frame, as a tuple of frame labels -> samples
+        self.stacks = {}
+        # Coroutine label -> samples with it anywhere on the stack
+        self.coroutines = {}
+        self.samples = 0
+        self.idle = 0
+        # (seconds the loop was stalled, label of the innermost frame of the bot's own seen during it), longest first
+        self.stalls = []
+        self.ticks = 0
+        self.started = time.time()
+        self.seconds = 0.0
+
+    def collapsed(self) -> List[str]:
+        """
+        Get the stacks in the collapsed format read by flamegraph.pl, speedscope and similar.
+
+        Returns
+        -------
+        [str]
+            One line per stack, its frames separated by semicolons, then a space and its samples.
+        """
+        return [f"{';'.join(stack)} {count}" for stack, count in self.stacks.items()]
+
+    @property
+    def busy(self) -> float:
+        """
+        The fraction of samples the loop was running something rather than waiting for events.
+        """
+        return (self.samples - self.idle) / max(self.samples, 1)
+
+    def slowest_coroutines(self, count=5) -> List[Tuple[str, float]]:
+        """
+        Get the coroutines the loop spent the most time in, including time in whatever they called.
+
+        Parameters
+        ----------
+        count : int
+            How many to get.
+
+        Returns
+        -------
+        [(str, float)]
+            Each coroutine's label and seconds spent in it, most first.
+        """
+        busiest = sorted(self.coroutines.items(), key=lambda item: item[1], reverse=True)[:count]
+        return [(label, samples * self.seconds / max(self.samples, 1)) for label, samples in busiest]
+
+class LoopProfiler:
+    """
+    Samples what the event loop is running, and times how late its heartbeats are, for a bounded window.
+
+    A thread takes the loop thread's stack every SAMPLE_INTERVAL and counts
+    each distinct stack, so where the loop spends its time can be drawn as a
+    flame graph. Meanwhile a callback on the loop reschedules itself every
+    TICK_INTERVAL; one running well past when it was due means something held
+    the loop, and the stack the thread saw while the heartbeat was overdue is
+    kept as the likely culprit. Nothing is scheduled and no thread runs unless
+    a profile is running.
+    """
+
+    def __init__(self):
+        self.profile = None
+        self.loop = None
+        self.thread = None
+        self.stopping = threading.Event()
+        self.finished = None
+        self.tick_handle = None
+        self.loop_thread = None
+        self.last_tick = 0.0
+        # Innermost frame seen while the current heartbeat was overdue, set by the sampling thread
+        self.stalled_in = None
+        self.switch_interval = None
+
+    @property
+    def running(self) -> bool:
+        return self.thread is not None
+
+    def start(self, seconds: float):
+        """
+        Start profiling. Called from the event loop, which is the loop profiled.
+
+        Parameters
+        ----------
+        seconds : float
+            How long to profile for, at most MAX_SECONDS.
+        """
+        if self.running:
+            raise RuntimeError("A profile is already running.")
+        seconds = min(max(seconds, 1), MAX_SECONDS)
+        self.loop = asyncio.get_running_loop()
+        self.loop_thread = threading.get_ident()
+        self.profile = Profile()
+        self.finished = self.loop.create_future()
+        self.stopping.clear()
+        self.stalled_in = None
+        self.last_tick = time.perf_counter()
+        self.tick_handle = self.loop.call_later(TICK_INTERVAL, self.tick)
+        self.switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(SWITCH_INTERVAL)
+        self.thread = threading.Thread(target=self.sample, args=(seconds,), name="profiler", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """
+        End the profile early. The profile is still finished and handed to whoever is waiting on it.
+        """
+        self.stopping.set()
+
+    async def wait(self) -> Profile:
+        """
+        Wait for the running profile to finish.
+
+        Returns
+        -------
+        Profile
+            What was seen.
+        """
+        return await asyncio.shield(self.finished)
+
+    def tick(self):
+        now = time.perf_counter()
+        profile = self.profile
+        profile.ticks += 1
+        late = now - self.last_tick - TICK_INTERVAL
+        if late >= STALL_THRESHOLD:
+            profile.stalls.append((late, self.stalled_in or "unknown"))
+            profile.stalls.sort(reverse=True)
+            del profile.stalls[STALL_LIMIT:]
+        self.stalled_in = None
+        self.last_tick = now
+        self.tick_handle = self.loop.call_later(TICK_INTERVAL, self.tick)
+
+    def sample(self, seconds: float):
+        """
+        Sample the loop thread's stack until the window ends or stop is called. Runs on its own thread.
+        """
+        profile = self.profile
+        stacks = profile.stacks
+        coroutines = profile.coroutines
+        # Code object -> label, as working out paths for every frame of every sample would hold the GIL for long
+        labels = {}
+        start = time.perf_counter()
+        deadline = start + seconds
+        while not self.stopping.wait(SAMPLE_INTERVAL) and time.perf_counter() < deadline:
+            frame = sys._current_frames().get(self.loop_thread)
+            if frame is None:
+                break
+            innermost = frame.f_code
+            codes = []
+            while frame is not None:
+                codes.append(frame.f_code)
+                frame = frame.f_back
+            codes.reverse()
+            for code in codes:
+                if code not in labels:
+                    labels[code] = frame_label(code)
+            stack = tuple(labels[code] for code in codes)
+            stacks[stack] = stacks.get(stack, 0) + 1
+            profile.samples += 1
+            if is_idle(innermost):
+                profile.idle += 1
+                continue
+            # Each coroutine counts once per sample however deep it recurses
+            for label in {label for label, code in zip(stack, codes)
+                          if code.co_flags & inspect.CO_COROUTINE and not code.co_filename.startswith(ASYNCIO_DIR)}:
+                coroutines[label] = coroutines.get(label, 0) + 1
+            if time.perf_counter() - self.last_tick > STALL_THRESHOLD and self.stalled_in is None:
+                # The bot's own frame is what to look at, even if the time went in a library it called
+                own = [label for label, code in zip(stack, codes) if is_own(code)]
+                self.stalled_in = own[-1] if own else stack[-1]
+        profile.seconds = time.perf_counter() - start
+        sys.setswitchinterval(self.switch_interval)
+        try:
+            self.loop.call_soon_threadsafe(self.finish)
+        except RuntimeError:
+            # The loop closed while profiling
+            self.thread = None
+
+    def finish(self):
+        if self.tick_handle is not None:
+            self.tick_handle.cancel()
+            self.tick_handle = None
+        self.thread = None
+        if not self.finished.done():
+            self.finished.set_result(self.profile)
+
+def write_collapsed(filepath: str, profile: Profile):
+    """
+    Write a profile's collapsed stacks to a file. Blocking, so run on the writer thread.
+
+    Parameters
+    ----------
+    filepath : str
+        Where to write them.
+
+    profile : Profile
+        The profile.
+    """
+    directory = os.path.dirname(filepath)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(filepath, "w", encoding="utf-8") as file:
+        file.write("\n".join(profile.collapsed()) + "\n")
@@ -0,0 +1,113 @@
+from typing import Optional
+
+import discord
+
+from linkhandlers.resolutioncache import MISSING, ResolutionCache
+
+class ReplyIndex:
+    """
+    Who each of the bot's fix replies was fixing, so reply chains and deletes resolve without REST calls.
+
+    The original poster is remembered as soon as a fix is posted, which is all
+    a ❌ reaction needs to be checked against, however old the fix. Messages the
+    index has forgotten, or that were fixed before it existed, are looked up in
+    the client's message cache, and only fetched as a last resort, after which
+    they are remembered too. Entries expire after a TTL and the least recently
+    used make way once full, and the index can be saved between restarts.
+    """
+
+    # Fix replies remembered
+    LIMIT = 50000
+    # Seconds a fix reply is remembered for, replies to older fixes are rare
+    TTL = 30 * 86400
+
+    def __init__(self, actions):
+        """
+        Parameters
+        ----------
+        actions : ActionScheduler
+            Makes the fetches for replies nothing else knows about.
+        """
+        self.actions = actions
+        # str(fix reply ID) -> original poster's ID
+        self.cache = ResolutionCache(self.LIMIT, self.TTL, self.TTL)
+        # Lookups answered by the index, the client's message cache, and a fetch
+        self.indexed = 0
+        self.cached = 0
+        self.fetched = 0
+
+    def add(self, reply_id: int, author_id: int):
+        """
+        Remember who a fix reply was for.
+
+        Parameters
+        ----------
+        reply_id : int
+            The ID of the bot's reply.
+
+        author_id : int
+            The ID of the user whose message it fixed.
+        """
+        self.cache.put(str(reply_id), author_id)
+
+    def forget(self, reply_id: int):
+        """
+        Forget a fix reply, once it has been deleted.
+
+        Parameters
+        ----------
+        reply_id : int
+            The ID of the bot's reply.
+        """
+        self.cache.discard(str(reply_id))
+
+    def poster(self, reply_id: int) -> Optional[int]:
+        """
+        Get who a fix reply was for from the index alone.
+
+        Parameters
+        ----------
+        reply_id : int
+            The ID of the bot's reply.
+
+        Returns
+        -------
+        int or None
+            The ID of the user whose message it fixed, or None if it is not indexed.
+        """
+        author_id = self.cache.get(str(reply_id))
+        if author_id is MISSING:
+            return None
+        self.indexed += 1
+        return author_id
+
+    async def original_author(self, reply: discord.Message) -> Optional[int]:
+        """
+        Get the author of the message one of the bot's replies was replying to.
+
+        Parameters
+        ----------
+        reply : discord.Message
+            The bot's reply, which must itself be a reply.
+
+        Returns
+        -------
+        int or None
+            The ID of the original author, or None if their message is gone.
+        """
+        author_id = self.poster(reply.id)
+        if author_id is not None:
+            return author_id
+        original = reply.reference.cached_message
+        if original is not None:
+            self.cached += 1
+        else:
+            try:
+                original = await self.actions.run("fetch_message", reply.channel.id, reply.channel.fetch_message,
+                                                  reply.reference.message_id,
+                                                  key=("fetch_message", reply.reference.message_id))
+            except discord.NotFound:
+                return None
+            self.fetched += 1
+        self.add(reply.id, original.author.id)
+        return original.author.id
@@ -0,0 +1,79 @@
+import time
+from array import array
+
+# Seconds of events kept per shard to work out its recent event rate
+WINDOW = 60
+
+class ShardMetrics:
+    """
+    Event rates and connection churn for each shard run by this process.
+
+    Events are counted into a ring of one second slots per shard, each stamped
+    with the second it counts, so a slot left over from a previous pass round
+    the ring is recognised as stale and counting an event stays constant time.
+    """
+
+    def __init__(self):
+        # Shard ID -> (counts, the second each slot counts)
+        self.rings = {}
+        self.totals = {}
+        self.connects = {}
+        self.disconnects = {}
+        self.resumes = {}
+
+    def event(self, shard_id: int, now: float = None):
+        """
+        Count an event received by a shard.
+
+        Parameters
+        ----------
+        shard_id : int
+            The shard that received it.
+
+        now : float
+            When it was received, defaults to the current time.
+        """
+        second = int(time.time() if now is None else now)
+        ring = self.rings.get(shard_id)
+        if ring is None:
+            ring = self.rings[shard_id] = (array("I", bytes(4 * WINDOW)), array("q", bytes(8 * WINDOW)))
+        counts, stamps = ring
+        slot = second % WINDOW
+        if stamps[slot] != second:
+            stamps[slot] = second
+            counts[slot] = 0
+        counts[slot] += 1
+        self.totals[shard_id] = self.totals.get(shard_id, 0) + 1
+
+    def rate(self, shard_id: int, now: float = None) -> float:
+        """
+        Get a shard's events per second over the last WINDOW seconds.
+
+        Parameters
+        ----------
+        shard_id : int
+            The shard.
+
+        now : float
+            The end of the window, defaults to the current time.
+
+        Returns
+        -------
+        float
+            Events per second.
+        """
+        ring = self.rings.get(shard_id)
+        if ring is None:
+            return 0.0
+        second = int(time.time() if now is None else now)
+        counts, stamps = ring
+        return sum(count for count, stamp in zip(counts, stamps) if second - stamp < WINDOW) / WINDOW
+
+    def connected(self, shard_id: int):
+        self.connects[shard_id] = self.connects.get(shard_id, 0) + 1
+
+    def disconnected(self, shard_id: int):
+        self.disconnects[shard_id] = self.disconnects.get(shard_id, 0) + 1
+
+    def resumed(self, shard_id: int):
+        self.resumes[shard_id] = self.resumes.get(shard_id, 0) + 1
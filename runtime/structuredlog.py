@@ -0,0 +1,162 @@
+import copy
+import json
+import logging
+import queue
+import random
+import sys
+import time
+from logging.handlers import QueueHandler, QueueListener
+
+# Records waiting to be written before new ones are dropped instead of blocking the event loop
+QUEUE_LIMIT = 10000
+# Records per second each event may log, with a burst of as many, unless configured otherwise
+DEFAULT_PER_SECOND = 10.0
+# Events tracked for rate limiting before the table is started afresh, in case a library logs unbounded messages
+EVENT_LIMIT = 10000
+
+def log_event(logger: logging.Logger, level: int, event: str, exc_info=False, **fields):
+    """
+    Log a structured event. Fields are written as JSON, so never pass message content.
+
+    Parameters
+    ----------
+    logger : logging.Logger
+        The module's logger.
+
+    level : int
+        The level, eg. logging.WARNING.
+
+    event : str
+        The event's name, which sampling and rate limits are configured by, eg. "resolve_failed".
+
+    exc_info : bool
+        Whether to add the traceback of the exception being handled.
+
+    **fields
+        Details of the event.
+    """
+    # Checked first so events below the level cost no more than the call
+    if logger.isEnabledFor(level):
+        logger.log(level, event, exc_info=exc_info, extra={"fields": fields})
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formats records as one JSON object per line, with the event's fields alongside.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "event": record.getMessage(),
+        }
+        entry.update(getattr(record, "fields", {}))
+        suppressed = getattr(record, "suppressed", 0)
+        if suppressed:
+            entry["suppressed"] = suppressed
+        exception = getattr(record, "exception", None)
+        if exception:
+            entry["exception"] = exception
+        return json.dumps(entry, default=str)
+
+class SamplingFilter(logging.Filter):
+    """
+    Keeps a sample of each event and limits how many it logs a second.
+
+    Each event, by logger and name, has its own token bucket, so a flood of one
+    event can't drown out the rest. Records turned away by the limit are
+    counted, and the count is added to the next record of that event let
+    through. Warnings and above are never sampled away, only rate limited.
+    """
+
+    def __init__(self, sampling: dict):
+        """
+        Parameters
+        ----------
+        sampling : dict
+            Event name -> {"sample": fraction of records kept, "per_second": records a second}.
+        """
+        super().__init__()
+        self.sampling = sampling
+        # (logger, event) -> [tokens left, last refill, records suppressed since the last let through]
+        self.buckets = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        settings = self.sampling.get(record.msg, {})
+        sample = settings.get("sample", 1.0)
+        if record.levelno < logging.WARNING and sample < 1.0 and random.random() >= sample:
+            return False
+        per_second = settings.get("per_second", DEFAULT_PER_SECOND)
+        now = time.monotonic()
+        key = (record.name, record.msg)
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            if len(self.buckets) >= EVENT_LIMIT:
+                self.buckets.clear()
+            bucket = self.buckets[key] = [per_second, now, 0]
+        bucket[0] = min(per_second, bucket[0] + (now - bucket[1]) * per_second)
+        bucket[1] = now
+        if bucket[0] < 1:
+            bucket[2] += 1
+            return False
+        bucket[0] -= 1
+        record.suppressed = bucket[2]
+        bucket[2] = 0
+        return True
+
+class DroppingQueueHandler(QueueHandler):
+    """
+    Hands records to the writer thread, dropping them if it has fallen too far behind.
+    """
+
+    def __init__(self, records: queue.Queue):
+        super().__init__(records)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Tracebacks hold frames that may change or go by the time the writer gets to them,
+        # so are formatted here, but the rest of the JSON is left to the writer thread
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exception = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+def setup_logging(levels: dict, sampling: dict) -> QueueListener:
+    """
+    Send every log record through a sampling filter and a queue to a thread writing JSON lines to stdout.
+
+    Parameters
+    ----------
+    levels : dict
+        Logger name -> level name, "" being the root logger, eg. {"": "INFO", "linkhandlers": "DEBUG"}.
+
+    sampling : dict
+        Event name -> {"sample": fraction kept, "per_second": records a second}.
+
+    Returns
+    -------
+    QueueListener
+        The writer, to stop on shutdown so records still queued are written.
+    """
+    records = queue.Queue(QUEUE_LIMIT)
+    handler = DroppingQueueHandler(records)
+    handler.addFilter(SamplingFilter(sampling))
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(JsonFormatter())
+    root = logging.getLogger()
+    root.handlers = [handler]
+    for name, level in levels.items():
+        logging.getLogger(name or None).setLevel(level)
+    listener = QueueListener(records, output, respect_handler_level=True)
+    listener.start()
+    return listener
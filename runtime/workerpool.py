@@ -0,0 +1,290 @@
+import asyncio
+import itertools
+import logging
+import multiprocessing
+import threading
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from linkhandlers.httpclient import HttpClient
+from linkhandlers.instagramlink import InstagramLink
+from linkhandlers.linkpipeline import LinkPipeline
+from linkhandlers.pinterestlink import PinterestLink
+from linkhandlers.tiktoklink import TiktokLink
+from linkhandlers.twitterlink import TwitterLink
+from runtime.structuredlog import log_event, setup_logging
+
+# Messages each worker process fixes at once, mostly waiting on link resolution
+WORKER_CONCURRENCY = 16
+# Seconds the gateway waits on a worker before giving up on a message, well past the resolve deadline
+RESULT_TIMEOUT = 30
+
+log = logging.getLogger(__name__)
+
+class MessageRecord(NamedTuple):
+    """
+    What a worker needs to know about a message, small enough to send between processes cheaply.
+    """
+    id: int
+    channel_id: int
+    guild_id: int
+    author_id: int
+    content: str
+
+class StageTimings:
+    """
+    Stands in for Metrics in a worker process, keeping what its LinkPipeline observes to send to the gateway.
+
+    Observations go back with whichever result is sent next, which may be for
+    another message, as they only need adding up on the gateway.
+    """
+
+    def __init__(self):
+        # (histogram name, seconds, label values) not yet sent
+        self.observed = []
+
+    def histogram(self, name: str, description: str, labels: Tuple[str, ...] = ()) -> "StageHistogram":
+        return StageHistogram(self.observed, name)
+
+    def take(self) -> List[Tuple[str, float, tuple]]:
+        """
+        Get the observations not yet sent, and forget them.
+        """
+        observed = self.observed[:]
+        self.observed.clear()
+        return observed
+
+class StageHistogram:
+    """
+    A histogram of a worker's LinkPipeline, observed into its StageTimings.
+    """
+
+    def __init__(self, observed: list, name: str):
+        self.observed = observed
+        self.name = name
+
+    def observe(self, seconds: float, *label_values):
+        self.observed.append((self.name, seconds, label_values))
+
+def record_of(message) -> MessageRecord:
+    """
+    Get the record of a discord.Message to send to a worker.
+
+    Parameters
+    ----------
+    message : discord.Message
+        The message.
+
+    Returns
+    -------
+    MessageRecord
+        The message's record.
+    """
+    return MessageRecord(message.id, message.channel.id, message.guild.id if message.guild else 0,
+                         message.author.id, message.content)
+
+class WorkerPool:
+    """
+    Worker processes that fix links for the process connected to the gateway.
+
+    The gateway process sends the records of messages with links over a shared
+    queue, and whichever worker has room takes the next one, runs it through a
+    LinkPipeline with its own link handlers, caches and HTTP client, and sends
+    back the fixed links and the links fixed per platform. Replying, and adding
+    the counts to LinkLogger, stays with the gateway process, so stats are kept
+    in one place however many workers there are. How long the workers took
+    matching and resolving comes back with the results too, and is recorded
+    in the histograms the gateway's own LinkPipeline registers.
+    """
+
+    def __init__(self, processes=2, log_levels=None, log_sampling=None, metrics=None):
+        """
+        Parameters
+        ----------
+        processes : int
+            Worker processes to start.
+
+        log_levels : dict or None
+            Logger name -> level for the workers, as given to setup_logging, or None to leave logging as it is.
+
+        log_sampling : dict or None
+            Event name -> sampling and rate limit for the workers, as given to setup_logging.
+
+        metrics : Metrics or None
+            Where to record how long the workers' pipelines take, if anywhere.
+        """
+        self.count = processes
+        self.log_levels = log_levels
+        self.log_sampling = log_sampling or {}
+        self.metrics = metrics
+        self.processes = []
+        self.inbox = None
+        self.outbox = None
+        self.reader = None
+        self.loop = None
+        self.sequence = itertools.count()
+        # Sequence number -> future of a record sent to a worker
+        self.waiting = {}
+        self.submitted = 0
+        self.completed = 0
+        self.timed_out = 0
+
+    def start(self):
+        """
+        Start the worker processes, and a thread taking their results back to the event loop.
+        """
+        # Spawned rather than forked, so workers don't inherit the bot's event loop and connections
+        context = multiprocessing.get_context("spawn")
+        self.inbox = context.Queue()
+        self.outbox = context.Queue()
+        self.loop = asyncio.get_running_loop()
+        self.processes = [context.Process(target=run_worker,
+                                           args=(self.inbox, self.outbox, self.log_levels, self.log_sampling),
+                                           daemon=True)
+                          for _ in range(self.count)]
+        for process in self.processes:
+            process.start()
+        self.reader = threading.Thread(target=self.read, daemon=True)
+        self.reader.start()
+
+    async def stop(self):
+        """
+        Let the workers finish the messages they have, then stop them, failing anything still waiting.
+        """
+        if self.inbox is None:
+            return
+        for _ in self.processes:
+            self.inbox.put(None)
+        # Waiting on the processes blocks, and would hold up the gateway heartbeat if done on the loop
+        await asyncio.get_running_loop().run_in_executor(None, self.shut_down)
+        for future in self.waiting.values():
+            future.cancel()
+        self.waiting.clear()
+
+    def shut_down(self):
+        """
+        Wait for the workers to exit, then the reader thread, then close the queues. Blocking.
+        """
+        for process in self.processes:
+            process.join(RESULT_TIMEOUT)
+            if process.is_alive():
+                process.terminate()
+                process.join()
+        self.processes = []
+        # Results the workers sent before exiting are ahead of this in the queue, so still reach the loop
+        self.outbox.put(None)
+        self.reader.join()
+        for records in (self.inbox, self.outbox):
+            records.close()
+            records.join_thread()
+        self.inbox = None
+        self.outbox = None
+        self.reader = None
+
+    async def fix(self, record: MessageRecord) -> Optional[Tuple[str, Dict[str, int]]]:
+        """
+        Have a worker fix the links in a message.
+
+        Parameters
+        ----------
+        record : MessageRecord
+            The message's record.
+
+        Returns
+        -------
+        Tuple[str, Dict[str, int]] or None
+            As returned by LinkPipeline.fix, or None if no worker answered in time.
+        """
+        sequence = next(self.sequence)
+        future = self.loop.create_future()
+        self.waiting[sequence] = future
+        self.submitted += 1
+        self.inbox.put((sequence, record))
+        try:
+            return await asyncio.wait_for(future, RESULT_TIMEOUT)
+        except asyncio.TimeoutError:
+            self.timed_out += 1
+            return None
+        finally:
+            self.waiting.pop(sequence, None)
+
+    def read(self):
+        """
+        Hand results from the workers to the event loop. Runs on its own thread until stop.
+        """
+        while True:
+            item = self.outbox.get()
+            if item is None:
+                return
+            self.loop.call_soon_threadsafe(self.resolve, *item)
+
+    def resolve(self, sequence, result, timings):
+        self.completed += 1
+        if self.metrics is not None:
+            for name, seconds, label_values in timings:
+                # Already registered with their descriptions and labels by the gateway's LinkPipeline
+                self.metrics.histogram(name, "").observe(seconds, *label_values)
+        future = self.waiting.get(sequence)
+        if future is not None and not future.done():
+            future.set_result(result)
+
+    def alive(self) -> int:
+        """
+        Get how many worker processes are running.
+        """
+        return sum(process.is_alive() for process in self.processes)
+
+def run_worker(inbox, outbox, log_levels=None, log_sampling=None):
+    """
+    Fix links in records from the gateway process until told to stop. The entry point of each worker process.
+
+    Parameters
+    ----------
+    inbox : multiprocessing.Queue
+        (sequence number, MessageRecord) pairs, then None to stop.
+
+    outbox : multiprocessing.Queue
+        (sequence number, result of LinkPipeline.fix, stage timings) triples.
+
+    log_levels : dict or None
+        Logger name -> level, or None to leave logging as it is.
+
+    log_sampling : dict or None
+        Event name -> sampling and rate limit.
+    """
+    # Spawned processes start with logging unconfigured
+    listener = setup_logging(log_levels, log_sampling or {}) if log_levels is not None else None
+    try:
+        asyncio.run(serve(inbox, outbox))
+    finally:
+        if listener is not None:
+            listener.stop()
+
+async def serve(inbox, outbox):
+    client = HttpClient()
+    timings = StageTimings()
+    pipeline = LinkPipeline([TwitterLink(), InstagramLink(), TiktokLink(), PinterestLink()], client, timings)
+    loop = asyncio.get_running_loop()
+    # Only taking a record with room to work on it leaves the rest for idle workers
+    room = asyncio.Semaphore(WORKER_CONCURRENCY)
+    tasks = set()
+
+    async def handle(sequence, record):
+        result = None
+        try:
+            result = await pipeline.fix(record.content)
+        except Exception:
+            log_event(log, logging.ERROR, "worker_fix_failed", exc_info=True, message_id=record.id)
+        finally:
+            room.release()
+            outbox.put((sequence, result, timings.take()))
+
+    while True:
+        await room.acquire()
+        item = await loop.run_in_executor(None, inbox.get)
+        if item is None:
+            break
+        task = asyncio.create_task(handle(*item))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+    await asyncio.gather(*tasks)
+    await client.close()